@@ -0,0 +1 @@
+"""Performance benchmarks for PyRhO (run with airspeed velocity: ``asv run``)."""
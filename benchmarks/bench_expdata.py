@@ -0,0 +1,40 @@
+"""Benchmarks for constructing and processing photocurrents."""
+
+import numpy as np
+
+from pyrho import config
+from pyrho.expdata import PhotoCurrent
+
+
+def _gen_current(Dt_total, dt):
+    t = np.arange(0, Dt_total+dt, dt)
+    I = np.where((t >= 100) & (t < Dt_total-100),
+                 -0.5 - 0.5*np.exp(-(t-100)/5), 0.)
+    I += 0.01 * np.random.RandomState(0).randn(len(t))
+    return I, t
+
+
+class TimePhotoCurrent:
+    """Time ``PhotoCurrent`` construction (including feature extraction)."""
+
+    params = [0.1, 0.01, 0.001]
+    param_names = ['dt']
+
+    def setup(self, dt):
+        config.verbose = 0
+        self.I, self.t = _gen_current(1000, dt)
+        self.pulses = [[100, 900]]
+
+    def time_construct(self, dt):
+        PhotoCurrent(self.I, self.t, self.pulses, 1e17, -70)
+
+    def peakmem_construct(self, dt):
+        PhotoCurrent(self.I, self.t, self.pulses, 1e17, -70)
+
+    def time_filter_mean(self, dt):
+        PC = PhotoCurrent(self.I, self.t, self.pulses, 1e17, -70)
+        PC.filterData(t_window=1)
+
+    def time_decimate(self, dt):
+        PC = PhotoCurrent(self.I, self.t, self.pulses, 1e17, -70)
+        PC.decimate(10)
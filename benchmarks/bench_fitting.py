@@ -0,0 +1,26 @@
+"""Benchmarks for fitting models to the bundled ChR2 data set."""
+
+from pyrho import config
+from pyrho.datasets import loadChR2
+from pyrho.fitting import fitModels
+
+
+class TimeFitModels:
+    """Time ``fitModels`` on ``loadChR2()``."""
+
+    params = ['3', '4', '6']
+    param_names = ['nStates']
+    timeout = 1800
+    number = 1
+    repeat = 1
+    warmup_time = 0
+
+    def setup(self, nStates):
+        config.verbose = 0
+        self.data = loadChR2()
+
+    def time_fit_models(self, nStates):
+        fitModels(self.data, nStates=nStates, plot=False)
+
+    def peakmem_fit_models(self, nStates):
+        fitModels(self.data, nStates=nStates, plot=False)
@@ -0,0 +1,102 @@
+"""Benchmarks for running the protocols on each model with simPython, for
+square pulse trains with simBrian and for batches with every simulator."""
+
+import numpy as np
+
+from pyrho import config
+from pyrho.parameters import modelUnits
+from pyrho.models import models
+from pyrho.protocols import protocols
+from pyrho.simulators import simulators
+
+
+class TimeSimPython:
+    """Time ``simPython.run`` for every protocol and model."""
+
+    params = (list(protocols), ['3', '4', '6'])
+    param_names = ['protocol', 'model']
+    timeout = 300
+    number = 1
+    repeat = (1, 5, 60.0)
+
+    def setup(self, protocol, model):
+        config.verbose = 0
+        self.RhO = models[model]()
+        self.Prot = protocols[protocol](saveData=False)
+        self.Sim = simulators['Python'](self.Prot, self.RhO)
+
+    def time_run(self, protocol, model):
+        self.Sim.run(verbose=0)
+
+    def peakmem_run(self, protocol, model):
+        self.Sim.run(verbose=0)
+
+
+class TimeBrianPulseTrain:
+    """Time a square pulse train with simBrian with a single run (``runTrial``)
+    or a run per phase (``runTrialPhases``)."""
+
+    params = ([10, 100], ['runTrial', 'runTrialPhases'])
+    param_names = ['nPulses', 'method']
+    timeout = 600
+    number = 1
+    repeat = (1, 3, 60.0)
+
+    def setup(self, nPulses, method):
+        import brian2.only as br
+        config.verbose = 0
+        self.RhO = models['6']()
+        self.Prot = protocols['step'](saveData=False)
+        G = br.NeuronGroup(1, self.RhO.brian + 'v : volt\n', method='rk2', name='Inputs')
+        G.v = -70 * modelUnits['v']
+        monitors = {'states': br.StateMonitor(G, self.RhO.brianStateVars, record=[0]),
+                    'V': br.StateMonitor(G, 'v', record=[0])}
+        net = br.Network(G, *monitors.values())
+        self.Sim = simulators['Brian'](self.Prot, self.RhO, network=net,
+                                      netParams={}, monitors=monitors)
+        self.Sim.prepare(self.Prot)
+        self.cycles = np.array([[5., 15.]] * nPulses)
+        self.run(method)  # Exclude code generation
+
+    def run(self, method):
+        self.Sim.initialise()
+        getattr(self.Sim, method)(self.RhO, 1e17, -70, 25., self.cycles,
+                                  self.Sim.dt, verbose=0)
+
+    def time_trial(self, nPulses, method):
+        self.run(method)
+
+
+class TimeBackends:
+    """Time ``runBatch`` of every protocol with each simulator (and the error
+    of its photocurrents relative to ``simPython.run``)."""
+
+    params = (list(protocols), list(simulators))
+    param_names = ['protocol', 'simulator']
+    timeout = 600
+    number = 1
+    repeat = (1, 3, 60.0)
+
+    def setup(self, protocol, simulator):
+        from pyrho.simulators import simAvailable
+        if not (simAvailable[simulator] and simulators[simulator].supports('batch')):
+            raise NotImplementedError  # Skip unavailable simulators
+        config.verbose = 0
+        self.RhO = models['6']()
+        self.Prot = protocols[protocol](saveData=False)
+        kwargs = {'netParams': None} if simulator == 'Brian' else {}
+        self.Sim = simulators[simulator](self.Prot, self.RhO, **kwargs)
+        self.Sim.runBatch(verbose=0)  # Exclude code generation and compilation
+
+    def time_batch(self, protocol, simulator):
+        self.Sim.runBatch(verbose=0)
+
+    def track_error(self, protocol, simulator):
+        reference = protocols[protocol](saveData=False)
+        simulators['Python'](reference, self.RhO).run(verbose=0)
+        PD = self.Sim.runBatch(verbose=0)
+        return max(np.abs(PD.trials[r][p][v].I - pc.I).max() / np.abs(pc.I).max()
+                   for r, runs in enumerate(reference.PD.trials)
+                   for p, phis in enumerate(runs)
+                   for v, pc in enumerate(phis))
+    track_error.unit = 'relative'
@@ -0,0 +1,35 @@
+"""Benchmarks for data persistence and importing the package."""
+
+import shutil
+import tempfile
+
+from pyrho import config
+from pyrho.datasets import loadChR2
+from pyrho.utilities import saveData, loadData
+
+
+class TimeSaveLoadData:
+    """Time pickling and unpickling the ChR2 data set."""
+
+    def setup(self):
+        config.verbose = 0
+        self.path = tempfile.mkdtemp()
+        self.data = loadChR2()
+        saveData(self.data, 'ChR2', path=self.path)
+
+    def teardown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def time_save_data(self):
+        saveData(self.data, 'ChR2_save', path=self.path)
+
+    def time_load_data(self):
+        loadData('ChR2', path=self.path)
+
+    def peakmem_load_data(self):
+        loadData('ChR2', path=self.path)
+
+
+def timeraw_import_pyrho():
+    """Time ``import pyrho`` in a fresh interpreter."""
+    return "import pyrho"
@@ -6,6 +6,7 @@ NEURON  {
     RANGE i, E, v0, v1, g0      :, fphi, fv
     RANGE k_a, k_r, Gd, Gr0, p, q
     RANGE phi, phi_m
+    THREADSAFE  : Allow multithreaded integration (ParallelContext.nthread)
 }
 
 
@@ -6,6 +6,7 @@ NEURON {
     RANGE i, E, gam, v0, v1, g0 :, fphi, fv
     RANGE k1, k2, k_f, k_b, Gf0, Gb0, Gd1, Gd2, Gr0, p, q
     RANGE phi, phi_m :, lambda
+    THREADSAFE  : Allow multithreaded integration (ParallelContext.nthread)
 }
 
 
@@ -7,6 +7,7 @@ NEURON {
     RANGE i, E, gam, v0, v1, g0 :, fphi, fv, i
     RANGE k1, Go1, Gf0, k_f, Gd2, Gr0, Gd1, Gb0, k_b, Go2, k2, p, q
     RANGE phi, phi_m :, lambda
+    THREADSAFE  : Allow multithreaded integration (ParallelContext.nthread)
 }
 
 
@@ -22,11 +22,13 @@ from pyrho.config import *
 from pyrho.config import _DASH_LINE, _DOUB_DASH_LINE
 from pyrho.expdata import *
 from pyrho.fitting import *
+from pyrho.light import *
 from pyrho.models import *
 from pyrho.parameters import *
 from pyrho.protocols import *
 from pyrho.simulators import *
 from pyrho.utilities import *
+from pyrho.waveforms import *
 
 # from pyrho.jupytergui import *
 
@@ -104,7 +106,8 @@ def run(mods='6', prots='step', sims='Python', plot=True):
 
     sims : str, list
         List of strings of the names of simulators to use (default: 'Python').
-        e.g. 'Brian', ['Python', 'NEURON'].
+        e.g. 'Brian', ['Python', 'NEURON'] or 'auto' to run each protocol
+        as a batch with the cheapest capable simulator (see ``selectSimulator``).
     """
 
     if not isinstance(mods, (list, tuple)):
@@ -120,16 +123,26 @@ def run(mods='6', prots='step', sims='Python', plot=True):
         assert isinstance(sims, str)
         sims = [sims]
 
-    results = {simulator: {protocol: {} for protocol in prots} for simulator in sims}
+    auto = sims == ['auto']
+    results = {simulator: {protocol: {} for protocol in prots}
+               for simulator in ([] if auto else sims)}
     for model in mods:
         rho = models[model]()  # Select generative model
+        session = NEURONsession()  # Reuse the NEURON cell across protocols
         for protocol in prots:
             pro = protocols[protocol]()  # Select simulation protocol
-            for simulator in sims:
-                sim = simulators[simulator](pro, rho)
+            for simulator in ([selectSimulator(pro, rho, requires=['batch'])] if auto else sims):
+                results.setdefault(simulator, {protocol: {} for protocol in prots})
+                if simulator == 'NEURON':
+                    sim = simulators[simulator](pro, rho, session=session)
+                else:
+                    sim = simulators[simulator](pro, rho)
                 print(f"\nUsing {simulator} to run Protocol '{protocol}' on the {model}-state model...")
                 print(_DASH_LINE, '\n')
-                results[simulator][protocol][model] = sim.run()
+                if auto:
+                    results[simulator][protocol][model] = sim.runBatch()
+                else:
+                    results[simulator][protocol][model] = sim.run()
                 if plot:
                     sim.plot()
                 print("\nFinished!")
@@ -1,5 +1,6 @@
 """General configuration variables and functions"""
 
+import hashlib
 import importlib
 import logging
 import os
@@ -9,6 +10,7 @@ import platform
 import shutil
 import subprocess
 import sys
+import tempfile
 import time
 import warnings
 
@@ -19,7 +21,8 @@ import numpy as np
 #from pyrho.__init__ import printVersions
 
 __all__ = ['setupGUI', 'simAvailable', 'setupNEURON', 'setupBrian', 'check_package',
-           'setFigOutput', 'setFigStyle', 'resetPlot']
+           'setFigOutput', 'setFigStyle', 'resetPlot', 'compileMechanisms',
+           'loadMechanisms']
 # 'wall_time',
 # TODO: Place in dict i.e. CONFIG_PARAMS['dDir'] or class with setter methods e.g. to call set_output
 #, 'colours', 'styles', 'verbose', 'dDir', 'fDir', 'DASH_LINE', 'DOUB_DASH_LINE'
@@ -55,6 +58,9 @@ NMODLfiles = ('RhO3c.mod', 'RhO4c.mod', 'RhO6c.mod')  # ['RhO3.mod', 'RhO4.mod',
 HOCfiles = [h for h in os.listdir(pyrhoNEURONpath) if h.endswith('.hoc')]
 #NMODLfilesIncPath = [os.path.join(pyrhoNEURONpath, f) for f in NMODLfiles]
 NEURONinstallScript = 'install_neuron.sh'
+# Compiled mechanisms and Brian projects are cached here (override with 'PYRHO_CACHE')
+cacheDir = os.environ.get('PYRHO_CACHE',
+                          os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(home, '.cache')), 'pyrho'))
 
 
 # Set data and figure directories to defaults
@@ -253,6 +259,99 @@ def setupNEURON(path=None):  # , NEURONpath=None):
     return
 
 
+def mechanismHash(modFiles=None):
+    """
+    Hash of the NMODL sources, NEURON version and architecture.
+
+    Parameters
+    ----------
+    modFiles : list(str), optional
+        Paths of the mod files (default: PyRhO's bundled mechanisms).
+
+    Returns
+    -------
+    str
+        Hexadecimal digest identifying the compiled mechanisms.
+    """
+    if modFiles is None:
+        modFiles = [os.path.join(pyrhoNEURONpath, f) for f in NMODLfiles]
+    try:
+        import neuron
+        nrnVersion = neuron.__version__
+    except ImportError:
+        nrnVersion = None
+    digest = hashlib.sha256()
+    digest.update(f'{nrnVersion}|{platform.machine()}|{platform.system()}'.encode())
+    for f in sorted(modFiles, key=os.path.basename):
+        digest.update(os.path.basename(f).encode())
+        with open(f, 'rb') as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()
+
+
+def compileMechanisms(modFiles=None, path=None, force=False):
+    """
+    Compile NMODL mechanisms into a cache keyed by their content.
+
+    The mechanisms are only compiled (with ``nrnivmodl``) if the mod files
+    or NEURON version have changed since they were last cached, so workers
+    sharing a cache directory start with the mechanisms already built.
+
+    Parameters
+    ----------
+    modFiles : list(str), optional
+        Paths of the mod files (default: PyRhO's bundled mechanisms).
+    path : str, optional
+        Cache directory (default: ``cacheDir``).
+    force : bool
+        Recompile even if the mechanisms are cached.
+
+    Returns
+    -------
+    str
+        Directory of the compiled mechanisms (for ``neuron.load_mechanisms``).
+    """
+    if modFiles is None:
+        modFiles = [os.path.join(pyrhoNEURONpath, f) for f in NMODLfiles]
+    path = os.path.join(os.path.expanduser(path or cacheDir), 'nrnmech')
+    target = os.path.join(path, mechanismHash(modFiles)[:16])
+    if os.path.isfile(os.path.join(target, 'complete')) and not force:
+        return target
+
+    nrnivmodl = shutil.which('nrnivmodl')
+    if nrnivmodl is None:
+        raise RuntimeError("'nrnivmodl' was not found - please check the NEURON installation!")
+    os.makedirs(path, exist_ok=True)
+    build = tempfile.mkdtemp(dir=path)  # Build separately in case of concurrent workers
+    try:
+        for f in modFiles:
+            shutil.copy2(f, build)
+        if verbose > 0:
+            print(f'Compiling mod files in {build} with {nrnivmodl}')
+        result = subprocess.run([nrnivmodl], cwd=build, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f'NMODL compilation failed:\n{result.stderr}')
+        open(os.path.join(build, 'complete'), 'w').close()
+        if force and os.path.isdir(target):
+            shutil.rmtree(target)
+        try:
+            os.rename(build, target)
+        except OSError:  # Another worker finished first
+            if not os.path.isfile(os.path.join(target, 'complete')):
+                raise
+    finally:
+        shutil.rmtree(build, ignore_errors=True)
+    return target
+
+
+def loadMechanisms(modFiles=None, path=None):
+    """Load (compiling if necessary) cached NMODL mechanisms into NEURON."""
+    import neuron
+    mechPath = compileMechanisms(modFiles, path)
+    neuron.load_mechanisms(mechPath)
+    return mechPath
+
+
 def checkBrian(test=False):
     """Check for the Brian2 simulator"""
     try:
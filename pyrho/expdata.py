@@ -5,6 +5,8 @@ import logging
 import copy
 
 import numpy as np
+from scipy.signal import butter, sosfiltfilt, resample_poly
+from scipy.integrate import trapezoid
 # import scipy.io as sio # Use for Matlab files < v7.3
 # import h5py
 import matplotlib as mpl
@@ -51,6 +53,78 @@ logger = logging.getLogger(__name__)
 #    return data
 
 
+def _runningMean(x, nPoints):
+    """Moving average of ``x`` along its last axis in O(N) via cumulative
+    sums. Equivalent to ``np.convolve(x, np.ones(nPoints)/nPoints, mode='same')``
+    for each row.
+    """
+    if nPoints <= 1:
+        return np.array(x, dtype=float)
+    x = np.asarray(x, dtype=float)
+    pad = [(0, 0)] * (x.ndim - 1) + [(nPoints//2, (nPoints-1)//2)]
+    cs = np.cumsum(np.pad(x, pad, mode='constant'), axis=-1)
+    cs = np.concatenate((np.zeros(x.shape[:-1] + (1,)), cs), axis=-1)
+    return (cs[..., nPoints:] - cs[..., :-nPoints]) / nPoints
+
+
+def _isUniform(t):
+    """Return ``True`` if the time array ``t`` has (approximately) constant steps."""
+    tdiff = np.diff(t)
+    return len(tdiff) == 0 or bool(np.allclose(tdiff, tdiff.mean(), rtol=1e-3, atol=0))
+
+
+def _timeMean(x, t):
+    """Time-weighted (trapezoidal) mean of ``x`` sampled at times ``t``."""
+    if len(t) < 2 or t[-1] == t[0]:
+        return np.mean(x)
+    return trapezoid(x, t) / (t[-1] - t[0])
+
+
+def _filterArray(I, dt, method='mean', t_window=1, f_cutoff=None, order=4):
+    """Low-pass filter (a stack of) photocurrent arrays along the last axis.
+
+    Parameters
+    ----------
+    I : ndarray(float)
+        Photocurrent array of shape nSamples or nTrials x nSamples.
+    dt : float
+        Sampling time step [ms].
+    method : str, {'mean', 'fft', 'sos'}
+        'mean': Moving average over ``t_window``.
+        'fft': Ideal low-pass filter removing frequencies above ``f_cutoff``.
+        'sos': Zero-phase Butterworth filter of ``order`` in second-order
+        sections with corner frequency ``f_cutoff``.
+    t_window : float
+        Time window [ms] over which to calculate the moving average.
+    f_cutoff : float
+        Cut-off frequency [Hz] for the 'fft' and 'sos' methods.
+    order : int
+        Order of the Butterworth filter for the 'sos' method.
+
+    Returns
+    -------
+    ndarray(float)
+        Filtered array with the same shape as ``I``.
+    """
+    sr = 1000 / dt  # Sampling rate [samples/s]
+    if method == 'mean':
+        nPoints = int(round(t_window/dt))
+        return _runningMean(I, nPoints)
+    if f_cutoff is None or not 0 < f_cutoff < sr/2:
+        raise ValueError("f_cutoff must be between 0 and the Nyquist frequency "
+                         "({} Hz)!".format(sr/2))
+    if method == 'fft':
+        nSamples = np.shape(I)[-1]
+        spectrum = np.fft.rfft(I, axis=-1)
+        spectrum[..., np.fft.rfftfreq(nSamples, d=dt/1000) > f_cutoff] = 0
+        return np.fft.irfft(spectrum, n=nSamples, axis=-1)
+    elif method == 'sos':
+        sos = butter(order, f_cutoff, btype='low', fs=sr, output='sos')
+        return sosfiltfilt(sos, I, axis=-1)
+    else:
+        raise NotImplementedError(method)
+
+
 class PhotoCurrent(object):
     """
     Data storage class for an individual Photocurrent and associated properties
@@ -76,6 +150,11 @@ class PhotoCurrent(object):
         (shape=nStates x nSamples).
     stateLabels : list(str) or ``None``, optional
         Optional list of LaTeX strings labelling each of the state variables.
+    uniform : bool
+        Whether ``t`` is uniformly sampled. Features (steady-states and the
+        offset calibration) of non-uniformly sampled photocurrents are
+        calculated over time rather than sample windows; filtering requires
+        resampling first (see :meth:`resample`).
     """
     #pulses : list(list(float))
 
@@ -126,7 +205,6 @@ class PhotoCurrent(object):
     _idx_pulses_   # Indexes for the start of each on- and off-phases  HIDE
     isFiltered  # Data hase been filtered               HIDE
     _I_orig       # Original photocurrent (unfiltered)    HIDE __I_orig_
-    _I_prev       # Previous photocurrent                 HIDE __I_prev_
     _offset_     # Current offset calculated to zero dark current    HIDE
     on_         # Current at t_on[:]        REMOVE
     off_        # Current at t_off[:]       REMOVE
@@ -162,11 +240,13 @@ class PhotoCurrent(object):
             tdiff = self.t[1:] - self.t[:-1]
             self.dt = tdiff.sum()/len(tdiff)    # (Average) step size
             self.sr = 1000/(self.dt)            # Sampling rate [samples/s]
+            self.uniform = _isUniform(self.t)
         elif not isinstance(t, (list, np.ndarray)) or len(t) == 1:                       # Assume time step is passed rather than time array
             assert t > 0
             self.dt = t                         # Step size
             self.t = np.arange(self.nSamples) * self.dt
             self.sr = 1000 / self.dt            # Sampling rate [samples/s]
+            self.uniform = True
         else:
             raise ValueError("Dimension mismatch: |t|={}; |I|={}. t must be either an array of the same length as I or a scalar defining the timestep!".format(len(t), len(I)))
 
@@ -177,7 +257,10 @@ class PhotoCurrent(object):
         if stimuli is not None:
             # TODO: Remove stimuli and make it equivalent to t i.e. float or array
             # Expect nStimuli x nSamples row vectors
-            self.stimuli = np.copy(stimuli)
+            if isinstance(stimuli, np.ndarray) and not stimuli.flags.writeable:
+                self.stimuli = stimuli  # Share read-only (cached) arrays
+            else:
+                self.stimuli = np.copy(stimuli)
             ndim = self.stimuli.ndim
             shape = self.stimuli.shape
             if ndim == 1:
@@ -253,12 +336,15 @@ class PhotoCurrent(object):
 
         self.isFiltered = False
         self._I_orig = None
-        self._I_prev = None
         #self.filterData()              # Smooth the data with a moving average
 
         ### Calibrate - correct any current offset in experimental recordings
-        Idel, _ = self.getDelayPhase()
-        I_offset = np.mean(Idel[:int(round(0.9*len(Idel)))+1])  # Calculate the mean over the first 90% to avoid edge effects
+        Idel, tdel = self.getDelayPhase()
+        if _isUniform(tdel):
+            I_offset = np.mean(Idel[:int(round(0.9*len(Idel)))+1])  # Calculate the mean over the first 90% to avoid edge effects
+        else:
+            cutInd = np.searchsorted(tdel, tdel[0] + 0.9*(tdel[-1]-tdel[0]), side='right')
+            I_offset = _timeMean(Idel[:cutInd], tdel[:cutInd])
         if abs(I_offset) > 0.01 * abs(max(self.I) - min(self.I)):  # Recalibrate if the offset is more than 1% of the span
             self.I -= I_offset
             if config.verbose > 0:
@@ -279,6 +365,22 @@ class PhotoCurrent(object):
             #self.t_end = max(self.t)
 
         ### Derive properties from the data
+        self._findFeatures()
+
+        # Align t_0 to the start of the first pulse
+        self.pulseAligned = False
+        self.alignPoint = 0
+        self.p0 = None
+        #self.alignToPulse()
+        self.align_to(self.pulses[0, 0])
+
+        #self.findKinetics()
+
+        if config.verbose > 1:
+            print("Photocurrent data loaded! nPulses={}; Total time={}ms; Range={}nA".format(self.nPulses, self.Dt_total, str(self.I_range_)))
+
+    def _findFeatures(self):
+        """Derive the current features (peaks, steady-states etc.) from I."""
         self.on_ = np.array([self.I[pInd[0]] for pInd in self._idx_pulses_])     # Current at t_on[:]
         self.off_ = np.array([self.I[pInd[1]] for pInd in self._idx_pulses_])    # Current at t_off[:]
 
@@ -315,18 +417,6 @@ class PhotoCurrent(object):
         else:
             self.type = 'inhibitory'  # Hyperpolarising
 
-        # Align t_0 to the start of the first pulse
-        self.pulseAligned = False
-        self.alignPoint = 0
-        self.p0 = None
-        #self.alignToPulse()
-        self.align_to(self.pulses[0, 0])
-
-        #self.findKinetics()
-
-        if config.verbose > 1:
-            print("Photocurrent data loaded! nPulses={}; Total time={}ms; Range={}nA".format(self.nPulses, self.Dt_total, str(self.I_range_)))
-
     def __len__(self):
         return self.Dt_total
 
@@ -779,7 +869,12 @@ class PhotoCurrent(object):
         Ion, ton = self.getOnPhase(pulse)
 
         # Calculate step change (or gradient with t[1:] - t[:-1])
-        cutInd = max(2, int(round(tail*len(Ion)))) # Need at least 2 points to calculate the difference
+        uniform = _isUniform(ton)
+        if uniform:
+            cutInd = max(2, int(round(tail*len(Ion)))) # Need at least 2 points to calculate the difference
+        else:  # Take the tail proportion of the on-phase duration
+            t_cut = ton[-1] - tail*(ton[-1] - ton[0])
+            cutInd = max(2, len(ton) - np.searchsorted(ton, t_cut, side='left'))
         if cutInd < 5: # On-phase is too short
             warnings.warn('Duration Warning: The on-phase is too short for '
                           'steady-state convergence!')
@@ -795,7 +890,10 @@ class PhotoCurrent(object):
 
         if method == 0: # Empirical: Calculate Steady-state as the mean of the last 5% of the On phase
 
-            Iss = np.mean(Ion[-cutInd:])
+            if uniform:
+                Iss = np.mean(Ion[-cutInd:])
+            else:
+                Iss = _timeMean(Ion[-cutInd:], ton[-cutInd:])
 
             # Calculate Steady-state as the mean of the last 50ms of the On phase
             #tFromOffInd = np.searchsorted(t,t[offInd]-window,side="left")
@@ -1279,22 +1377,114 @@ class PhotoCurrent(object):
             phi[t_ons[p]/tstep:t_offs[p]/tstep] = phiOn
     '''
 
-    def filterData(self, t_window=1):
-        """Pass frequency bands to filter out.
-        t_window := Time window [ms] over which to calculate the moving average
+    def filterData(self, t_window=1, method='mean', f_cutoff=None, order=4):
+        """Low-pass filter the photocurrent in place and update its features.
+
+        Repeated calls filter the previously filtered current. The unfiltered
+        current is kept in ``_I_orig``.
+
+        Parameters
+        ----------
+        t_window : float
+            Time window [ms] over which to calculate the moving average
+            (default=1).
+        method : str, {'mean', 'fft', 'sos'}
+            'mean': O(N) moving average over ``t_window`` (default).
+            'fft': Ideal low-pass filter removing frequencies above ``f_cutoff``.
+            'sos': Zero-phase Butterworth IIR filter (second-order sections).
+        f_cutoff : float, optional
+            Cut-off frequency [Hz] for the 'fft' and 'sos' methods.
+        order : int, optional
+            Order of the Butterworth filter (default=4).
         """
+        self._checkUniform()
+        self._setFiltered(_filterArray(self.I, self.dt, method, t_window,
+                                       f_cutoff, order))
+
+    def _checkUniform(self):
+        if not self.uniform:
+            raise ValueError('The photocurrent is not uniformly sampled! '
+                             'Call resample() first.')
 
+    def _setFiltered(self, I):
+        """Replace the photocurrent with a filtered version of it."""
         if not self.isFiltered:
-            self._I_orig = np.copy(self.I)  # TODO: Put in __init__
+            self._I_orig = self.I
             self.isFiltered = True
-            I = self._I_orig
-        else:
-            self._I_prev = np.copy(self.I)
-            I = self._I_prev
+        self.I = I
+        self._findFeatures()
+
+    def decimate(self, factor):
+        """Downsample the photocurrent by an integer factor.
+
+        The current is passed through a polyphase anti-aliasing filter while
+        any stimuli and states are subsampled.
+
+        Parameters
+        ----------
+        factor : int >= 1
+            Downsampling factor e.g. 10 reduces 100 kHz to 10 kHz.
+
+        Returns
+        -------
+        PhotoCurrent
+            A new PhotoCurrent object sampled at ``sr/factor``.
+        """
+        factor = int(factor)
+        assert factor >= 1
+        self._checkUniform()
+        I = resample_poly(self.I, 1, factor)
+        stimuli = None
+        if self.stimuli is not None:
+            stimuli = self.stimuli[..., ::factor]
+        states, stateLabels = None, None
+        if self.synthetic:
+            states = self.states[::factor]
+            stateLabels = self.stateLabels
+        PC = PhotoCurrent(I, self.t[::factor], self.pulses, self.phi, self.V,
+                          stimuli=stimuli, states=states,
+                          stateLabels=stateLabels, label=self.label)
+        PC.lam = self.lam
+        return PC
+
+    def resample(self, dt=None):
+        """Linearly interpolate the photocurrent onto a uniform time grid.
+
+        Parameters
+        ----------
+        dt : float, optional
+            Time step [ms] of the new grid. Defaults to the smallest step in
+            ``t``.
 
-        # Moving average
-        nPoints = int(round(t_window/self.dt))
-        self.I = np.convolve(I, np.ones(nPoints)/nPoints, mode='same')
+        Returns
+        -------
+        PhotoCurrent
+            A new uniformly sampled PhotoCurrent object.
+        """
+        if dt is None:
+            dt = np.min(np.diff(self.t))
+        nSamples = int(round(self.Dt_total/dt)) + 1
+        t = self.t_start + np.arange(nSamples) * dt
+        t[-1] = min(t[-1], self.t_end)
+
+        def interp(x):
+            return np.interp(t, self.t, x)
+
+        stimuli = None
+        if self.stimuli is not None:
+            if self.stimuli.ndim == 1:
+                stimuli = interp(self.stimuli)
+            else:
+                stimuli = np.array([interp(stim) for stim in self.stimuli])
+        states, stateLabels = None, None
+        if self.synthetic:
+            states = np.column_stack([interp(s) for s in self.states.T])
+            stateLabels = self.stateLabels
+        PC = PhotoCurrent(interp(self.I), t, self.pulses, self.phi, self.V,
+                          stimuli=stimuli, states=states,
+                          stateLabels=stateLabels, label=self.label)
+        PC.lam = self.lam
+        return PC
 
 
 class ProtocolData(object):
@@ -1522,6 +1712,40 @@ class ProtocolData(object):
 
         return trials
 
+    def filterData(self, t_window=1, method='mean', f_cutoff=None, order=4):
+        """Low-pass filter all photocurrents in place.
+
+        Trials with the same length and time step are stacked and filtered
+        together. See :meth:`PhotoCurrent.filterData` for the parameters.
+        """
+        groups = {}
+        for run in range(self.nRuns):
+            for iPhi in range(self.nPhis):
+                for iV in range(self.nVs):
+                    pc = self.trials[run][iPhi][iV]
+                    if pc:
+                        pc._checkUniform()
+                        key = (pc.nSamples, round(pc.dt, 12))
+                        groups.setdefault(key, []).append(pc)
+
+        for (nSamples, dt), pcs in groups.items():
+            Is = _filterArray(np.vstack([pc.I for pc in pcs]), dt, method,
+                              t_window, f_cutoff, order)
+            for pc, I in zip(pcs, Is):
+                pc._setFiltered(I)
+
+    def decimate(self, factor):
+        """Downsample all photocurrents by an integer factor.
+
+        See :meth:`PhotoCurrent.decimate`.
+        """
+        for run in range(self.nRuns):
+            for iPhi in range(self.nPhis):
+                for iV in range(self.nVs):
+                    pc = self.trials[run][iPhi][iV]
+                    if pc:
+                        self.trials[run][iPhi][iV] = pc.decimate(factor)
+
     # def _getVindex(self, V): ### Generalise!!!
         # Vs = list(copy.copy(self.Vs))
         # if V is None:
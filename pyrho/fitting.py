@@ -24,7 +24,7 @@ from pyrho.config import *  # verbose, saveFigFormat, addTitles, fDir, dDir, eqS
 from pyrho import config
 from pyrho.config import wall_time
 
-__all__ = ['fitModels', 'plotFluxSetFits', 'reportFit', 'methods', 'defMethod']
+__all__ = ['fitModels', 'plotFits', 'plotFluxSetFits', 'reportFit', 'methods', 'defMethod']
 # ['fitModel', 'copyParam', 'getRecoveryPeaks', 'fitRecovery', 'fitfV']
 logger = logging.getLogger(__name__)
 
@@ -394,7 +394,7 @@ def plotFit(PC, nStates, params, fitRates=False, index=None):
 
 
 
-def fit3states(fluxSet, run, vInd, params, method=defMethod, plot=False):  # , verbose=config.verbose):
+def fit3states(fluxSet, run, vInd, params, method=defMethod, plot=False, iterCallback=None):  # , verbose=config.verbose):
     """
     fluxSet := ProtocolData set (of Photocurrent objects) to fit
     run     := Index for the run within the ProtocolData set
@@ -505,7 +505,7 @@ def fit3states(fluxSet, run, vInd, params, method=defMethod, plot=False):  # , v
     def err3off(p, Ioffs, toffs):
         return np.r_[ [(Ioffs[i] - fit3off(p, toffs[i], i)) / Ioffs[i][0] for i in range(len(Ioffs))] ]
 
-    offPmin = minimize(err3off, iOffPs, args=(Ioffs,toffs), method=method)
+    offPmin = minimize(err3off, iOffPs, args=(Ioffs,toffs), method=method, iter_cb=iterCallback)
     pOffs = offPmin.params
 
     #def err3off(p,Ioffs,toffs,soffs):
@@ -552,7 +552,7 @@ def fit3states(fluxSet, run, vInd, params, method=defMethod, plot=False):  # , v
     def err3on(p, Ions, tons, RhO, phis, Vs):
         return np.r_[ [(Ions[i] - fit3on(p, tons[i], RhO, phis[i], Vs[i])) / Ions[i][-1] for i in range(len(Ions))] ]
 
-    onPmin = minimize(err3on, iOnPs, args=(Ions,tons,RhO,phis,Vs), method=method)
+    onPmin = minimize(err3on, iOnPs, args=(Ions,tons,RhO,phis,Vs), method=method, iter_cb=iterCallback)
     pOns = onPmin.params
 
     # if (Gr + Gd - 2*np.sqrt(Gr*Gd)) < Ga < (Gr + Gd + 2*np.sqrt(Gr*Gd)):
@@ -568,7 +568,7 @@ def fit3states(fluxSet, run, vInd, params, method=defMethod, plot=False):  # , v
 
 
 
-def fit4states(fluxSet, run, vInd, params, method=defMethod, plot=False):  #, verbose=config.verbose):
+def fit4states(fluxSet, run, vInd, params, method=defMethod, plot=False, iterCallback=None):  #, verbose=config.verbose):
     """
     fluxSet := ProtocolData set (of Photocurrent objects) to fit
     run     := Index for the run within the ProtocolData set
@@ -680,7 +680,7 @@ def fit4states(fluxSet, run, vInd, params, method=defMethod, plot=False):  #, ve
     ##fitfunc = lambda p, t: -(p['a0'].value + p['a1'].value*np.exp(-p['lam1'].value*t) + p['a2'].value*np.exp(-p['lam2'].value*t))
     #errfunc = lambda p, Ioff, toff: Ioff - fitfunc(p,toff)
 
-    offPmin = minimize(err4off, iOffPs, args=(Ioffs,toffs), method=method)#, fit_kws={'maxfun':100000})
+    offPmin = minimize(err4off, iOffPs, args=(Ioffs,toffs), method=method, iter_cb=iterCallback)#, fit_kws={'maxfun':100000})
     pOffs = offPmin.params
 
     reportFit(offPmin, "Off-phase fit report for the 4-state model", method)
@@ -714,7 +714,7 @@ def fit4states(fluxSet, run, vInd, params, method=defMethod, plot=False):  #, ve
     if config.verbose > 2:
         print('Optimising ',end='')
 
-    onPmin = minimize(errOnPhase, iOnPs, args=(Ions,tons,RhO,Vs,phis), method=method)
+    onPmin = minimize(errOnPhase, iOnPs, args=(Ions,tons,RhO,Vs,phis), method=method, iter_cb=iterCallback)
     pOns = onPmin.params
 
     reportFit(onPmin, "On-phase fit report for the 4-state model", method)
@@ -728,7 +728,7 @@ def fit4states(fluxSet, run, vInd, params, method=defMethod, plot=False):  #, ve
 
 
 
-def fit6states(fluxSet, quickSet, run, vInd, params, method=defMethod, plot=False):  # , verbose=config.verbose):
+def fit6states(fluxSet, quickSet, run, vInd, params, method=defMethod, plot=False, iterCallback=None):  # , verbose=config.verbose):
     """
     fluxSet := ProtocolData set (of Photocurrent objects) to fit
     quickSet:= ProtocolData set (of Photocurrent objects) with short pulses to fit opsin activation rates
@@ -848,7 +848,7 @@ def fit6states(fluxSet, quickSet, run, vInd, params, method=defMethod, plot=Fals
     ##fitfunc = lambda p, t: -(p['a0'].value + p['a1'].value*np.exp(-p['lam1'].value*t) + p['a2'].value*np.exp(-p['lam2'].value*t))
     #errfunc = lambda p, Ioff, toff: Ioff - fitfunc(p,toff)
 
-    offPmin = minimize(err6off, iOffPs, args=(Ioffs,toffs), method=method)  # , fit_kws={'maxfun':100000})
+    offPmin = minimize(err6off, iOffPs, args=(Ioffs,toffs), method=method, iter_cb=iterCallback)  # , fit_kws={'maxfun':100000})
     pOffs = offPmin.params
 
     reportFit(offPmin, "Off-phase fit report for the 6-state model", method)
@@ -953,7 +953,7 @@ def fit6states(fluxSet, quickSet, run, vInd, params, method=defMethod, plot=Fals
     if config.verbose > 2:
         print('Optimising ',end='')
 
-    onPmin = minimize(errOnPhase, iOnPs, args=(Ions,tons,RhO,Vs,phis), method=method)
+    onPmin = minimize(errOnPhase, iOnPs, args=(Ions,tons,RhO,Vs,phis), method=method, iter_cb=iterCallback)
     pOns = onPmin.params
 
     reportFit(onPmin, "On-phase fit report for the 6-state model", method)
@@ -1026,7 +1026,7 @@ def getRecoveryPeaks(recData, phiInd=None, vInd=None, usePeakTime=False):
     return t_peaks, I_peaks, Ipeak0, Iss0
 
 
-def fitRecovery(t_peaks, I_peaks, params, Ipeak0, Iss0, ax=None, method=defMethod, plot=False):  # , verbose=config.verbose):
+def fitRecovery(t_peaks, I_peaks, params, Ipeak0, Iss0, ax=None, method=defMethod, plot=False, iterCallback=None):  # , verbose=config.verbose):
 
     if not params['Gr0'].vary:
         print('Gr0 fixed at {}'.format(params['Gr0'].value))
@@ -1070,7 +1070,7 @@ def fitRecovery(t_peaks, I_peaks, params, Ipeak0, Iss0, ax=None, method=defMetho
 
     ### Shift is now handled in getRecoveryPeaks()
     #recMin = minimize(errExpRec, pRec, args=(t_peaks-shift, I_peaks), method=method)
-    recMin = minimize(errExpRec, iRecPs, args=(t_peaks, I_peaks), method=method)
+    recMin = minimize(errExpRec, iRecPs, args=(t_peaks, I_peaks), method=method, iter_cb=iterCallback)
     #recMin = minimize(errExpRec, pRec, args=(t_peaks-shift, I_peaks-Iss0), method=method)
 
     pRec = recMin.params
@@ -1085,7 +1085,7 @@ def fitRecovery(t_peaks, I_peaks, params, Ipeak0, Iss0, ax=None, method=defMetho
                 iRecPs[k].max = 1e15
 
         for meth in methods:
-            recMinAlt = minimize(errExpRec, iRecPs, args=(t_peaks, I_peaks), method=meth)
+            recMinAlt = minimize(errExpRec, iRecPs, args=(t_peaks, I_peaks), method=meth, iter_cb=iterCallback)
             fits[meth] = recMinAlt.chisqr
             #print(fit_report(recMin))
             if fits[meth] < chosenFit:
@@ -1260,7 +1260,7 @@ def _calcfVnew(V, v0, E):
     fV[np.isnan(fV)] = v1/v0 # Fix the error when dividing by zero
     return fV #* (V - E)
 
-def fitfV(Vs, Iss, params, relaxFact=2, method=defMethod, plot=False):  # , verbose=config.verbose):
+def fitfV(Vs, Iss, params, relaxFact=2, method=defMethod, plot=False, iterCallback=None):  # , verbose=config.verbose):
     """Fitting function to find the parameters of the voltage dependence function"""
 
     # Use @staticmethod or @classmethod on RhodopsinModel.calcfV() and pass in parameters?
@@ -1378,7 +1378,7 @@ def fitfV(Vs, Iss, params, relaxFact=2, method=defMethod, plot=False):  # , verb
         ifVPs['v1'].max = None
 
         if params['E'].vary:
-            FVmin = minimize(errFV, ifVPs, args=(Vs, Iss), method=method) # kws={'FVs':Iss},
+            FVmin = minimize(errFV, ifVPs, args=(Vs, Iss), method=method, iter_cb=iterCallback) # kws={'FVs':Iss},
             print('1st stage v0: ', ifVPs['v0'].value)
             pfV = FVmin.params
 
@@ -1386,7 +1386,7 @@ def fitfV(Vs, Iss, params, relaxFact=2, method=defMethod, plot=False):  # , verb
                 chosenFit = FVmin.chisqr
                 fits = {}
                 for meth in methods:
-                    FVminAlt = minimize(errFV, ifVPs, args=(Vs, Iss), method=meth)
+                    FVminAlt = minimize(errFV, ifVPs, args=(Vs, Iss), method=meth, iter_cb=iterCallback)
                     fits[meth] = FVminAlt.chisqr
                     if fits[meth] < chosenFit:
                         print("Consider using the '{}' algorithm for a better fit (chisqr = {:.3}) ==> E = {:.3}".format(meth, fits[meth], FVminAlt.params['E'].value))
@@ -1455,7 +1455,7 @@ def fitfV(Vs, Iss, params, relaxFact=2, method=defMethod, plot=False):  # , verb
         print(np.c_[Vs, Iss, gs, gNorm]) #np.asarray(Vs)-E
 
     if params['v0'].vary or params['v1'].vary:
-        fVmin = minimize(errfV, pfV, args=(Vs, gNorm), method=method)#, tol=1e-12)
+        fVmin = minimize(errfV, pfV, args=(Vs, gNorm), method=method, iter_cb=iterCallback)#, tol=1e-12)
         pfVfinal = fVmin.params
 
         if config.verbose > 1:
@@ -1467,7 +1467,7 @@ def fitfV(Vs, Iss, params, relaxFact=2, method=defMethod, plot=False):  # , verb
                 else:
                     pfV['E'].vary = True
                 pfV['v1'].expr = '(70+E)/(exp((70+E)/v0)-1)'
-                fVminAlt = minimize(errfV, pfV, args=(Vs, gNorm), method=meth)
+                fVminAlt = minimize(errfV, pfV, args=(Vs, gNorm), method=meth, iter_cb=iterCallback)
                 fits[meth] = fVminAlt.chisqr
                 if fits[meth] < chosenFit:
                     print("Consider using the '{}' algorithm for a better fit (chisqr = {:.3}) ==> v0 = {:.3}, v1 = {:.3}".format(meth, fits[meth], fVminAlt.params['v0'].value, fVminAlt.params['v1'].value))
@@ -1689,8 +1689,12 @@ def errCycle(p, Is, tons, toffs, nfs, RhO, Vs, phis):
 
 
 
-def fitModels(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, method=defMethod, postFitOptMethod=None, plot=True): # , verbose=config.verbose):
-    """Fit a list of models and compare thier goodness-of-fit metrics."""
+def fitModels(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, method=defMethod, postFitOptMethod=None, plot=True, iterCallback=None): # , verbose=config.verbose):
+    """Fit a list of models and compare thier goodness-of-fit metrics.
+
+    ``iterCallback`` is passed to each minimisation as lmfit's ``iter_cb``,
+    e.g. to report progress. Raising an exception from it stops the fit.
+    """
 
     '''
     #TODO """Routine to fit as many models as possible and select between them according to some parsimony criterion"""
@@ -1728,7 +1732,7 @@ def fitModels(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, m
         fitParams[i], miniObjs[i] = fitModel(dataSet, nStates=nStates[i], params=params[i],
                                 postFitOpt=postFitOpt, relaxFact=relaxFact,
                                 method=method, postFitOptMethod=postFitOptMethod,
-                                plot=plot)  # , verbose=verbose)
+                                plot=plot, iterCallback=iterCallback)  # , verbose=verbose)
 
     if config.verbose > 0 and nModels > 1:
         if isinstance(dataSet, dict):
@@ -1765,35 +1769,9 @@ def fitModels(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, m
 
     return fitParams, miniObjs
 
-def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, method=defMethod, postFitOptMethod=None, plot=True):  # , verbose=config.verbose):
-    """Fit a model (with initial parameters) to a dataset of optogenetic photocurrents."""
-
-    ### Define non-optimised parameters to exclude in post-fit optimisation
-    nonOptParams = ['Gr0', 'E', 'v0', 'v1']
-
-    if not isinstance(nStates, str):
-        nStates = str(nStates)  # .lower()
-
-    if nStates not in modelParams:
-        print(f"Error in selecting model {nStates} - please choose from {list(modelParams)} states")
-        raise NotImplementedError(nStates)
-
-    if config.verbose > 0:
-        t0 = wall_time()
-        print("\n================================================================================")
-        print(f"Fitting parameters for the {nStates}-state model with the '{method}' algorithm...")
-        print("================================================================================\n")
-
-    ### Check contents of dataSet and produce report on model features which may be fit.
-    # e.g. if not 'rectifier': f(V)=1
-
-    ### Trim data slightly to remove artefacts from light on/off transition ramps?
-
-    ### Could use precalculated lookup tables to find the values of steady state O1 & O2 occupancies?
-
-    if params is None:
-        params = modelParams[nStates]
 
+def _getFluxSet(dataSet):
+    """Return the data set as a dictionary with the key and ProtocolData of its flux set."""
     if isinstance(dataSet, dict):
         if 'step' in dataSet:
             fluxKey = 'step'
@@ -1804,62 +1782,77 @@ def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, me
     else:
         fluxKey = 'step'
 
-
     # Determine the data type passed
     if isinstance(dataSet, PhotoCurrent): # Single photocurrent
-        nRuns = 1
-        nPhis = 1
-        nVs = 1
         pc = copy.deepcopy(dataSet)
-        setPC = ProtocolData(fluxKey, nRuns, [pc.phi], [pc.V])
+        setPC = ProtocolData(fluxKey, 1, [pc.phi], [pc.V])
         setPC.trials[0][0][0] = pc
         dataSet = {fluxKey:setPC}
     elif isinstance(dataSet, ProtocolData): # Set of photocurrents
         setPC = copy.deepcopy(dataSet)
-        nRuns = setPC.nRuns
-        nPhis = setPC.nPhis
-        nVs = setPC.nVs
         dataSet = {fluxKey:setPC}
     elif isinstance(dataSet[fluxKey], PhotoCurrent): # Single photocurrent in dictionary
-        nRuns = 1
-        nPhis = 1
-        nVs = 1
         pc = copy.deepcopy(dataSet[fluxKey])
-        setPC = ProtocolData(fluxKey, nRuns, [pc.phi], [pc.V])
+        setPC = ProtocolData(fluxKey, 1, [pc.phi], [pc.V])
         setPC.trials[0][0][0] = pc
         dataSet = {fluxKey:setPC}
     elif isinstance(dataSet[fluxKey], ProtocolData): # Set of photocurrents in dictionary
         setPC = dataSet[fluxKey]
-        nRuns = setPC.nRuns
-        nPhis = setPC.nPhis
-        nVs = setPC.nVs
-        #if (setPC.nPhis * setPC.nVs) > 1:
-    # elif isinstance(dataSet[fluxKey], PhotoCurrent): # Single photocurrent within ProtocolData
-        # #targetPC = dataSet['custom']
-        # nRuns = 1
-        # nPhis = 1
-        # nVs = 1
-        # #setPC = [[[dataSet['custom']]]]
-        # setPC = ProtocolData(fluxKey, nRuns, [dataSet[fluxKey].phi], [dataSet[fluxKey].V])
-        # setPC.trials[0][0][0] = dataSet[fluxKey]
     else:
         print(type(dataSet[fluxKey]))
         print(dataSet[fluxKey])
         raise TypeError(f"dataSet[{fluxKey}]")
+    return dataSet, fluxKey, setPC
+
 
+def _getVIndm70(setPC):
+    """Return the index of the voltage clamp closest to -70 mV."""
+    if setPC.nVs == 1:
+        return 0
+    try:
+        return setPC.Vs.index(-70)
+    except:
+        return np.searchsorted(setPC.Vs, -70)
+
+
+def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, method=defMethod, postFitOptMethod=None, plot=True, iterCallback=None):  # , verbose=config.verbose):
+    """Fit a model (with initial parameters) to a dataset of optogenetic photocurrents."""
+
+    ### Define non-optimised parameters to exclude in post-fit optimisation
+    nonOptParams = ['Gr0', 'E', 'v0', 'v1']
+
+    if not isinstance(nStates, str):
+        nStates = str(nStates)  # .lower()
+
+    if nStates not in modelParams:
+        print(f"Error in selecting model {nStates} - please choose from {list(modelParams)} states")
+        raise NotImplementedError(nStates)
+
+    if config.verbose > 0:
+        t0 = wall_time()
+        print("\n================================================================================")
+        print(f"Fitting parameters for the {nStates}-state model with the '{method}' algorithm...")
+        print("================================================================================\n")
+
+    ### Check contents of dataSet and produce report on model features which may be fit.
+    # e.g. if not 'rectifier': f(V)=1
+
+    ### Trim data slightly to remove artefacts from light on/off transition ramps?
+
+    ### Could use precalculated lookup tables to find the values of steady state O1 & O2 occupancies?
+
+    if params is None:
+        params = modelParams[nStates]
+
+    dataSet, fluxKey, setPC = _getFluxSet(dataSet)
+    nRuns = setPC.nRuns
+    nPhis = setPC.nPhis
+    nVs = setPC.nVs
 
     if nRuns == 1:
         runInd = 0
 
-    if nVs == 1:
-        vIndm70 = 0
-    else:
-        try:
-            vIndm70 = setPC.Vs.index(-70)
-        except:
-            vIndm70 = np.searchsorted(setPC.Vs, -70)
-
-        #vIndm70 = getIndex(setPC.Vs, -70)
+    vIndm70 = _getVIndm70(setPC)
 
     if nPhis == 1:
         params['phi_m'].vary = False
@@ -1899,7 +1892,7 @@ def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, me
             print(f'Highest flux found at index {phiIndMax}: {phiMax:.3g}')
         IssSet, VsSet = dataSet[rectKey].getSteadyStates(run=0, phiInd=phiIndMax)
         if params['E'].vary or params['v0'].vary or params['v1'].vary:
-            params = fitfV(VsSet, IssSet, params, relaxFact=relaxFact)  # , verbose=verbose)
+            params = fitfV(VsSet, IssSet, params, relaxFact=relaxFact, iterCallback=iterCallback)  # , verbose=verbose)
 
     params['E'].vary = False
     params['v0'].vary = False
@@ -1950,7 +1943,7 @@ def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, me
         if config.verbose > 0:
             print('Recovery protocol found, fitting dark recovery rate: ', end='')
         t_peaks, I_peaks, Ipeak0, Iss0 = getRecoveryPeaks(dataSet['recovery'])
-        params = fitRecovery(t_peaks, I_peaks, params, Ipeak0, Iss0, ax=None, method=method)  # , verbose=verbose)
+        params = fitRecovery(t_peaks, I_peaks, params, Ipeak0, Iss0, ax=None, method=method, iterCallback=iterCallback)  # , verbose=verbose)
     else:
         if config.verbose > 0:
             print('Recovery protocol not found, fixing initial value: ', end='')
@@ -1989,14 +1982,14 @@ def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, me
 
     if nStates == '3':
         #phiFits[phiInd] = fit3states(I,t,onInd,offInd,phi,V,Gr0,gmax,Ipmax,params=pOns,method=method)#,Iss)
-        fittedParams, miniObj = fit3states(setPC, runInd, vIndm70, fitParams, method)  # , verbose)
+        fittedParams, miniObj = fit3states(setPC, runInd, vIndm70, fitParams, method, iterCallback=iterCallback)  # , verbose)
         constrainedParams = ['Gd']
     elif nStates == '4':
         #phiFits[phiInd] = fit4states(I,t,onInd,offInd,phi,V,Gr0,gmax,params=pOns,method=method)
-        fittedParams, miniObj = fit4states(setPC, runInd, vIndm70, fitParams, method)  # , verbose)
+        fittedParams, miniObj = fit4states(setPC, runInd, vIndm70, fitParams, method, iterCallback=iterCallback)  # , verbose)
         constrainedParams = ['Gd1', 'Gd2', 'Gf0', 'Gb0']
     elif nStates == '6':
-        fittedParams, miniObj = fit6states(setPC, quickSet, runInd, vIndm70, fitParams, method)  # , verbose)
+        fittedParams, miniObj = fit6states(setPC, quickSet, runInd, vIndm70, fitParams, method, iterCallback=iterCallback)  # , verbose)
         constrainedParams = ['Gd1', 'Gd2', 'Gf0', 'Gb0', 'Go1', 'Go2']
         #constrainedParams = ['Go1', 'Go2', 'Gf0', 'Gb0']
         #nonOptParams.append(['Gd1', 'Gd2'])
@@ -2029,7 +2022,7 @@ def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, me
                 fittedParams[p].vary = True
 
         RhO = models[nStates]()
-        postPmin = minimize(errCycle, fittedParams, args=(Icycles,tons,toffs,nfs,RhO,Vs,phis), method=postFitOptMethod)
+        postPmin = minimize(errCycle, fittedParams, args=(Icycles,tons,toffs,nfs,RhO,Vs,phis), method=postFitOptMethod, iter_cb=iterCallback)
         #optParams = postPmin.params
 
         if config.verbose > 0:
@@ -2049,17 +2042,12 @@ def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, me
 
 
     if plot:
-        for trial in range(len(PCs)):
-            plotFit(PCs[trial], nStates, orderedParams, fitRates=False, index=trial)  # , postPmin, fitRates=False, index=trial)
+        plotFits(dataSet, nStates, orderedParams)
 
     exportName = f'fitted{nStates}sParams.pkl'
     with open(os.path.join(config.dDir, exportName), "wb") as fh:
         pickle.dump(orderedParams, fh)
 
-    if plot:
-        # Plot set of curves
-        plotFluxSetFits(fluxSet=setPC, nStates=nStates, params=orderedParams)
-
     if config.verbose > 0:
         print('')
         printParams(orderedParams)
@@ -2071,6 +2059,16 @@ def fitModel(dataSet, nStates='3', params=None, postFitOpt=True, relaxFact=2, me
     return orderedParams, miniObj
 
 
+def plotFits(dataSet, nStates, params):
+    """Plot a fitted model against each photocurrent of the flux set and then the whole set."""
+    dataSet, fluxKey, setPC = _getFluxSet(dataSet)
+    vIndm70 = _getVIndm70(setPC)
+    nStates = str(nStates)
+    for trial in range(setPC.nPhis):
+        plotFit(setPC.trials[0][trial][vIndm70], nStates, params, fitRates=False, index=trial)
+    plotFluxSetFits(fluxSet=setPC, nStates=nStates, params=params)
+
+
 def plotFluxSetFits(fluxSet, nStates, params, runInd=0, vInd=0):
     """Plot a (list of) model(s) to experimental data."""
     # Currently assumes square light pulses, all of the same duration
@@ -7,12 +7,17 @@
 #import warnings
 #import time
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import traceback
 import os.path
 import os
 import ast
 import copy
 
 import numpy as np
+from matplotlib import pyplot as plt
 import ipywidgets as widgets
 #from traitlets import link
 #from traitlets import Unicode
@@ -91,6 +96,157 @@ protParamsList = OrderedDict([ (prot, list(protParams[prot])) for prot in protLi
 boolDict = OrderedDict([('True',True), ('False',False)])
 
 
+class Cancelled(Exception):
+    """Raised inside a background task to stop it when cancelled."""
+
+
+class TaskRunner(object):
+    """
+    Run simulations and fits on a background executor.
+
+    The kernel remains responsive while a task runs. Trial records from a
+    simulator's ``sink`` advance the progress bar, and the cancel button stops
+    a simulation before its next trial. Fits report each evaluation through
+    ``iterCallback`` (lmfit's ``iter_cb``) instead, which can also stop them.
+    Their number is not known in advance, so the bar cycles through ``total``
+    evaluations and the status shows the count. The results are handled on
+    the kernel's event loop (rather than the worker thread) so that the
+    widgets are only updated from the main thread. Tasks should not plot,
+    since pyplot is not thread-safe: the figures created by ``onResult`` are
+    rendered in ``output`` instead.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor, optional
+        Executor to submit tasks to (defaults to a single worker thread so
+        that tasks run in order). The task's callbacks and the simulator's
+        ``sink`` must be called in this process for progress to be streamed.
+    """
+
+    def __init__(self, executor=None):
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+        self.future = None
+        self.description = ''
+        self.onResult = None
+        self._running = False  # Until the results have been handled
+        self._cancel = threading.Event()
+        self._figures = set()  # Numbers of the figures created by onResult
+        self._evaluations = 0  # Of the objective function by a fit
+        self._loop = None  # Event loop to handle the results on
+
+        self.progress = widgets.IntProgress(value=0, min=0, max=1, description='Progress:')
+        self.status = widgets.Label(value='Idle')
+        self.cancelButton = widgets.Button(description='Cancel', disabled=True)
+        self.cancelButton.on_click(self.cancel)
+        self.output = widgets.Output()
+        self.bar = widgets.HBox(children=[self.progress, self.status, self.cancelButton])
+        self.widget = widgets.VBox(children=[self.bar, self.output])
+
+    def busy(self):
+        """Return True if a task is pending, running or handling its results."""
+        return self._running
+
+    def submit(self, description, func, args=(), kwargs=None, total=1, onResult=None):
+        """
+        Submit ``func(*args, **kwargs)`` unless another task is running.
+
+        ``total`` is the number of trials expected by the progress bar and
+        ``onResult`` is called with the task's return value on completion.
+        """
+        if self.busy():
+            self.status.value = 'Busy: {} (cancel it first)'.format(self.description)
+            return None
+        self._cancel.clear()
+        self.description = description
+        self.onResult = onResult
+        self.progress.max, self.progress.value = max(total, 1), 0
+        self.status.value = 'Running: {}...'.format(description)
+        self.cancelButton.disabled = False
+        self._figures = set()
+        self._evaluations = 0
+        try:  # The kernel's loop (if running) to return to from the worker
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self._running = True
+        self.future = self.executor.submit(func, *args, **(kwargs or {}))
+        self.future.add_done_callback(self._done)
+        return self.future
+
+    def _callSoon(self, func, *args):
+        """Call ``func`` on the event loop captured by ``submit`` (if any)."""
+        if self._loop is None or self._loop.is_closed():
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def _done(self, future):
+        self._callSoon(self._finish, future)
+
+    def _advance(self):
+        self.progress.value = min(self.progress.value + 1, self.progress.max)
+
+    def sink(self, record):
+        """Simulator sink: advance the progress bar or stop if cancelled."""
+        if self._cancel.is_set():
+            raise Cancelled(self.description)
+        if record.get('event') == 'trial':
+            self._callSoon(self._advance)
+
+    def _evaluated(self):
+        self._evaluations += 1
+        self.progress.value = self._evaluations % (self.progress.max + 1)
+        self.status.value = 'Running: {} ({} evaluations)...'.format(self.description, self._evaluations)
+
+    def iterCallback(self, params, iteration, resid, *args, **kws):
+        """Fit ``iter_cb``: count the evaluation or stop if cancelled."""
+        if self._cancel.is_set():
+            raise Cancelled(self.description)
+        self._callSoon(self._evaluated)
+
+    def cancel(self, b=None):
+        """Cancel the current task before its next trial or fit evaluation."""
+        if not self.busy() or self.future.done():
+            return
+        self._cancel.set()
+        if not self.future.cancel():  # Already running
+            self.status.value = 'Cancelling: {}...'.format(self.description)
+
+    def _finish(self, future):
+        self.cancelButton.disabled = True
+        try:
+            if future.cancelled() or self._cancel.is_set():
+                self.status.value = 'Cancelled: {}'.format(self.description)
+                return
+            try:
+                result = future.result()
+                if self.onResult is not None:
+                    # Nothing else runs on this thread meanwhile, so any new figures are the task's
+                    before = set(plt.get_fignums())
+                    try:
+                        self.onResult(result)
+                    finally:
+                        self._figures = set(plt.get_fignums()) - before
+            except Exception:
+                self.output.append_stderr(traceback.format_exc())
+                self.status.value = 'Failed: {}'.format(self.description)
+            else:
+                self.progress.value = self.progress.max
+                self.status.value = 'Finished: {}'.format(self.description)
+            self.showFigures()
+        finally:
+            self._running = False
+
+    def showFigures(self):
+        """Render the figures created by ``onResult`` in the output widget."""
+        figures, self._figures = self._figures, set()
+        for num in sorted(num for num in figures if plt.fignum_exists(num)):
+            fig = plt.figure(num)
+            self.output.append_display_data(fig)
+            plt.close(fig)
+
 
 ### TODO: Replace GUI with object oriented code...
 class ParamWidgets(object):
@@ -228,6 +384,8 @@ def loadGUI(IPythonWorkspace=None):
     else:
         globals().update(IPythonWorkspace)
 
+    runner = TaskRunner()  # Runs simulations and fits in the background
+
     ##### Model fitting bar Functions #####
     '''
     def fitToggle(name, value):
@@ -273,6 +431,7 @@ def loadGUI(IPythonWorkspace=None):
         #global clearOutput
         if clearOutput.value:
             clear_output()
+            runner.output.clear_output()
             #if 'fitParamsPopup' in vars() or 'fitParamsPopup' in globals():
             #    fitParamsPopup.close()
 
@@ -281,24 +440,37 @@ def loadGUI(IPythonWorkspace=None):
         pSet = modelParams[modelList[mInd]]
 
         initialParams = getGUIparams(pSet, pfValArr[mInd][:], varyList=fVaryArr[mInd][:], minList=pfMinArr[mInd][:], maxList=pfMaxArr[mInd][:], exprList=fExprArr[mInd][:])
-        fittedParams, miniObj = fitModels(dataSet, nStates=int(statesToFitButtons.value), params=initialParams, postFitOpt=runPostOpt.value, relaxFact=relaxFactWid.value, method=methods[fitMethods.value], postFitOptMethod=methods[postOptFitMethods.value])
-
-        #fitParamReport = widgets.TextareaWidget(description='Report:',value=fitRhO.reportParams())
-        #fitParamsPopup = widgets.PopupWidget(children=[fitParamReport],button_text='Fitted Parameters',description='Fitted {} state model parameters from: {}'.format(int(statesToFitButtons.value),dataVar.value))
-        #display(fitParamsPopup)
-
-        #[:]???
-        setGUIparams(fittedParams, modelParamsList[model], pfValArr[mInd], varyList=fVaryArr[mInd], minList=pfMinArr[mInd], maxList=pfMaxArr[mInd], exprList=fExprArr[mInd])
-
-        # if useFitCheck.value: # Set the run parameters too
-            # setGUIparams(fittedParams, modelParamsList[model], pValArr[mInd])
-
-        if runSSAcheck.value == True:
-            fitRhO = models[modelList[mInd]]()
-            fitRhO.updateParams(fittedParams)
-            fitRhO.plotRates()
-            characterise(fitRhO)
-
+        fitKwargs = dict(nStates=int(statesToFitButtons.value), params=initialParams, postFitOpt=runPostOpt.value, relaxFact=relaxFactWid.value, method=methods[fitMethods.value], postFitOptMethod=methods[postOptFitMethods.value])
+
+        def onFitted(result):
+            fitParams, miniObjs = result
+            fittedParams = fitParams[0]
+            if background:  # Plot here rather than on the worker thread
+                plotFits(dataSet, model, fittedParams)
+
+            #fitParamReport = widgets.TextareaWidget(description='Report:',value=fitRhO.reportParams())
+            #fitParamsPopup = widgets.PopupWidget(children=[fitParamReport],button_text='Fitted Parameters',description='Fitted {} state model parameters from: {}'.format(int(statesToFitButtons.value),dataVar.value))
+            #display(fitParamsPopup)
+
+            #[:]???
+            setGUIparams(fittedParams, modelParamsList[model], pfValArr[mInd], varyList=fVaryArr[mInd], minList=pfMinArr[mInd], maxList=pfMaxArr[mInd], exprList=fExprArr[mInd])
+
+            # if useFitCheck.value: # Set the run parameters too
+                # setGUIparams(fittedParams, modelParamsList[model], pValArr[mInd])
+
+            if runSSAcheck.value == True:
+                fitRhO = models[modelList[mInd]]()
+                fitRhO.updateParams(fittedParams)
+                fitRhO.plotRates()
+                characterise(fitRhO)
+
+        background = backgroundCheck.value
+        if background:
+            fitKwargs.update(plot=False, iterCallback=runner.iterCallback)
+            runner.submit('fitting the {}-state model'.format(model), fitModels,
+                          (dataSet,), fitKwargs, total=100, onResult=onFitted)
+        else:
+            onFitted(fitModels(dataSet, **fitKwargs))
         return
 
     def onClickCharacteriseButton(b):
@@ -492,8 +664,12 @@ def loadGUI(IPythonWorkspace=None):
         #saveData = True
         #@interact(nStates={'Three-state':3,'Four-state':4,'Six-state':6}, protocol=('custom', 'step', 'sinusoid', 'ramp', 'delta', 'rectifier', 'shortPulse', 'recovery'), saveData=True, verbose=1)
 
-    def runModel(model, protocol, simulator='Python', saveData=True, verbose=config.verbose): #verboseSlide.value
-        """Main GUI function to create protocol, simulator and opsin objects, set parameters, run and plot"""
+    def runModel(model, protocol, simulator='Python', saveData=True, verbose=config.verbose, background=False): #verboseSlide.value
+        """Main GUI function to create protocol, simulator and opsin objects, set parameters, run and plot
+
+        With ``background=True`` the simulation is submitted to the GUI's
+        ``TaskRunner`` and plotted when it finishes.
+        """
 
         #verbose = verbose
         #nStates = int(model)
@@ -528,9 +704,16 @@ def loadGUI(IPythonWorkspace=None):
         userSimParams = getGUIparams(simParams[simulator], sim_pValArr[sInd][:])
         Sim = simulators[simulator](Prot, RhO, userSimParams)
 
-        Sim.run(verbose)
-        if verbose > 0: #saveData:
-            Sim.plot()
+        def onRun(PD):
+            if verbose > 0: #saveData:
+                Sim.plot()
+
+        if background:
+            Sim.sink = runner.sink  # Stream progress and check for cancellation
+            runner.submit("'{}' protocol on the {}-state model with {}".format(protocol, model, simulator),
+                          Sim.run, (verbose,), total=Prot.nRuns*Prot.nPhis*Prot.nVs, onResult=onRun)
+        else:
+            onRun(Sim.run(verbose))
 
         # print("\nFinished!")
         # print('================================================================================\n\n')
@@ -558,7 +741,8 @@ def loadGUI(IPythonWorkspace=None):
     def onClickRunButton(b): # on_button_clicked
         if clearOutput.value:
             clear_output()
-        runModel(stateButtons.value, protDropdown.value, simDropdown.value, saveButton.value, verboseSlide.value) #int(stateButtons.value)
+            runner.output.clear_output()
+        runModel(stateButtons.value, protDropdown.value, simDropdown.value, saveButton.value, verboseSlide.value, backgroundCheck.value) #int(stateButtons.value)
         return
 
     runButton = widgets.Button(description="Run!")
@@ -644,9 +828,12 @@ def loadGUI(IPythonWorkspace=None):
     ### Clear ouput checkbox
     clearOutput = widgets.Checkbox(description='Clear', value=True)
 
+    ### Background execution checkbox
+    backgroundCheck = widgets.Checkbox(description='Background', value=False)
+
 
     #### Run Bar container
-    runBar = widgets.HBox(children=[stateButtons,protDropdown,simDropdown,paramsButton,saveButton,verboseSlide,clearOutput,runButton]) #fitButton,
+    runBar = widgets.HBox(children=[stateButtons,protDropdown,simDropdown,paramsButton,saveButton,verboseSlide,clearOutput,backgroundCheck,runButton]) #fitButton,
     #####display(runBar) # Commented to nest in GUI box
 
 
@@ -1306,7 +1493,7 @@ def loadGUI(IPythonWorkspace=None):
 
     ### Container box for the entire GUI
     GUI = widgets.VBox()
-    GUI.children = [runBar, paramsControlBar, paramTabs] #[fitBar,runBar,paramsControlBar,paramTabs,NEURONbox,Brianbox]
+    GUI.children = [runBar, runner.widget, paramsControlBar, paramTabs] #[fitBar,runBar,paramsControlBar,paramTabs,NEURONbox,Brianbox]
     display(GUI)
 
 
@@ -0,0 +1,139 @@
+"""
+Light propagation through tissue
+    * ``beerLambert`` for exponential attenuation by absorption (and scattering)
+    * ``kubelkaMunk`` for attenuation by scattering
+    * ``fiberTransmission`` for the fraction of irradiance along the axis of an
+      optical fiber
+    * ``fiberFlux`` to map a source irradiance to the flux at each cell
+    * ``govardovskii`` for the action spectrum of an opsin
+
+Distances are in millimetres [mm] and irradiances in [mW * mm^-2] to be
+consistent with the flux units [photons * mm^-2 * s^-1] used throughout.
+The transmission fractions may be passed as the per-cell ``irradiance`` of
+:meth:`pyrho.simulators.simPython.runPopulation` so that a whole depth profile
+of cells is simulated in one batched run.
+"""
+
+import numpy as np
+
+from pyrho.utilities import irrad2flux
+
+__all__ = ['beerLambert', 'kubelkaMunk', 'fiberTransmission', 'fiberFlux',
+           'govardovskii']
+
+
+def beerLambert(z, mu):
+    """
+    Fraction of light transmitted to depth ``z`` by Beer-Lambert attenuation.
+
+    Parameters
+    ----------
+    z : float or array-like
+        Depth [mm].
+    mu : float
+        Attenuation coefficient [mm^-1] (absorption plus reduced scattering).
+
+    Returns
+    -------
+    float or ndarray
+        Transmitted fraction, exp(-mu * z).
+    """
+    return np.exp(-mu * np.asarray(z, dtype=float))
+
+
+def kubelkaMunk(z, S):
+    """
+    Fraction of light transmitted to depth ``z`` in a purely scattering medium
+    according to the Kubelka-Munk model.
+
+    Parameters
+    ----------
+    z : float or array-like
+        Depth [mm].
+    S : float
+        Scattering coefficient [mm^-1] e.g. 11.2 (mouse) or 10.3 (rat) for
+        blue light in grey matter (Aravanis et al., 2007).
+
+    Returns
+    -------
+    float or ndarray
+        Transmitted fraction, 1 / (S * z + 1).
+    """
+    return 1 / (S * np.asarray(z, dtype=float) + 1)
+
+
+def fiberTransmission(z, r=0.1, NA=0.37, n=1.36, S=11.2, mu=None):
+    """
+    Fraction of the irradiance at the tip of an optical fiber reaching depth
+    ``z`` along its axis.
+
+    The light is attenuated by scattering (Kubelka-Munk) or, if ``mu`` is
+    given, exponentially (Beer-Lambert) and spreads geometrically from the
+    fiber aperture (Aravanis et al., 2007).
+
+    Parameters
+    ----------
+    z : float or array-like
+        Depth below the fiber tip [mm].
+    r : float
+        Radius of the fiber core [mm].
+    NA : float
+        Numerical aperture of the fiber.
+    n : float
+        Refractive index of the tissue.
+    S : float
+        Scattering coefficient [mm^-1] for the Kubelka-Munk model.
+    mu : float, optional
+        Attenuation coefficient [mm^-1] for the Beer-Lambert model (used
+        instead of ``S`` if given).
+
+    Returns
+    -------
+    float or ndarray
+        Transmitted fraction of the irradiance at each depth.
+    """
+    z = np.asarray(z, dtype=float)
+    if np.any(z < 0):
+        raise ValueError("Depths must be non-negative!")
+    if NA >= n:
+        raise ValueError("The numerical aperture must be less than the refractive index!")
+    rho = r * np.sqrt((n / NA)**2 - 1)  # Distance to the virtual point source
+    spread = rho**2 / (z + rho)**2
+    if mu is None:
+        return spread * kubelkaMunk(z, S)
+    return spread * beerLambert(z, mu)
+
+
+def fiberFlux(E, z, lam=470, **kwargs):
+    """
+    Flux [photons * mm^-2 * s^-1] at depth ``z`` for a source irradiance ``E``
+    [mW * mm^-2] at the fiber tip. Additional keyword arguments are passed to
+    :func:`fiberTransmission`.
+    """
+    return irrad2flux(E * fiberTransmission(z, **kwargs), lam)
+
+
+def govardovskii(lam, lam_max=470):
+    """
+    Relative sensitivity of an opsin with peak sensitivity at ``lam_max``.
+
+    The alpha-band of the A1 visual pigment template (Govardovskii et al.,
+    2000) is used, which may be assigned (e.g. with a lambda) as the
+    ``actionSpectrum`` of a model.
+
+    Parameters
+    ----------
+    lam : float or array-like
+        Wavelength [nm].
+    lam_max : float
+        Wavelength of peak sensitivity [nm].
+
+    Returns
+    -------
+    float or ndarray
+        Sensitivity relative to the peak.
+    """
+    x = lam_max / np.asarray(lam, dtype=float)
+    a = 0.8795 + 0.0459 * np.exp(-(lam_max - 300)**2 / 11940)
+    return 1 / (np.exp(69.7 * (a - x)) + np.exp(28 * (0.922 - x))
+                + np.exp(-14.9 * (1.104 - x)) + 0.674)
@@ -9,35 +9,172 @@ import warnings
 import logging
 import abc
 import itertools
+import inspect
+import types
+import threading
+from collections import OrderedDict, namedtuple
 
 import matplotlib.pyplot as plt
 #import matplotlib as mpl # For plotStates
 import numpy as np
-from scipy.integrate import odeint
+from scipy.integrate import odeint, solve_ivp
 
 from pyrho.utilities import calcV1
 from pyrho.parameters import PyRhOobject, modelParams, stateLabs, rhoType
 from pyrho import config
 
-__all__ = ['models', 'selectModel']
+__all__ = ['models', 'selectModel', 'FrozenModel', 'TrialResult',
+           'EigenCache', 'simulateTrial']
 
 logger = logging.getLogger(__name__)
 
 # Model class definitions #
 
 
+class FrozenModel(object):
+    """
+    Immutable snapshot of a model's parameters (see :meth:`RhodopsinModel.freeze`).
+
+    Other attributes (e.g. ``nStates``) are looked up on the model class and
+    its methods are bound to the snapshot, so those which do not change the
+    model's state (e.g. ``jacobian``, ``calcI``) may be called on it. A
+    snapshot may be shared between threads and pickled for other processes.
+    """
+    __slots__ = ('_model', '_values')
+
+    def __init__(self, model, values):
+        object.__setattr__(self, '_model', model)
+        object.__setattr__(self, '_values', dict(values))
+
+    def __getattr__(self, name):
+        if name in self._values:
+            return self._values[name]
+        attr = getattr(self._model, name)
+        if inspect.isfunction(attr):
+            return types.MethodType(attr, self)
+        return attr
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Frozen models are immutable - use replace()!")
+
+    def __reduce__(self):
+        return (FrozenModel, (self._model, self._values))
+
+    def __repr__(self):
+        return f"<PyRhO frozen {stateLabs[self.nStates]}-state {self.rhoType} Model object>"
+
+    def replace(self, **values):
+        """Return a copy of the snapshot with some values replaced."""
+        for name in values:
+            if name not in self._values:
+                raise ValueError(f"Unknown parameter: '{name}'!")
+        return FrozenModel(self._model, {**self._values, **values})
+
+
+TrialResult = namedtuple('TrialResult', ['t', 'states', 'I'])
+TrialResult.__doc__ = """Times [ms], states (nSamples x nStates) and photocurrent [nA] of a trial."""
+
+
+class EigenCache(object):
+    r"""
+    Least recently used cache of rate-matrix decompositions.
+
+    Entries are keyed by the rate matrix itself, so a decomposition is reused
+    by every phase, trial and model snapshot with the same rates (e.g. every
+    dark phase of a protocol) and a change of parameters, temperature or
+    spectral gain can never return a stale entry. Conservation of state
+    occupancy, :math:`\sum_i s_i = 1`, is used to eliminate the last state,
+    giving the reduced (non-singular) system :math:`\dot{x} = A_r x + b` for
+    the remaining states. The cache may be shared between threads and is
+    copied (with its entries) to other processes.
+
+    Parameters
+    ----------
+    maxSize : int, optional
+        Maximum number of decompositions to keep.
+    """
+
+    def __init__(self, maxSize=32):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Remove every decomposition."""
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, A):
+        """
+        Spectral decomposition of the rate matrix ``A``.
+
+        Returns
+        -------
+        tuple or None
+            Eigenvalues of :math:`A_r` [1/ms], their (column) eigenvectors,
+            its inverse and the steady-state of the reduced system or
+            ``None`` if :math:`A_r` is (nearly) defective.
+        """
+        A = np.ascontiguousarray(A, dtype=float)
+        key = (A.shape, A.tobytes())
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        Ar = A[:-1, :-1] - A[:-1, -1:]
+        b = A[:-1, -1]
+        lams, vecs = np.linalg.eig(Ar)
+        if np.linalg.cond(vecs) > 1e12:
+            eigenSystem = None
+        else:
+            eigenSystem = (lams, vecs, np.linalg.inv(vecs), np.linalg.solve(Ar, -b))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = eigenSystem
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+        return eigenSystem
+
+
 class RhodopsinModel(PyRhOobject):
     """Common base class for all models."""
     # This an abstract base class since it is never directly instantiated
     __metaclass__ = abc.ABCMeta
-    # TODO: Revise to be stateless and store data in PhotoCurrent objects
+    # N.B. Simulation state is stored on the instance: use freeze() and
+    # simulateTrial() to share a model between threads or processes
     phi = 0.0  # Instantaneous Light flux [photons * mm^-2 * s^-1]
+    lam = None  # Wavelength of the light [nm]
+    spectralGain = 1.0  # Relative sensitivity at the current wavelength
+    actionSpectrum = None  # Relative sensitivity: callable, (lams, values) or None (flat)
+    T = None  # Temperature [degC] (None: the reference temperature)
+    T_ref = 22.0  # Temperature [degC] at which the rate parameters apply
+    Q10 = 2.0  # Temperature coefficient for all rates or a dict of {rate: Q10}
+    eigenCacheSize = 32  # Maximum number of cached rate-matrix decompositions
 
     def __init__(self, params=None, rhoType=rhoType):
 
         if params is None:
             params = modelParams[str(self.nStates)]
         self.rhoType = rhoType  # E.g. 'ChR2' or 'ArchT' or 'Jaws'
+        self._eigenCache = EigenCache(self.eigenCacheSize)
+        self._paramVersion = 0
+        self._refRates = {}  # Constant rates at the reference temperature
+        self._fT = self.calcfT(self.T)
 
         self.setParams(params)
 
@@ -67,6 +204,111 @@ class RhodopsinModel(PyRhOobject):
         """When a rhodopsin is called, return its internal state at that instant."""
         return self.calcI(self.V, self.states[-1, :])
 
+    def setParams(self, params):
+        """Set all model parameters from a Parameters() object."""
+        super().setParams(params)
+        self._paramVersion += 1  # Invalidate cached decompositions
+        self._scaleConstRates(params)
+
+    def updateParams(self, params):
+        """Update model parameters which already exist."""
+        count = super().updateParams(params)
+        self._paramVersion += 1  # Invalidate cached decompositions
+        self._scaleConstRates(params)
+        return count
+
+    def exportParams(self, params):
+        """Export parameters which are already in lmfit dictionary."""
+        count = super().exportParams(params)
+        for rate, value in self._refRates.items():
+            if rate in params:  # Export the rates at the reference temperature
+                params[rate].value = value
+        return count
+
+    def _scaleConstRates(self, params=None):
+        """Scale the constant rates from their reference values to ``T``."""
+        if params is not None:
+            for rate in self.constRates:
+                if rate in params:
+                    self._refRates[rate] = params[rate].value
+        for rate, value in self._refRates.items():
+            setattr(self, rate, value * self._fT[rate])
+
+    def calcActionSpectrum(self, lams):
+        """
+        Calculate the relative sensitivity of the opsin at each wavelength.
+
+        The ``actionSpectrum`` attribute may be a function of wavelength
+        (e.g. ``lambda lam: govardovskii(lam, 470)``), a tuple of tabulated
+        ``(wavelengths, sensitivities)`` which are linearly interpolated (and
+        zero outside their range) or ``None`` for a flat response.
+
+        Parameters
+        ----------
+        lams : float or array-like
+            Wavelengths [nm].
+
+        Returns
+        -------
+        float or ndarray
+            Sensitivity relative to the peak.
+        """
+        lams = np.asarray(lams, dtype=float)
+        spectrum = self.actionSpectrum
+        if spectrum is None:
+            return np.ones_like(lams)[()]
+        if callable(spectrum):
+            return np.asarray(spectrum(lams), dtype=float)[()]
+        wavelengths, values = spectrum
+        return np.interp(lams, wavelengths, values, left=0., right=0.)[()]
+
+    def setWavelength(self, lam):
+        """
+        Set the wavelength [nm] of the light.
+
+        Fluxes passed to the model (e.g. through ``setLight``) are scaled by
+        the action spectrum at this wavelength to give the effective flux.
+        ``None`` disables the scaling.
+        """
+        gain = 1.0 if lam is None else float(self.calcActionSpectrum(lam))
+        if gain < 0:
+            raise ValueError("The action spectrum must be non-negative!")
+        self.lam = lam
+        if gain != self.spectralGain:
+            self.spectralGain = gain
+            self._paramVersion += 1  # Invalidate cached decompositions
+            self.setLight(self.phi)
+
+    def freeze(self):
+        """
+        Return an immutable snapshot of the model's parameters.
+
+        Constant rates are stored at the reference temperature together with
+        the current temperature and spectral gain. The snapshot is not
+        affected by later changes to the model.
+        """
+        values = {p: getattr(self, p) for p in self.paramsList}
+        values.update(self._refRates)
+        s_0 = np.array(self.s_0, dtype=float)
+        s_0.flags.writeable = False
+        Q10 = dict(self.Q10) if isinstance(self.Q10, dict) else self.Q10
+        values.update(s_0=s_0, rhoType=self.rhoType, T=self.T, T_ref=self.T_ref,
+                      Q10=Q10, spectralGain=self.spectralGain,
+                      useAnalyticSoln=self.useAnalyticSoln)
+        return FrozenModel(type(self), values)
+
+    def simulate(self, phases, V, dt, s0=None, **options):
+        """Simulate a trial without changing the model (see :func:`simulateTrial`).
+
+        The model's decompositions are reused (see :meth:`calcEigenSystem`).
+        """
+        options.setdefault('cache', self._eigenCache)
+        return simulateTrial(self.freeze(), phases, V, dt, s0, **options)
+
+    def clearEigenCache(self):
+        """Clear the cached rate-matrix decompositions (see :class:`EigenCache`)."""
+        self._eigenCache.clear()
+
     def storeStates(self, soln, t):
         # TODO: Make array dimensions consistent e.g. both row vectors
         self.states = np.vstack((self.states, soln))  # np.append(self.states, soln, axis=0)
@@ -148,25 +390,196 @@ class RhodopsinModel(PyRhOobject):
         """
         return self.calcI(V, states=self.calcSteadyState())
 
-    '''
-    @property
-    def T(self):
-        return self._T
-    @T.setter
-    def T(self, T):
-        self._T = T
-    '''
+    def calcFrequencyResponse(self, fs, phi0, V=None):
+        r"""
+        Calculate the small-signal frequency response about a background flux.
+
+        The rate equations :math:`\dot{s} = A(\phi)s` are linearised around
+        the steady-state for ``phi0``, giving the transfer function
+        :math:`H(\omega) = c(i\omega I - A)^{-1}\frac{\partial A}{\partial \phi}s_{ss}`
+        from a flux perturbation to the conductance (or current).
+        The derivatives of the light-sensitive rates are calculated exactly
+        by complex-step differentiation and the conservation of state
+        occupancy is used to reduce the system by one state.
+
+        Parameters
+        ----------
+        fs : float or array-like
+            Frequencies [Hz].
+        phi0 : float > 0
+            Background flux [ph./mm^2/s] to linearise around.
+        V : float, optional
+            Clamp voltage [mV]. If given, the response is the photocurrent
+            [nA] per unit flux, otherwise the response of the conductance
+            scaling factor, :math:`f_\phi`.
+
+        Returns
+        -------
+        H : ndarray(complex)
+            Transfer function at each frequency.
+        gain : ndarray(float)
+            :math:`|H|` at each frequency.
+        phase : ndarray(float)
+            :math:`\arg(H)` [rad] at each frequency.
+        """
+        if phi0 <= 0:
+            raise ValueError("The background flux must be positive!")
+        fs = np.atleast_1d(np.asarray(fs, dtype=float))
+        phi = self.phi
+        n = self.nStates
+
+        s_ss = self.calcSteadyState(phi0)
+        A = self.jacobian(s_ss, 0)
+        h = phi0 * 1e-20  # Complex step
+        for rate, func in zip(self.photoRates, self.photoFuncs):
+            setattr(self, rate, getattr(self, func)((phi0 + 1j*h) * self.spectralGain) * self._fT[rate])
+        dAdphi = np.imag(self.jacobian(s_ss, 0)) / h
+        self.setLight(phi)  # Restore the rates
+
+        B = dAdphi @ s_ss
+        c = self.calcfphi(np.eye(n))  # f_phi is linear in the states
+
+        # Eliminate the last state with sum(s) = 1
+        Ar = A[:-1, :-1] - A[:-1, -1:]
+        Br = B[:-1]
+        cr = c[:-1] - c[-1]
+
+        ws = 2 * np.pi * fs / 1000  # [rads/ms]
+        M = 1j * ws[:, None, None] * np.eye(n-1) - Ar
+        x = np.linalg.solve(M, np.broadcast_to(Br, (len(fs), n-1))[..., None])
+        H = x[..., 0] @ cr
+        if V is not None:
+            H *= self.g0 * self.calcfV(V) * (V - self.E) * 1e-6  # [nA]
+        return H, np.abs(H), np.angle(H)
 
     def calcfT(self, T):
-        raise NotImplementedError
+        """
+        Calculate the Q10 scaling factor of each transition rate.
+
+        Parameters
+        ----------
+        T : float or array-like or None
+            Temperature [degC] (``None`` for the reference temperature).
+
+        Returns
+        -------
+        dict(str: float or ndarray)
+            Factor for each photosensitive and constant rate. Rates missing
+            from a ``Q10`` dict are not scaled.
+        """
+        dT = 0. if T is None else (np.asarray(T, dtype=float) - self.T_ref) / 10
+        fT = {}
+        for rate in itertools.chain(self.photoRates, self.constRates):
+            Q10 = self.Q10.get(rate, 1.) if isinstance(self.Q10, dict) else self.Q10
+            fT[rate] = Q10 ** dT
+        return fT
+
+    def setTemperature(self, T):
+        """
+        Set the temperature [degC] and scale the transition rates by their Q10.
+
+        Decompositions of the rate matrix remain cached for each temperature
+        so returning to a previous temperature does not recompute them.
+        """
+        self.T = T
+        self._fT = self.calcfT(T)
+        self._scaleConstRates()
+        self.setLight(self.phi)
+
+    def _scalePhotoRates(self):
+        """Scale the photosensitive rates (set by ``setLight``) to ``T``."""
+        for rate in self.photoRates:
+            setattr(self, rate, getattr(self, rate) * self._fT[rate])
 
     def calcfpH(self, pH):
         raise NotImplementedError
 
+    def calcEigenSystem(self):
+        r"""
+        Spectral decomposition of the rate matrix for the current light level.
+
+        Decompositions are kept in the model's :class:`EigenCache` of up to
+        ``eigenCacheSize`` entries, which is shared with the trials simulated
+        by :func:`simulateTrial`, so that phases with the same rates (e.g.
+        every dark phase) share them across pulses, trials and repeated
+        fitting evaluations.
+
+        Returns
+        -------
+        lams : ndarray(complex)
+            Eigenvalues of :math:`A_r` [1/ms].
+        vecs : ndarray(complex)
+            Corresponding (column) eigenvectors.
+        vecsInv : ndarray(complex)
+            Inverse of ``vecs``.
+        x_ss : ndarray(float)
+            Steady-state of the reduced system.
+        """
+        eigenSystem = self._eigenCache.get(self.jacobian(None, 0))
+        if eigenSystem is None:
+            raise ValueError("The rate matrix is (nearly) defective!")
+        return eigenSystem
+
+    def calcRateMatrices(self, phis, params=None, Ts=None):
+        """
+        Calculate the rate matrices of a population of cells.
+
+        Parameters
+        ----------
+        phis : array-like
+            Flux [ph./mm^2/s] at each of N cells (scaled by the action
+            spectrum at the current wavelength).
+        params : dict(str: array-like), optional
+            Per-cell values of model parameters e.g. ``{'phi_m': phi_ms}``.
+            Rates are given at the reference temperature.
+        Ts : float or array-like, optional
+            Temperature [degC] of each cell (defaults to ``T``).
+
+        Returns
+        -------
+        ndarray(float)
+            Rate matrices, shape (N, nStates, nStates).
+        """
+        phis = np.asarray(phis, dtype=float)
+        model = self.freeze()
+        cells = {name: np.asarray(values, dtype=float)
+                 for name, values in (params or {}).items()}
+        if Ts is not None:
+            cells['T'] = np.asarray(Ts, dtype=float)
+        return calcRateMatrices(model.replace(**cells), phis)
+
     def calcSoln(self, t, s0=None):
+        r"""
+        Calculate the exact solution for the states under constant light.
+
+        If the rate matrix is (nearly) defective, the states are integrated
+        numerically instead. The solution :math:`x(t) = x_{ss} + V e^{\Lambda t} V^{-1}(x_0 - x_{ss})`
+        is calculated from the (cached) spectral decomposition of the rate
+        matrix (see :meth:`calcEigenSystem`).
+
+        Parameters
+        ----------
+        t : array-like
+            Times [ms] (shifted to start at 0).
+        s0 : array-like, optional
+            Initial state (defaults to ``s_0``).
+
+        Returns
+        -------
+        ndarray(float)
+            States (nSamples x nStates).
+        """
         if s0 is None:
             s0 = self.s_0
-        return odeint(self.solveStates, s0, t, args=(None,), Dfun=self.jacobian)
+        s0 = np.asarray(s0, dtype=float)
+        t = np.asarray(t) - t[0]  # Shift time array to start at 0
+        try:
+            eigenSystem = self.calcEigenSystem()
+        except (ValueError, np.linalg.LinAlgError) as err:
+            if config.verbose > 1:
+                print(f'{err} Falling back to numerical integration.')
+            return odeint(self.solveStates, s0, t, args=(None,), Dfun=self.jacobian)
+        return _solveConstant(eigenSystem, s0, t)
 
     def plotActivation(self, actFunc, label=None, phis=np.logspace(12, 21, 1001), ax=None):
         if ax is None:
@@ -284,7 +697,7 @@ class RhO_3states(RhodopsinModel):
             dO/dt = Ga*C - Gd*O                     : 1
             dD/dt = Gd*O - Gr*D                     : 1
             Ga = Theta*k_a*((phi**p)/(phi**p + phi_m**p))             : second**-1
-            Gr = Theta*k_r*((phi(t)**q)/(phi(t)**q + phi_m**q)) + Gr0 : second**-1
+            Gr = Theta*k_r*((phi**q)/(phi**q + phi_m**q)) + Gr0       : second**-1
             f_phi = O                               : 1
             f_v = (1-exp(-(v-E)/v0))/((v-E)/v1)     : 1
             I = g0*f_phi*f_v*(v-E)                  : amp
@@ -343,8 +756,10 @@ class RhO_3states(RhodopsinModel):
         if phi < 0:
             phi = 0
         self.phi = phi
+        phi = phi * self.spectralGain  # Effective flux
         self.Ga = self._calcGa(phi)
         self.Gr = self._calcGr(phi)
+        self._scalePhotoRates()
         if config.verbose > 1:
             self.dispRates()
 
@@ -457,7 +872,7 @@ class RhO_4states(RhodopsinModel):
 
     # Class attributes
     nStates = 4
-    useAnalyticSoln = False
+    useAnalyticSoln = True
 
     phi_0 = 0.0                             # Instantaneous Light flux
     s_0 = np.array([1, 0, 0, 0])            # Default: Initialise in the dark
@@ -565,10 +980,12 @@ class RhO_4states(RhodopsinModel):
         if phi < 0:
             phi = 0
         self.phi = phi
+        phi = phi * self.spectralGain  # Effective flux
         self.Ga1 = self._calcGa1(phi)
         self.Ga2 = self._calcGa2(phi)
         self.Gf = self._calcGf(phi)
         self.Gb = self._calcGb(phi)
+        self._scalePhotoRates()
         if config.verbose > 1:
             self.dispRates()
 
@@ -632,16 +1049,13 @@ class RhO_4states(RhodopsinModel):
         self.steadyStates = np.array([C1ss, O1ss, O2ss, C2ss]) / denom
         return self.steadyStates
 
-    def calcSoln(self, t, s0=None):
-        raise NotImplementedError(self.nStates)
-
 
 class RhO_6states(RhodopsinModel):
     """Class definition for the 6-state model."""
 
     # Class attributes
     nStates = 6
-    useAnalyticSoln = False
+    useAnalyticSoln = True
     s_0 = np.array([1, 0, 0, 0, 0, 0])  # [s1_0=1, s2_0=0, s3_0=0, s4_0=0, s5_0=0, s6_0=0] # array not necessary
     phi_0 = 0.0                         # Default initial flux
     stateVars = ['C1', 'I1', 'O1', 'O2', 'I2', 'C2']  # stateVars[0] is the 'ground' state
@@ -743,10 +1157,12 @@ class RhO_6states(RhodopsinModel):
         if phi < 0:
             phi = 0
         self.phi = phi
+        phi = phi * self.spectralGain  # Effective flux
         self.Ga1 = self._calcGa1(phi)
         self.Gf = self._calcGf(phi)
         self.Gb = self._calcGb(phi)
         self.Ga2 = self._calcGa2(phi)
+        self._scalePhotoRates()
         if config.verbose > 1:
             self.dispRates()
 
@@ -816,9 +1232,6 @@ class RhO_6states(RhodopsinModel):
         gam = self.gam
         return O1 + gam * O2
 
-    def calcSoln(self, t, s0=None):
-        raise NotImplementedError(self.nStates)
-
 
 models = {
     '3': RhO_3states, 3: RhO_3states,
@@ -838,3 +1251,224 @@ def selectModel(nStates):
     else:
         print("Error in selecting model - please choose from 3, 4 or 6 states")
         raise NotImplementedError(nStates)
+
+
+# Stateless simulation core #
+# These functions take a FrozenModel and do not modify it so they are safe to
+# call concurrently from threads or processes.
+
+
+def calcRates(model, phi):
+    """
+    Calculate the transition rates of a frozen model.
+
+    Parameters
+    ----------
+    model : FrozenModel
+        Model parameters (which may be arrays of per-cell values).
+    phi : float or array-like
+        Flux [ph./mm^2/s] (before scaling by the spectral gain).
+
+    Returns
+    -------
+    dict(str: float or ndarray)
+        Photosensitive and constant rates [1/ms].
+    """
+    phi = np.maximum(phi, 0) * model.spectralGain
+    fT = model.calcfT(model.T)
+    rates = {rate: getattr(model, func)(phi) * fT[rate]
+             for rate, func in zip(model.photoRates, model.photoFuncs)}
+    rates.update({rate: getattr(model, rate) * fT[rate]
+                  for rate in model.constRates})
+    return rates
+
+
+def calcRateMatrix(model, rates):
+    """Calculate the rate matrix of a frozen model from its transition rates."""
+    return model._model.jacobian(FrozenModel(model._model, rates), None, 0)
+
+
+def calcRateMatrices(model, phis):
+    """Calculate the rate matrices (N x nStates x nStates) of N cells."""
+    rates = list(itertools.chain(model.photoRates, model.constRates))
+    values = calcRates(model, phis)
+    values = np.array([np.broadcast_to(values[rate], np.shape(phis))
+                       for rate in rates])
+    # The rate matrix is linear in the transition rates
+    basis = [calcRateMatrix(model, {other: float(other == rate) for other in rates})
+             for rate in rates]
+    return np.einsum('r...,rij->...ij', values, np.array(basis))
+
+
+def _solveConstant(eigenSystem, s0, t):
+    """Exact solution of ds/dt = A s from s0 at times t (starting at 0)
+    from the decomposition of A (see :meth:`EigenCache.get`)."""
+    lams, vecs, vecsInv, x_ss = eigenSystem
+    total = s0.sum()
+    x_ss = x_ss * total
+    c = vecsInv @ (s0[:-1] - x_ss)
+    x = x_ss + ((np.exp(np.outer(t, lams)) * c) @ vecs.T).real
+    return np.column_stack((x, total - x.sum(axis=1)))
+
+
+def _addStats(stats, nSteps, nRHS, nJac):
+    stats['nSteps'] = stats.get('nSteps', 0) + int(nSteps)
+    stats['nRHS'] = stats.get('nRHS', 0) + int(nRHS)
+    stats['nJac'] = stats.get('nJac', 0) + int(nJac)
+    stats['nIntegrations'] = stats.get('nIntegrations', 0) + 1
+
+
+def _odeint(fun, jac, s0, t, breaks, stats):
+    """Integrate at the times t with odeint, restarting at the breaks.
+
+    Each segment ends exactly at its break (passed as ``tcrit``) so that the
+    integrator cannot step over a short pulse or discontinuity.
+    """
+    solns, start = [s0[None, :]], t[0]
+    for b in np.r_[breaks[(breaks > t[0]) & (breaks < t[-1])], t[-1]]:
+        tOut = t[(t > start) & (t <= b)]
+        tSeg = np.r_[start, tOut] if len(tOut) and tOut[-1] == b else np.r_[start, tOut, b]
+        if stats is None:
+            soln = odeint(fun, s0, tSeg, Dfun=jac, tcrit=[b])
+        else:
+            soln, out = odeint(fun, s0, tSeg, Dfun=jac, tcrit=[b], full_output=True)
+            _addStats(stats, out['nst'][-1], out['nfe'][-1], out['nje'][-1])
+        solns.append(soln[1:len(tOut)+1])
+        s0, start = soln[-1], b
+    return np.vstack(solns)
+
+
+def _solveIVP(fun, jac, s0, t, breaks, method, rtol, atol, dense, stats):
+    """Integrate over [t[0], t[-1]] with solve_ivp, restarting at the breaks.
+
+    The solution is interpolated onto t if ``dense`` otherwise the solver's
+    steps are returned. The first row is always s0 at t[0].
+    """
+    bounds = [t[0]] + sorted(b for b in breaks if t[0] < b < t[-1]) + [t[-1]]
+    solns, ts = [s0[None, :]], [t[:1]]
+    for t0, t1 in zip(bounds[:-1], bounds[1:]):
+        sol = solve_ivp(lambda tt, s: fun(s, tt), (t0, t1), s0, method=method,
+                        jac=lambda tt, s: jac(s, tt), rtol=rtol, atol=atol,
+                        dense_output=dense)
+        if not sol.success:
+            warnings.warn(f"Integration failed: {sol.message}")
+        if dense:
+            tSeg = t[(t > t0) & (t <= t1)]
+            solns.append(sol.sol(tSeg).T if len(tSeg) else np.empty((0, len(s0))))
+        else:
+            tSeg = sol.t[1:]
+            solns.append(sol.y[:, 1:].T)
+        ts.append(tSeg)
+        s0 = sol.y[:, -1]
+        if stats is not None:
+            _addStats(stats, len(sol.t) - 1, sol.nfev, sol.njev)
+    return np.vstack(solns), np.concatenate(ts)
+
+
+def simulateTrial(model, phases, V, dt, s0=None, method='odeint', rtol=1e-6,
+                  atol=1e-9, dense=True, sampling=None, stats=None, cache=None):
+    """
+    Simulate a voltage-clamped trial of a frozen model.
+
+    This is a pure function: the model is not modified and no state is
+    stored, so trials may be run concurrently (e.g. with an executor from
+    ``concurrent.futures``). Only the (thread-safe) ``cache`` of rate-matrix
+    decompositions is shared between them.
+
+    Parameters
+    ----------
+    model : FrozenModel
+        Model parameters (see :meth:`RhodopsinModel.freeze`).
+    phases : list((float, float or callable))
+        Duration [ms] and flux [ph./mm^2/s] of each phase. Constant fluxes
+        are solved exactly (if the model's ``useAnalyticSoln``) while a
+        function of (trial) time, ``phi(t)``, is integrated numerically
+        and restarted at its ``breakpoints`` (if defined).
+    V : float
+        Clamp voltage [mV].
+    dt : float
+        Time step [ms] (rounded so that each phase is a whole number of steps).
+    s0 : array-like, optional
+        Initial state (defaults to ``s_0``).
+    method : str, optional
+        'odeint' or a ``solve_ivp`` method ('LSODA', 'Radau' or 'BDF') to
+        integrate every phase adaptively.
+    rtol, atol : float, optional
+        Tolerances of the adaptive integrator.
+    dense : bool, optional
+        Interpolate the adaptive solution onto the ``dt`` grid, otherwise
+        return the solver's steps.
+    sampling : PhaseSampling, optional
+        Output resolution policy for phases of constant flux (see
+        :class:`~pyrho.protocols.PhaseSampling`).
+    stats : dict, optional
+        Accumulates the integrator statistics: ``nSteps``, ``nRHS``, ``nJac``
+        and ``nIntegrations``.
+    cache : EigenCache, optional
+        Decompositions to reuse across trials e.g. the model's own (used by
+        :meth:`RhodopsinModel.simulate`). Otherwise they are only shared
+        between the phases of the trial.
+
+    Returns
+    -------
+    TrialResult
+        Times [ms], states and photocurrent [nA].
+    """
+    s = np.array(model.s_0 if s0 is None else s0, dtype=float)
+    ts, states = [np.zeros(1)], [s[None, :]]
+    start = 0.
+    if cache is None:
+        cache = EigenCache()
+    for Dt, phi in phases:
+        n = int(round(Dt / dt))
+        if n == 0:
+            continue
+        t = start + Dt * np.arange(n + 1) / n
+        if callable(phi):
+            def jacobian(s, tt, phi=phi):
+                return calcRateMatrix(model, calcRates(model, float(phi(tt))))
+            breaks = np.asarray(getattr(phi, 'breakpoints', []), dtype=float)
+        else:
+            A = calcRateMatrix(model, calcRates(model, phi))
+            eigen = None
+            if method == 'odeint' and model.useAnalyticSoln:
+                eigen = cache.get(A)
+            jacobian = lambda s, tt, A=A: A
+            breaks = np.zeros(0)
+        derivative = lambda s, tt, jacobian=jacobian: jacobian(s, tt) @ s
+
+        if method != 'odeint':
+            def solve(s, t):
+                return _solveIVP(derivative, jacobian, s, t, breaks, method,
+                                 rtol, atol, dense, stats)
+        elif callable(phi) or eigen is None:
+            def solve(s, t):
+                return _odeint(derivative, jacobian, s, t, breaks, stats), t
+        else:
+            def solve(s, t):
+                return _solveConstant(eigen, s, t - t[0]), t
+
+        if callable(phi) or sampling is None or Dt <= sampling.Dt_fine:
+            soln, t = solve(s, t)
+        else:  # Fine sampling after the transition until the states settle
+            solns, tSamples = [s[None, :]], [t[:1]]
+            i, s_i = 0, s
+            while i < n:
+                j = max(i+2, np.searchsorted(t, t[i]+sampling.Dt_fine, side='right'))
+                soln, tSeg = solve(s_i, t[i:j])
+                solns.append(soln[1:])
+                tSamples.append(tSeg[1:])
+                s_i, i = soln[-1], j-1
+                if i < n and sampling.isSettled(A @ s_i):
+                    soln, tSeg = solve(s_i, sampling.coarseGrid(t[i], t[-1], dt))
+                    solns.append(soln[1:])
+                    tSamples.append(tSeg[1:])
+                    break
+            soln, t = np.vstack(solns), np.concatenate(tSamples)
+        ts.append(t[1:])
+        states.append(soln[1:])
+        s, start = soln[-1], t[-1]
+    t, states = np.concatenate(ts), np.vstack(states)
+    if np.isnan(states).any():
+        warnings.warn('The state solution is undefined!')
+    return TrialResult(t, states, model.calcI(V, states))
@@ -545,9 +545,7 @@ class PyRhOparameter(Parameter):
 
 
 ### Protocols to be included in the next version:
-### - Temperature (Q10)
 ### - pH (intracellular and extracellular)
-### - Wavelength (lambda)
 
 protParams = {
     'step': PyRhOparameters(),
@@ -726,6 +724,10 @@ simParamNotes['expProb'] = 'Expresssion probability'
 simParamNotes['v_init'] = 'Initialisation voltage'
 simParamNotes['CVode'] = 'Use variable timestep integrator'
 simParamNotes['dt'] = 'Numerical integration timestep'
+simParamNotes['integrator'] = 'odeint (fixed output grid) or adaptive solve_ivp method: LSODA, Radau or BDF'
+simParamNotes['rtol'] = 'Relative tolerance (adaptive integrators)'
+simParamNotes['atol'] = 'Absolute tolerance (adaptive integrators)'
+simParamNotes['dense'] = 'Interpolate onto dt (or return the solver steps)'
 
 simParams = {
     'Python': PyRhOparameters(),
@@ -735,7 +737,13 @@ simParams = {
 simList = list(simParams)
 
 
-simParams['Python'].add_many(('dt', 0.1, 0, None))  # 'ms'
+simParams['Python'].add_many(
+    ('dt',         0.1,      0,     None),   # 'ms'
+    ('integrator', 'odeint', None,  None),   # 'odeint', 'LSODA', 'Radau' or 'BDF'
+    ('rtol',       1e-6,     0,     None),
+    ('atol',       1e-9,     0,     None),
+    ('dense',      True,     False, True)
+)
 
 # atol
 simParams['NEURON'].add_many(
@@ -25,15 +25,82 @@ from pyrho.expdata import *  # import loadData
 from pyrho.fitting import (fitFV, errFV, fitfV, errfV,
                            getRecoveryPeaks, fitRecovery)
 from pyrho.models import *
+from pyrho.waveforms import *
 from pyrho.simulators import *  # For characterise()
 from pyrho.config import *
 from pyrho import config
 
-__all__ = ['protocols', 'selectProtocol', 'characterise']
+__all__ = ['protocols', 'selectProtocol', 'characterise', 'PhaseSampling']
 
 logger = logging.getLogger(__name__)
 
 
+class PhaseSampling(object):
+    """
+    Output resolution policy for phases of constant (or no) illumination.
+
+    Each phase is sampled every ``dt`` for ``Dt_fine`` [ms] after a light
+    transition. Once the largest state derivative falls below ``tol``
+    [1/ms], the rest of the phase is sampled coarsely, with the step either
+    growing geometrically from ``dt`` up to ``dt_max`` (``spacing='log'``) or
+    fixed at ``dt_max`` (``spacing='linear'``). Assign an instance to a
+    protocol's ``sampling`` attribute to use it, e.g. for the long dark
+    intervals of the ``recovery`` protocol::
+
+        prot = protocols['recovery']()
+        prot.sampling = PhaseSampling(Dt_fine=20, dt_max=10)
+
+    Parameters
+    ----------
+    Dt_fine : float
+        Duration [ms] of full resolution sampling after each transition.
+    dt_max : float
+        Largest output step [ms].
+    tol : float
+        Settling tolerance on the state derivatives [1/ms].
+    spacing : str
+        'log' or 'linear' sampling once settled.
+    growth : float
+        Factor by which successive steps grow for ``spacing='log'``.
+    """
+
+    def __init__(self, Dt_fine=20, dt_max=10, tol=1e-3, spacing='log', growth=1.1):
+        if spacing not in ('log', 'linear'):
+            raise ValueError("Unknown spacing: '{}'! Choose from 'log' or 'linear'".format(spacing))
+        assert Dt_fine > 0 and dt_max > 0 and growth > 1
+        self.Dt_fine = Dt_fine
+        self.dt_max = dt_max
+        self.tol = tol
+        self.spacing = spacing
+        self.growth = growth
+
+    def __repr__(self):
+        return ("PhaseSampling(Dt_fine={}, dt_max={}, tol={}, spacing='{}')"
+                .format(self.Dt_fine, self.dt_max, self.tol, self.spacing))
+
+    def isSettled(self, dsdt):
+        """Return ``True`` if the state derivatives are below tolerance."""
+        return np.max(np.abs(dsdt)) < self.tol
+
+    def coarseGrid(self, start, end, dt):
+        """Return the (coarse) output times from ``start`` to ``end`` [ms]
+        inclusive for a settled phase sampled at ``dt`` [ms] until now."""
+        dt_max = max(dt, self.dt_max)
+        if self.spacing == 'log':
+            # Steps growing geometrically from dt to dt_max then constant
+            nGrow = int(np.ceil(np.log(dt_max/dt) / np.log(self.growth)))
+            steps = np.minimum(dt * self.growth**np.arange(1, nGrow+1), dt_max)
+            t = start + np.cumsum(steps)
+            t = t[t < end]
+            last = t[-1] if len(t) else start
+        else:
+            t = np.array([])
+            last = start
+        nSteps = int(np.ceil((end - last) / dt_max))
+        tail = np.linspace(last, end, nSteps+1, endpoint=True)[1:]
+        return np.concatenate(([start], t, tail))
+
+
 class Protocol(PyRhOobject):  # , metaclass=ABCMeta
     """Common base class for all protocols."""
 
@@ -57,11 +124,16 @@ class Protocol(PyRhOobject):  # , metaclass=ABCMeta
         self.plotPeakRecovery = False
         self.plotStateVars = False
         self.plotKinetics = False
+        self._stimCache = {}
+        self.sampling = None  # Uniform sampling at dt (or a PhaseSampling)
         self.setParams(params)
         self.prepare()
         self.t_start, self.t_end = 0, self.Dt_total
         self.phi_ts = None
         self.lam = 470  # Default wavelength [nm]
+        self.lams = None  # Wavelengths [nm] to sweep in spectral simulations
+        self.T = None  # Temperature [degC] (None: keep the model's temperature)
+        self.Ts = None  # Temperatures [degC] to sweep in batched simulations
         self.PD = None
         self.Ifig = None
 
@@ -120,6 +192,7 @@ class Protocol(PyRhOobject):  # , metaclass=ABCMeta
         self.Vs.sort(reverse=True)
         self.nVs = len(self.Vs)
 
+        self._stimCache = {}
         self.extraPrep()
         return
 
@@ -138,11 +211,20 @@ class Protocol(PyRhOobject):  # , metaclass=ABCMeta
     def finish(self, PC, RhO):
         pass
 
+    def getRequirements(self):
+        """Simulator capabilities required by the protocol (see ``Simulator.capabilities``)."""
+        requires = set()
+        if any(V is None for V in self.Vs):  # Unclamped membrane potential
+            requires.add('membrane')
+        if self.T is not None:
+            requires.add('temperature')
+        return requires
+
     def getRunCycles(self, run):
         return (self.cycles, self.Dt_delay)
 
     def genPulseSet(self, genPulse=None):
-        """Function to generate a set of spline functions to phi(t) simulations."""
+        """Function to generate a set of phi(t) functions (waveforms) for simulations."""
         if genPulse is None:  # Default to square pulse generator
             genPulse = self.genPulse
         phi_ts = [[[None for pulse in range(self.nPulses)] for phi in range(self.nPhis)] for run in range(self.nRuns)]
@@ -153,13 +235,13 @@ class Protocol(PyRhOobject):  # , metaclass=ABCMeta
                 for pInd, pulse in enumerate(pulses):
                     phi_ts[run][phiInd][pInd] = genPulse(run, phi, pulse)
         self.phi_ts = phi_ts
+        self._stimCache = {}  # Invalidate stimulus arrays
         return phi_ts
 
     def genPulse(self, run, phi, pulse):
-        """Default interpolation function for square pulses."""
+        """Default waveform for square pulses."""
         pStart, pEnd = pulse
-        phi_t = spline([pStart, pEnd], [phi, phi], k=1, ext=1)
-        return phi_t
+        return Step(pStart, pEnd, phi)
 
     def genPlottingStimuli(self, genPulse=None, vInd=0):
         """Redraw stimulus functions in case data has been realigned."""
@@ -180,43 +262,63 @@ class Protocol(PyRhOobject):  # , metaclass=ABCMeta
         #self.phi_ts = self.genPulseSet()
         return phi_ts
 
-    def getStimArray(self, run, phiInd, dt):  # phi_ts, Dt_delay, cycles, dt):
+    def getStimArray(self, run, phiInd, dt, t=None):  # phi_ts, Dt_delay, cycles, dt):
         """Return a stimulus array (not spline) with the same sampling rate as
         the photocurrent.
+
+        The array is independent of V so it is computed once per (run, phi, dt)
+        and cached. It is returned read-only so that it may be shared by the
+        PhotoCurrents of every V trial. If the photocurrent's time array ``t``
+        is passed (e.g. when it is non-uniform), the stimulus is evaluated at
+        those times instead (without caching).
         """
 
+        if t is not None:
+            return self._evalStimArray(run, phiInd, t)
+
+        key = (run, phiInd, dt)
+        if key in self._stimCache:
+            return self._stimCache[key]
+
         cycles, Dt_delay = self.getRunCycles(run)
         phi_ts = self.phi_ts[run][phiInd][:]
 
         nPulses = cycles.shape[0]
         assert len(phi_ts) == nPulses
 
-        #start, end = RhO.t[0], RhO.t[0]+Dt_delay #start, end = 0.00, Dt_delay
-        start, end = 0, Dt_delay
-        nSteps = int(round(((end-start)/dt)+1))
-        t = np.linspace(start, end, nSteps, endpoint=True)
-        phi_tV = np.zeros_like(t)
-        #_idx_pulses_ = np.empty([0,2],dtype=int) # Light on and off indexes for each pulse
+        # Number of samples in each phase (matching the simulators' time arrays)
+        pulses, _ = cycles2times(cycles, Dt_delay)
+        nDelay = int(round(Dt_delay/dt)) + 1
+        nPulseSteps = [int(round((cycles[p, 0] + cycles[p, 1])/dt)) for p in range(nPulses)]
+        phi_tV = np.zeros(nDelay + sum(nPulseSteps))
 
+        ind = nDelay
         for p in range(nPulses):
-            start = end
-            Dt_on, Dt_off = cycles[p, 0], cycles[p, 1]
-            end = start + Dt_on + Dt_off
-            nSteps = int(round(((end-start)/dt)+1))
-            tPulse = np.linspace(start, end, nSteps, endpoint=True)
-            phi_t = phi_ts[p]
-            phiPulse = phi_t(tPulse)  # -tPulse[0] # Align time vector to 0 for phi_t to work properly
-
-            #onInd = len(t) - 1 # Start of on-phase
-            #offInd = onInd + int(round(Dt_on/dt))
-            #_idx_pulses_ = np.vstack((_idx_pulses_, [onInd,offInd]))
-
-            #t = np.r_[t, tPulse[1:]]
-
-            phi_tV = np.r_[phi_tV, phiPulse[1:]]
-
-        phi_tV[np.ma.where(phi_tV < 0)] = 0  # Safeguard for negative phi values
-        return phi_tV  #, t, _idx_pulses_
+            start = pulses[p, 0]
+            end = start + cycles[p, 0] + cycles[p, 1]
+            tPulse = np.linspace(start, end, nPulseSteps[p]+1, endpoint=True)
+            phi_tV[ind:ind+nPulseSteps[p]] = phi_ts[p](tPulse[1:])
+            ind += nPulseSteps[p]
+
+        np.clip(phi_tV, 0, None, out=phi_tV)  # Safeguard for negative phi values
+        phi_tV.flags.writeable = False
+        self._stimCache[key] = phi_tV
+        return phi_tV
+
+    def _evalStimArray(self, run, phiInd, t):
+        """Evaluate the stimulus at arbitrary times t [ms]."""
+        cycles, Dt_delay = self.getRunCycles(run)
+        phi_ts = self.phi_ts[run][phiInd][:]
+        pulses, _ = cycles2times(cycles, Dt_delay)
+        t = np.asarray(t)
+        phi_tV = np.zeros(len(t))
+        for p, phi_t in enumerate(phi_ts):
+            start = pulses[p, 0]
+            end = start + cycles[p, 0] + cycles[p, 1]
+            inPulse = (t > start) & (t <= end)
+            phi_tV[inPulse] = phi_t(t[inPulse])
+        np.clip(phi_tV, 0, None, out=phi_tV)  # Safeguard for negative phi values
+        return phi_tV
 
     def plot(self, plotStateVars=False):
         """Plot protocol."""
@@ -461,14 +563,9 @@ class protSinusoid(Protocol):
 
     def genPulse(self, run, phi, pulse):
         pStart, pEnd = pulse
-        Dt_on = pEnd - pStart
-        t = np.linspace(0.0, Dt_on, int(round((Dt_on*self.sr/1000))+1), endpoint=True)  # Create smooth series of time points to interpolate between
-        if self.startOn:  # Generalise to phase offset
-            phi_t = spline(pStart + t, self.phi0[run] + 0.5*phi*(1+np.cos(self.ws[run]*t)), ext=1, k=5)
-        else:
-            phi_t = spline(pStart + t, self.phi0[run] + 0.5*phi*(1-np.cos(self.ws[run]*t)), ext=1, k=5)
-
-        return phi_t
+        # TODO: Generalise startOn to phase offset
+        return Cosine(pStart, pEnd, phi, self.phi0[run], w=self.ws[run],
+                      startOn=self.startOn)
 
     def createLayout(self, Ifig=None, vInd=0):
         if Ifig is None:
@@ -720,18 +817,8 @@ class protChirp(Protocol):
 
     def genPulse(self, run, phi, pulse):
         pStart, pEnd = pulse
-        Dt_on = pEnd - pStart
-        t = np.linspace(0.0, Dt_on, (Dt_on*self.sr/1000)+1, endpoint=True)  # Create smooth series of time points to interpolate between
-        if self.linear:  # Linear sweep
-            ft = self.f0 + (self.fT-self.f0)*(t/Dt_on)
-        else:           # Exponential sweep
-            ft = self.f0 * (self.fT/self.f0)**(t/Dt_on)
-        ft /= 1000  # Convert to frequency in ms
-        if self.startOn:
-            phi_t = spline(pStart + t, self.phi0[run] + 0.5*phi*(1+np.cos(ft*t)), ext=1, k=5)
-        else:
-            phi_t = spline(pStart + t, self.phi0[run] + 0.5*phi*(1-np.cos(ft*t)), ext=1, k=5)
-        return phi_t
+        return Chirp(pStart, pEnd, phi, self.phi0[run], f0=self.f0, fT=self.fT,
+                     linear=self.linear, startOn=self.startOn)
 
     def createLayout(self, Ifig=None, vInd=0):
         if Ifig is None:
@@ -823,12 +910,11 @@ class protRamp(Protocol):
             self.axI = Ifig.add_subplot(111)
 
     def genPulse(self, run, phi, pulse):
-        """Generate spline for a particular pulse. phi0 is the offset so
+        """Generate the waveform for a particular pulse. phi0 is the offset so
         decreasing ramps can be created with negative phi values.
         """
         pStart, pEnd = pulse
-        phi_t = spline([pStart, pEnd], [self.phi0, self.phi0+phi], k=1, ext=1)
-        return phi_t
+        return Ramp(pStart, pEnd, phi, self.phi0)
 
 
 class protDelta(Protocol):
@@ -1416,9 +1502,7 @@ def selectProtocol(protocol, params=None, saveData=True):
 
 
 # Protocols to be included in the next version:
-# - Temperature (Q10)
 # - pH (intracellular and extracellular)
-# - Wavelength (lambda)
 
 
 def characterise(RhO):
@@ -9,11 +9,13 @@ import warnings
 import logging
 import os
 import copy
+import functools
 import abc
+import hashlib
+import re
 from collections import OrderedDict
 
 import numpy as np
-from scipy.integrate import odeint
 import matplotlib as mpl
 from matplotlib import pyplot as plt
 
@@ -22,24 +24,46 @@ from pyrho.parameters import PyRhOobject, modelUnits, ms
 from pyrho.utilities import *  # cycles2times, plotLight
 from pyrho.expdata import *
 from pyrho.models import *
+from pyrho.models import calcRateMatrices
+from pyrho.waveforms import Waveform
 from pyrho.config import *  # verbose
 from pyrho.config import wall_time, _DASH_LINE, _DOUB_DASH_LINE
 from pyrho import config
 
-__all__ = ['simulators']
+__all__ = ['simulators', 'NEURONsession', 'selectSimulator']
 
 logger = logging.getLogger(__name__)
 
 
 class Simulator(PyRhOobject):  # object
-    """Common base class for all simulators."""
+    """
+    Common base class for all simulators.
+
+    Each simulator declares the features it implements in ``capabilities``:
+        * ``batch`` simulates every trial of a protocol with ``runBatch``
+        * ``squarePulse`` has a fast path (``runTrial``) for square pulses
+        * ``adaptive`` can integrate with adaptive time steps
+        * ``membrane`` integrates the membrane potential of a cell
+        * ``parallel`` can distribute trials over threads
+        * ``spectral`` applies the action spectrum of the model
+        * ``temperature`` applies the temperature scaling of the model
+
+    These are used by :func:`selectSimulator` to choose a simulator which
+    satisfies the requirements of a protocol. It then ranks them by their
+    ``costs``: the time taken by ``runBatch`` relative to ``simPython`` for
+    protocols of square pulses (``squarePulse``) or other waveforms
+    (``waveform``), as measured by the ``TimeBackends`` benchmark.
+    """
 
     __metaclass__ = abc.ABCMeta
 
     Prot = None
     RhO = None
     simulator = None
+    capabilities = frozenset()
+    costs = {}  # Relative cost of runBatch for each kind of stimulus (unknown if missing)
     clampProts = ['rectifier']
+    sink = None  # Callable receiving instrumentation records e.g. RecordSink()
 
     @abc.abstractmethod
     def __init__(self, Prot, RhO, params=None):
@@ -53,6 +77,70 @@ class Simulator(PyRhOobject):  # object
     def runTrialPhi_t(self, RhO, phi_ts, V, Dt_delay, cycles, dt, verbose=config.verbose):
         pass
 
+    def runBatch(self, verbose=config.verbose, **options):
+        """
+        Simulate every trial of the protocol and return its data.
+
+        Every simulator with the ``batch`` capability takes ``verbose``
+        followed by its own keyword options:
+            * Python: ``executor`` to map the trials over
+            * NEURON: the number of threads, ``nthread``
+            * Brian: the integration ``method`` and ``standalone`` mode
+
+        Returns
+        -------
+        ProtocolData
+            The protocol's data (also stored as ``Prot.PD``).
+        """
+        raise NotImplementedError("The {} simulator does not support batches!"
+                                  .format(self.simulator))
+
+    @classmethod
+    def supports(cls, *capabilities):
+        """Return True if the simulator has all of the given capabilities."""
+        return set(capabilities) <= cls.capabilities
+
+    @classmethod
+    def getCost(cls, Prot):
+        """Relative cost of simulating the protocol (``None`` if unknown)."""
+        return cls.costs.get('squarePulse' if Prot.squarePulse else 'waveform')
+
+    @staticmethod
+    def trialInfo(V, Dt_delay, cycles, phiOn=None):
+        """Describe the stimulation of a trial (for verbose output)."""
+        info = "Simulating experiment "
+        if phiOn is not None:
+            info += "at phi = {:.3g}photons/mm^2/s, ".format(phiOn)
+        if V is not None:
+            info += "V = {:+}mV, ".format(V)
+        info += "pulse cycles: [Dt_delay={:.4g}ms".format(Dt_delay)
+        for Dt_on, Dt_off in cycles:
+            info += "; [Dt_on={:.4g}ms; Dt_off={:.4g}ms]".format(Dt_on, Dt_off)
+        return info + "]"
+
+    @staticmethod
+    def getSteadyStates(RhO, pulses, phiOn=None, phi_ts=None):
+        """
+        Steady-states of each pulse's flux: ``phiOn`` for square pulses,
+        otherwise the value of its function ``phi_t`` at the end of the pulse.
+        """
+        if phi_ts is None:
+            phis = [phiOn] * len(pulses)
+        else:
+            phis = [phi_t(off) for phi_t, (on, off) in zip(phi_ts, pulses)]
+        return [RhO.calcSteadyState(phi) for phi in phis]
+
+    def storePulses(self, RhO, t, pulses, phiOn=None, phi_ts=None):
+        """
+        Store the indices of the samples of ``t`` nearest to the on and off
+        times of each pulse (``RhO.pulseInd``) and the steady-states of their
+        fluxes (``RhO.ssInf``, see :meth:`getSteadyStates`).
+        """
+        t = np.asarray(t)
+        RhO.pulseInd = np.array([[np.abs(t - on).argmin(), np.abs(t - off).argmin()]
+                                 for on, off in pulses], dtype=int).reshape(-1, 2)
+        RhO.ssInf = self.getSteadyStates(RhO, pulses, phiOn, phi_ts)
+
     def __str__(self):
         return self.simulator
 
@@ -81,6 +169,53 @@ class Simulator(PyRhOobject):  # object
     def initialise(self):
         pass
 
+    def checkModel(self, RhO):
+        """Warn about model features which the simulator does not apply."""
+        if RhO.spectralGain != 1 and 'spectral' not in self.capabilities:
+            warnings.warn("The action spectrum is not applied by the {} simulator!"
+                          .format(self.simulator))
+        if (RhO.T is not None and RhO.T != RhO.T_ref
+                and 'temperature' not in self.capabilities):
+            warnings.warn("Temperature scaling is not applied by the {} simulator!"
+                          .format(self.simulator))
+
+    def initData(self, Prot):
+        """Create the protocol's data container (``Prot.PD``) for a new run."""
+        Prot.PD = ProtocolData(Prot.protocol, Prot.nRuns, Prot.phis, Prot.Vs)
+        Prot.PD.I_peak_ = [[[None for v in range(Prot.nVs)] for p in range(Prot.nPhis)] for r in range(Prot.nRuns)]
+        Prot.PD.I_ss_ = [[[None for v in range(Prot.nVs)] for p in range(Prot.nPhis)] for r in range(Prot.nRuns)]
+        if hasattr(Prot, 'runLabels'):
+            Prot.PD.runLabels = Prot.runLabels
+        return Prot.PD
+
+    def storeTrial(self, run, phiInd, vInd, PC):
+        """Store a trial's photocurrent in the protocol's data."""
+        PD = self.Prot.PD
+        PD.trials[run][phiInd][vInd] = PC
+        PD.I_peak_[run][phiInd][vInd] = PC.I_peak_
+        PD.I_ss_[run][phiInd][vInd] = PC.I_ss_
+
+    def finish(self):
+        """Reset any variables overridden by the protocol."""
+        if hasattr(self, 'dt_prev') and self.dt_prev is not None:
+            self.dt, self.dt_prev = self.dt_prev, None
+
+    def _trackMemory(self):
+        """Return the memory peak since the last call (see :func:`memoryPeak`)
+        and update the running peak of the protocol."""
+        peak = memoryPeak(reset=True)
+        if peak is not None:
+            self._memPeak = max(peak, self._memPeak or 0)
+        return peak
+
+    def _emit(self, record):
+        """Pass an instrumentation record to the sink (if set)."""
+        if self.sink is not None:
+            record.update({'simulator': self.simulator,
+                           'protocol': self.Prot.protocol,
+                           'model': self.RhO.nStates})
+            self.sink(record)
+
     def run(self, verbose=config.verbose):
         """Main routine to run the simulation protocol."""
         # TODO: Use joblib to cache results https://pythonhosted.org/joblib/
@@ -88,8 +223,15 @@ class Simulator(PyRhOobject):  # object
         t0 = wall_time()
         RhO = self.RhO
         Prot = self.Prot
+        self._memPeak = None
+        if self.sink is not None:
+            memoryPeak(reset=True)  # Only measure this protocol
 
         self.prepare(Prot)
+        RhO.setWavelength(Prot.lam)
+        if Prot.T is not None:
+            RhO.setTemperature(Prot.T)
+        self.checkModel(RhO)
 
         if verbose > 0:
             #print("\n================================================================================")
@@ -104,11 +246,7 @@ class Simulator(PyRhOobject):  # object
             print(prot_details)
             logger.info(prot_details)
 
-        Prot.PD = ProtocolData(Prot.protocol, Prot.nRuns, Prot.phis, Prot.Vs)
-        Prot.PD.I_peak_ = [[[None for v in range(Prot.nVs)] for p in range(Prot.nPhis)] for r in range(Prot.nRuns)]
-        Prot.PD.I_ss_ = [[[None for v in range(Prot.nVs)] for p in range(Prot.nPhis)] for r in range(Prot.nRuns)]
-        if hasattr(Prot, 'runLabels'):
-            Prot.PD.runLabels = Prot.runLabels
+        self.initData(Prot)
 
         if verbose > 1:
             Prot.printParams()
@@ -128,50 +266,68 @@ class Simulator(PyRhOobject):  # object
                     # N.B. solution variables are not currently dependent on V
 
                     # Reset simulation environment...
+                    t_start = wall_time()
                     self.initialise()
+                    self._trialStats = {}
+                    t_solve = wall_time()
 
                     # TODO: Deprecate special square pulse fucntions
-                    if Prot.squarePulse and self.simulator == 'Python':
+                    if Prot.squarePulse and 'squarePulse' in self.capabilities:
                         I_RhO, t, soln = self.runTrial(RhO, phiOn, V, Dt_delay, cycles, self.dt, verbose)
                     else:  # Arbitrary functions of time: phi(t)
                         phi_ts = Prot.phi_ts[run][phiInd][:]
                         I_RhO, t, soln = self.runTrialPhi_t(RhO, phi_ts, V, Dt_delay, cycles, self.dt, verbose)
+                    t_integrate = wall_time()
 
                     stim = Prot.getStimArray(run, phiInd, self.dt)
+                    if len(stim) != len(t):  # Non-uniform time array
+                        stim = Prot.getStimArray(run, phiInd, self.dt, t=t)
+                    t_stimulus = wall_time()
                     PC = PhotoCurrent(I_RhO, t, pulses, phiOn, V, stimuli=stim,
                                       states=soln, stateLabels=RhO.stateLabels,
                                       label=Prot.protocol)
+                    t_photocurrent = wall_time()
                     #PC.alignToTime()
 
                     PC.ssInf = np.array(RhO.ssInf)
-                    Prot.PD.trials[run][phiInd][vInd] = PC
-                    Prot.PD.I_peak_[run][phiInd][vInd] = PC.I_peak_
-                    Prot.PD.I_ss_[run][phiInd][vInd] = PC.I_ss_
+                    self.storeTrial(run, phiInd, vInd, PC)
 
                     self.saveExtras(run, phiInd, vInd)
 
+                    if self.sink is not None:
+                        t_extras = wall_time()
+                        record = {'event': 'trial', 'run': run,
+                                  'phiInd': phiInd, 'vInd': vInd,
+                                  'phi': phiOn, 'V': V,
+                                  'nSamples': len(t),
+                                  'initialise': t_solve - t_start,
+                                  'integration': t_integrate - t_solve,
+                                  'stimulus': t_stimulus - t_integrate,
+                                  'photocurrent': t_photocurrent - t_stimulus,
+                                  'extras': t_extras - t_photocurrent,
+                                  'total': t_extras - t_start,
+                                  'memPeak': self._trackMemory()}
+                        record.update(self._trialStats)
+                        self._emit(record)
+
                     if verbose > 1:
                         prot_details = 'Run=#{}/{}; phiInd=#{}/{}; vInd=#{}/{}; Irange=[{:.3g},{:.3g}]'.format(run, Prot.nRuns, phiInd, Prot.nPhis, vInd, Prot.nVs, PC.I_range_[0], PC.I_range_[1])
                         print(prot_details)
                         logger.debug(prot_details)
 
         Prot.finish(PC, RhO)
-        # self.finish() # Reset dt and Vclamp
+        self.finish()  # Reset dt and Vclamp
 
         if Prot.saveData:
             Prot.dataTag = str(RhO.nStates)+"s"
             saveData(Prot.PD, Prot.protocol+Prot.dataTag)
 
-        # Reset any variables overridden by the protocol
-        if hasattr(self, 'dt_prev') and self.dt_prev is not None:
-            self.dt, self.dt_prev = self.dt_prev, None
-
-        # TODO: Move Vclamp reset to NEURON simulator in self.finish()
-        if hasattr(self, 'Vclamp_prev') and self.Vclamp_prev is not None:
-            self.Vclamp, self.Vclamp_prev = self.Vclamp_prev, None
-            self.h.Vcl.rs = 1e9  # TODO; Find a way to fully remove SEClamp
-
         self.runTime = wall_time() - t0
+        if self.sink is not None:
+            self._trackMemory()  # Include the protocol's post-processing
+        self._emit({'event': 'protocol', 'nRuns': Prot.nRuns,
+                    'nPhis': Prot.nPhis, 'nVs': Prot.nVs,
+                    'total': self.runTime, 'memPeak': self._memPeak})
         if verbose > 0:
             prot_info = "\nFinished '{}' protocol with {} for the {} model in"\
                         " {:.3g}s".format(Prot, self, RhO, self.runTime)
@@ -194,39 +350,78 @@ class Simulator(PyRhOobject):  # object
 
 
 class simPython(Simulator):
-    """Class for channel level simulations with Python."""
+    """
+    Class for channel level simulations with Python.
+
+    Trials are simulated from a snapshot of the model by
+    :func:`pyrho.models.simulateTrial`. By default the states are
+    integrated with ``odeint`` on a fixed grid with step ``dt`` (or
+    calculated analytically where available). Setting
+    the ``integrator`` parameter to a ``solve_ivp`` method ('LSODA', 'Radau'
+    or 'BDF') selects adaptive integration: each phase is integrated
+    separately so that light on/off times (and waveform breakpoints) are
+    hard breakpoints, and the solver chooses its own steps within them.
+    The solution is then either interpolated onto the ``dt`` grid
+    (``dense=True``) or returned at the solver's steps (``dense=False``),
+    which gives a non-uniform time array with far fewer samples in slowly
+    changing phases (e.g. the long dark intervals of the ``recovery``
+    protocol).
+    """
 
     simulator = 'Python'
+    capabilities = frozenset(['batch', 'squarePulse', 'adaptive', 'parallel',
+                              'spectral', 'temperature'])
+    costs = {'squarePulse': 1.0, 'waveform': 1.0}  # The reference
+    integrators = ['odeint', 'LSODA', 'Radau', 'BDF']
 
     def __init__(self, Prot, RhO, params=simParams['Python']):
+        # Parameter sets from before adaptive integration may only set dt
+        defaults = {'integrator': 'odeint', 'rtol': 1e-6, 'atol': 1e-9, 'dense': True}
+        for p in defaults:
+            if p in params:
+                defaults[p] = params[p].value
         self.dt = params['dt'].value
+        self.integrator = defaults['integrator']
+        if self.integrator not in self.integrators:
+            raise ValueError("Unknown integrator: '{}'! Choose from {}"
+                             .format(self.integrator, self.integrators))
+        self.rtol = defaults['rtol']
+        self.atol = defaults['atol']
+        self.dense = defaults['dense']
         self.Prot = Prot
         self.RhO = RhO
 
-    def runSoln(self, RhO, t):
-
-        if RhO.useAnalyticSoln:  # Leave the ability to manually override
-            logger.debug('Calculating solution analytically.')
-            try:
-                soln = RhO.calcSoln(t, RhO.states[-1, :])
-            except:  # Any exception e.g. NotImplementedError or ValueError
-                logger.debug('Falling back to numerical integration.')
-                soln = odeint(RhO.solveStates, RhO.states[-1, :], t,
-                              args=(None,), Dfun=RhO.jacobian)
-        else:
-            logger.debug('Calculating solution numerically.')
-            soln = odeint(RhO.solveStates, RhO.states[-1, :], t,
-                          args=(None,), Dfun=RhO.jacobian)
+    def getPhases(self, phiOn, phi_ts, Dt_delay, cycles):
+        """
+        Phases of a trial for :func:`pyrho.models.simulateTrial`.
 
-        if np.isnan(np.sum(soln)):  # np.any(np.isnan(soln)):
-            warnings.warn('The state solution is undefined!')
+        Square pulses of flux ``phiOn`` are used if ``phi_ts`` is ``None``,
+        otherwise each pulse is driven by its function ``phi_t``. Waveforms
+        are zero outside the pulse so their off-phases are dark, while other
+        functions are evaluated until the next pulse.
+        """
+        phases = [(Dt_delay, 0)]
+        for p, (Dt_on, Dt_off) in enumerate(cycles):
+            if phi_ts is None:
+                phases += [(Dt_on, phiOn), (Dt_off, 0)]
+            else:
+                phi_t = phi_ts[p]
+                phiOff = 0 if isinstance(phi_t, Waveform) else phi_t
+                phases += [(Dt_on, phi_t), (Dt_off, phiOff)]
+        return phases
 
-        return soln
+    def solverOptions(self):
+        """Keyword arguments of :func:`pyrho.models.simulateTrial` for the simulator's settings."""
+        return dict(method=self.integrator, rtol=self.rtol, atol=self.atol,
+                    dense=self.dense, sampling=getattr(self.Prot, 'sampling', None))
 
     def runTrial(self, RhO, phiOn, V, Dt_delay, cycles, dt, verbose=config.verbose):
         """
         Main routine for simulating a square pulse train.
 
+        The trial is simulated from a snapshot of the model by
+        :func:`pyrho.models.simulateTrial`. The model's ``states``, ``t``, ``pulseInd`` and
+        ``ssInf`` are then set from the result for compatibility.
 
         Returns
             I_RhO   := [I_t0, I_t1, ..., I_tn]      (1 x) nSamples row vector
@@ -236,154 +431,409 @@ class simPython(Simulator):
                                 ...
                         [S1_tn, S2_tn, ... Sk_tn]]
         """
-
-        nPulses = cycles.shape[0]
-
         if verbose > 1:
-            if V is not None:
-                Vstr = 'V = {:+}mV, '.format(V)
-            else:
-                Vstr = ''
-            info = "Simulating experiment at phi = {:.3g}photons/mm^2/s, {}pulse cycles: [Dt_delay={:.4g}ms".format(phiOn, Vstr, Dt_delay)
-            for p in range(nPulses):
-                info += "; [Dt_on={:.4g}ms; Dt_off={:.4g}ms]".format(cycles[p, 0], cycles[p, 1])
-            info += "]"
-            print(info)
-
-        # Delay phase (to allow the system to settle)
-        phi = 0
-        RhO.initStates(phi)         # Reset state and time arrays from previous runs
-        RhO.s0 = RhO.states[-1, :]  # Store initial state used
-        start, end = RhO.t[0], RhO.t[0]+Dt_delay
-        nSteps = int(round(((end-start)/dt)+1))
-        t = np.linspace(start, end, nSteps, endpoint=True)
+            print(self.trialInfo(V, Dt_delay, cycles, phiOn))
+        phases = self.getPhases(phiOn, None, Dt_delay, cycles)
+        return self._runTrial(RhO, phases, V, Dt_delay, cycles, dt, phiOn, None, verbose)
 
+    def runTrialPhi_t(self, RhO, phi_ts, V, Dt_delay, cycles, dt, verbose=config.verbose):
+        """Main routine for simulating a pulse train."""
+        assert len(phi_ts) == len(cycles)
+        phases = self.getPhases(None, phi_ts, Dt_delay, cycles)
+        return self._runTrial(RhO, phases, V, Dt_delay, cycles, dt, None, phi_ts, verbose)
+
+    def _runTrial(self, RhO, phases, V, Dt_delay, cycles, dt, phiOn, phi_ts, verbose):
+        """Simulate a trial and store its states on the model."""
+        stats = None if self.sink is None else getattr(self, '_trialStats', {})
+        t, states, I_RhO = RhO.simulate(phases, V, dt, stats=stats, **self.solverOptions())
+
+        RhO.states, RhO.t = states, t
+        RhO.s0 = states[0]
+        pulses, _ = cycles2times(cycles, Dt_delay)
+        self.storePulses(RhO, t, pulses, phiOn, phi_ts)
+        if len(pulses):
+            RhO.s_on, RhO.s_off = states[RhO.pulseInd[-1]]
+        RhO.setLight(0)
         if verbose > 1:
-            print("Trial initial conditions:{}".format(RhO.s0))
-            if verbose > 2:
-                print("Simulating t_del = [{},{}]".format(start, end))
-
-        soln = self.runSoln(RhO, t)
-        RhO.storeStates(soln[1:], t[1:])
-
-        for p in range(0, nPulses):
-
-            # Light on phase
-            RhO.s_on = soln[-1, :]
-            start = end
-            end = start + cycles[p, 0]
-            nSteps = int(round(((end-start)/dt)+1))
-            t = np.linspace(start, end, nSteps, endpoint=True)
-            onInd = len(RhO.t) - 1       # Start of on-phase
-            offInd = onInd + len(t) - 1  # Start of off-phase
-            RhO.pulseInd = np.vstack((RhO.pulseInd, [onInd, offInd]))
-            # Turn on light and set transition rates
-            phi = phiOn  # Light flux
-            RhO.setLight(phi)
-
-            if verbose > 1:
-                print("On-phase initial conditions:{}".format(RhO.s_on))
-                if verbose > 2:
-                    print("Simulating t_on = [{},{}]".format(start, end))
-
-            soln = self.runSoln(RhO, t)
-            RhO.storeStates(soln[1:], t[1:])  # Skip first values to prevent duplicating initial conditions and times
-            RhO.ssInf.append(RhO.calcSteadyState(phi))
-
-
-            # Light off phase
-            RhO.s_off = soln[-1, :]
-            start = end
-            end = start + cycles[p, 1]
-            nSteps = int(round(((end-start)/dt)+1))
-            t = np.linspace(start, end, nSteps, endpoint=True)
-            # Turn off light and set transition rates
-            phi = 0  # Light flux
-            RhO.setLight(phi)
-
-            if verbose > 1:
-                print("Off-phase initial conditions:{}".format(RhO.s_off))
-                if verbose > 2:
-                    print("Simulating t_off = [{},{}]".format(start, end))
-
-            soln = self.runSoln(RhO, t)
-            RhO.storeStates(soln[1:], t[1:])  # Skip first values to prevent duplicating initial conditions and times
-
-            if verbose > 1:
-                print('t_pulse{} = [{}, {}]'.format(p, RhO.t[onInd], RhO.t[offInd]))
-
-        # Calculate photocurrent
-        I_RhO = RhO.calcI(V, RhO.states)
-        states, t = RhO.getStates()
+            for p, (onInd, offInd) in enumerate(RhO.pulseInd):
+                print('t_pulse{} = [{}, {}]'.format(p, t[onInd], t[offInd]))
         return I_RhO, t, states
 
-    def runTrialPhi_t(self, RhO, phi_ts, V, Dt_delay, cycles, dt, verbose=config.verbose):
-        """Main routine for simulating a pulse train."""
+    def _freezeModel(self):
+        """Snapshot of the model at the protocol's wavelength and temperature."""
+        RhO, Prot = self.RhO, self.Prot
+        gain = 1.0 if Prot.lam is None else float(RhO.calcActionSpectrum(Prot.lam))
+        T = RhO.T if Prot.T is None else Prot.T
+        return RhO.freeze().replace(spectralGain=gain, T=T)
 
-        nPulses = cycles.shape[0]
-        assert len(phi_ts) == nPulses
+    def runStateless(self, executor=None, verbose=config.verbose):
+        """
+        Simulate every trial of the protocol with the stateless core.
 
-        # Delay phase (to allow the system to settle)
-        phi = 0
-        RhO.initStates(phi)                     # Reset state and time arrays from previous runs
-        RhO.s0 = RhO.states[-1, :]               # Store initial state used
-        start, end = RhO.t[0], RhO.t[0]+Dt_delay
-        nSteps = int(round(((end-start)/dt)+1))
-        t = np.linspace(start, end, nSteps, endpoint=True)  # Time vector
-        if verbose > 1:
-            print("Trial initial conditions:{}".format(RhO.s0))
-        soln = odeint(RhO.solveStates, RhO.s0, t, args=(None,), Dfun=RhO.jacobian)
-        RhO.storeStates(soln[1:], t[1:])
+        The model is frozen once (see :meth:`RhodopsinModel.freeze`) and each
+        trial is simulated by :func:`pyrho.models.simulateTrial` without
+        modifying the model or protocol, so the trials may be distributed
+        over threads or processes.
 
-        # Stimulation phases
-        for p in range(0, nPulses):
-            RhO.s_on = soln[-1, :]
-            start = end
-            Dt_on, Dt_off = cycles[p, 0], cycles[p, 1]
-            end = start + Dt_on + Dt_off
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            Executor to map the trials over (e.g. a ``ThreadPoolExecutor``).
+            Trials are run sequentially by default.
 
-            onInd = len(RhO.t) - 1                 # Start of on-phase
-            offInd = onInd + int(round(Dt_on/dt))  # Start of off-phase
-            RhO.pulseInd = np.vstack((RhO.pulseInd, [onInd, offInd]))
-            nSteps = int(round(((end-start)/dt)+1))
-            t = np.linspace(start, end, nSteps, endpoint=True)
-            phi_t = phi_ts[p]
+        Returns
+        -------
+        list
+            :class:`pyrho.models.TrialResult` for each trial, indexed by
+            ``[run][phiInd][vInd]``.
+        """
+        t0 = wall_time()
+        Prot = self.Prot
+        model = self._freezeModel()
+        trials = []
+        for run in range(Prot.nRuns):
+            cycles, Dt_delay = Prot.getRunCycles(run)
+            for phiInd, phiOn in enumerate(Prot.phis):
+                phi_ts = None if Prot.squarePulse else Prot.phi_ts[run][phiInd]
+                phases = self.getPhases(phiOn, phi_ts, Dt_delay, cycles)
+                for V in Prot.Vs:
+                    trials.append((model, phases, V, self.dt))
+        mapper = map if executor is None else executor.map
+        simulate = functools.partial(simulateTrial, cache=self.RhO._eigenCache,
+                                     **self.solverOptions())
+        results = iter(list(mapper(simulate, *zip(*trials))))
+        nested = [[[next(results) for V in Prot.Vs] for phi in Prot.phis]
+                  for run in range(Prot.nRuns)]
+        self.runTime = wall_time() - t0
+        if verbose > 0:
+            print("Simulated {} trials in {:.3g}s".format(len(trials), self.runTime))
+        return nested
 
-            if verbose > 1:
-                print("Pulse initial conditions:{}".format(RhO.s_on))
+    def runBatch(self, verbose=config.verbose, executor=None):
+        """
+        Simulate every trial of the protocol with :meth:`runStateless`.
 
-            if verbose > 2:
-                soln, out = odeint(RhO.solveStates, RhO.s_on, t, args=(phi_t,),
-                                   Dfun=RhO.jacobian, full_output=True)
-                print(out)
-            else:
-                soln = odeint(RhO.solveStates, RhO.s_on, t, args=(phi_t,),
-                              Dfun=RhO.jacobian)
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            Executor to map the trials over (e.g. a ``ThreadPoolExecutor``).
 
-            RhO.storeStates(soln[1:], t[1:])  # Skip first values to prevent duplicating initial conditions and times
-            RhO.ssInf.append(RhO.calcSteadyState(phi_t(end-Dt_off)))
+        Returns
+        -------
+        ProtocolData
+            The protocol's data (also stored as ``Prot.PD``).
+        """
+        t0 = wall_time()
+        Prot, RhO = self.Prot, self.RhO
+        self.prepare(Prot)
+        RhO.setWavelength(Prot.lam)
+        if Prot.T is not None:
+            RhO.setTemperature(Prot.T)
+        trials = self.runStateless(executor, verbose=0)
 
-            if verbose > 1:
-                print('t_pulse{} = [{}, {}]'.format(p, RhO.t[onInd], RhO.t[offInd]))
+        self.initData(Prot)
+        for run in range(Prot.nRuns):
+            pulses, Dt_total = cycles2times(*Prot.getRunCycles(run))
+            for phiInd, phiOn in enumerate(Prot.phis):
+                ssInf = np.array(self.getSteadyStates(RhO, pulses, phi_ts=Prot.phi_ts[run][phiInd]))
+                for vInd, V in enumerate(Prot.Vs):
+                    t, states, I_RhO = trials[run][phiInd][vInd]
+                    stim = Prot.getStimArray(run, phiInd, self.dt)
+                    if len(stim) != len(t):  # Non-uniform time array
+                        stim = Prot.getStimArray(run, phiInd, self.dt, t=t)
+                    PC = PhotoCurrent(I_RhO, t, pulses, phiOn, V, stimuli=stim,
+                                      states=states, stateLabels=RhO.stateLabels,
+                                      label=Prot.protocol)
+                    PC.ssInf = ssInf
+                    self.storeTrial(run, phiInd, vInd, PC)
 
-        # Calculate photocurrent
-        I_RhO = RhO.calcI(V, RhO.states)
-        states, t = RhO.getStates()
+        Prot.finish(PC, RhO)
+        self.finish()
+        self.runTime = wall_time() - t0
+        if verbose > 0:
+            print("Finished batch simulation in {:.3g}s".format(self.runTime))
+        return Prot.PD
 
-        return I_RhO, t, states
+    def runPopulation(self, params=None, irradiance=None, V=-70, run=0,
+                      phiInd=0, returnCells=False, blockSize=64, Ts=None,
+                      lams=None, verbose=config.verbose):
+        """
+        Simulate a population of cells with heterogeneous opsin expression.
+
+        The cells share the protocol's square pulses but each has its own
+        parameters (e.g. ``g0``, ``phi_m``) and irradiance. In each phase of
+        constant light, the rate equations of every cell are solved exactly
+        and together from batched eigendecompositions of their (reduced)
+        rate matrices. Only the currents are evaluated so the states of
+        individual cells are never stored.
+
+        Parameters
+        ----------
+        params : dict(str: array-like), optional
+            Per-cell values of model parameters e.g. ``{'g0': g0s}``.
+            Unspecified parameters take the model's values.
+        irradiance : array-like, optional
+            Per-cell flux relative to the protocol's ``phis`` (e.g. due to
+            depth or distance from the light source).
+        V : float
+            Clamp voltage [mV].
+        run : int
+            Index of the protocol run to simulate.
+        phiInd : int
+            Index of the protocol flux to simulate.
+        returnCells : bool
+            Also return the current of every cell (nCells x nSamples).
+        blockSize : int
+            Number of time samples evaluated together.
+        Ts : array-like, optional
+            Temperature [degC] of each cell (defaults to the protocol's).
+        lams : array-like, optional
+            Wavelength [nm] of the light at each cell (defaults to the
+            protocol's).
 
+        Returns
+        -------
+        dict
+            ``t``: Times [ms].
+            ``I_mean``, ``I_std``, ``I_sum``: Mean, standard deviation and
+            total current [nA] across cells at each time.
+            ``I_peak``, ``I_ss``: Peak and steady-state currents [nA] of each
+            cell for the first pulse.
+            ``I``: Current [nA] of each cell (only if ``returnCells``).
+        """
+        t0 = wall_time()
+        RhO, Prot, dt = self.RhO, self.Prot, self.dt
+        if not Prot.squarePulse:
+            raise NotImplementedError('Population simulations require square pulses!')
+        params = {name: np.atleast_1d(values) for name, values in (params or {}).items()}
+        sizes = {len(values) for values in params.values()}
+        if irradiance is not None:
+            irradiance = np.atleast_1d(np.asarray(irradiance, dtype=float))
+            sizes.add(len(irradiance))
+        if Ts is not None:
+            params['T'] = np.atleast_1d(np.asarray(Ts, dtype=float))
+            sizes.add(len(params['T']))
+        if lams is not None:
+            params['spectralGain'] = np.atleast_1d(RhO.calcActionSpectrum(lams))
+            sizes.add(len(params['spectralGain']))
+        if len(sizes) != 1:
+            raise ValueError('Per-cell parameters, irradiance, temperatures and wavelengths must have the same (non-zero) length!')
+        nCells = sizes.pop()
+        if irradiance is None:
+            irradiance = np.ones(nCells)
+
+        cells = self._freezeModel().replace(**params)
+        cycles, Dt_delay = Prot.getRunCycles(run)
+        phiOn = Prot.phis[phiInd]
+        phases = [(Dt_delay, 0)]
+        for Dt_on, Dt_off in cycles:
+            phases += [(Dt_on, phiOn), (Dt_off, 0)]
+        nSteps = [int(round(Dt/dt)) for Dt, _ in phases]
+        nSamples = sum(nSteps) + 1
+
+        scale = np.broadcast_to(cells.g0 * cells.calcfV(V) * (V - cells.E) * 1e-6, (nCells,))
+        # f_phi is linear in the states but may depend on per-cell parameters (e.g. gam)
+        c = np.column_stack([np.broadcast_to(cells.calcfphi(np.tile(e, (nCells, 1))), (nCells,))
+                             for e in np.eye(RhO.nStates)])
+        cr, cn = c[:, :-1] - c[:, -1:], c[:, -1]
+
+        t = np.zeros(nSamples)
+        I_sum = np.zeros(nSamples)
+        I_sq = np.zeros(nSamples)
+        I_cells = np.zeros((nCells, nSamples)) if returnCells else None
+        I_peak = np.zeros(nCells)
+        I_ss = None
+        x = np.tile(RhO.s_0[:-1], (nCells, 1))  # Eliminate the last state
+        I = scale * (np.einsum('ni,ni->n', x, cr) + cn)
+        I_sum[0], I_sq[0] = I.sum(), (I**2).sum()
+        if returnCells:
+            I_cells[:, 0] = I
+
+        k = 1  # Index of the next sample
+        for ph, ((Dt, phi), n) in enumerate(zip(phases, nSteps)):
+            if n == 0:
+                continue
+            h = Dt / n
+            t[k:k+n] = t[k-1] + h * np.arange(1, n+1)
+            A = calcRateMatrices(cells, phi * irradiance)
+            Ar = A[:, :-1, :-1] - A[:, :-1, -1:]
+            b = A[:, :-1, -1]
+            x_ss = np.linalg.solve(Ar, -b[..., None])[..., 0]
+            eigvals, vecs = np.linalg.eig(Ar)
+            bad = np.linalg.cond(vecs) > 1e12
+            if np.any(bad):  # Separate repeated eigenvalues by a negligible amount
+                jitter = 1 + 1e-9 * np.arange(1, Ar.shape[-1]+1)
+                eigvals[bad], vecs[bad] = np.linalg.eig(Ar[bad] * jitter[:, None])
+            z = np.linalg.solve(vecs, (x - x_ss)[..., None])[..., 0]  # Real unless any eigenvalues are complex
+            w = np.einsum('nik,ni->nk', vecs, cr)
+            a = np.einsum('ni,ni->n', x_ss, cr) + cn
+            mu = np.exp(eigvals * h)
+            powers = mu[..., None] ** np.arange(1, min(blockSize, n)+1)
+            if ph == 1:  # Steady-state over the last 5% of the first on-phase
+                cut = max(2, int(round(0.05 * (n+1))))
+                ss = slice(k + n - cut, k + n)
+                I_ss = np.zeros(nCells)
+            for j in range(0, n, blockSize):
+                nb = min(blockSize, n - j)
+                Ib = scale[:, None] * (a[:, None] + np.einsum('nk,nkb->nb', w * z, powers[..., :nb]).real)
+                z = z * powers[..., nb-1]
+                block = slice(k + j, k + j + nb)
+                I_sum[block] = Ib.sum(axis=0)
+                I_sq[block] = (Ib**2).sum(axis=0)
+                if ph in (1, 2):  # First pulse cycle
+                    cand = Ib[np.arange(nCells), np.argmax(np.abs(Ib), axis=1)]
+                    better = np.abs(cand) > np.abs(I_peak)
+                    I_peak[better] = cand[better]
+                if ph == 1:
+                    lo, hi = max(block.start, ss.start), min(block.stop, ss.stop)
+                    if hi > lo:
+                        I_ss += Ib[:, lo-block.start:hi-block.start].sum(axis=1)
+                if returnCells:
+                    I_cells[:, block] = Ib
+            x = x_ss + np.einsum('nik,nk->ni', vecs, z).real
+            k += n
+
+        I_mean = I_sum / nCells
+        I_std = np.sqrt(np.maximum(I_sq / nCells - I_mean**2, 0))
+        results = {'t': t, 'I_mean': I_mean, 'I_std': I_std, 'I_sum': I_sum,
+                   'I_peak': I_peak,
+                   'I_ss': I_ss / cut if I_ss is not None else None}
+        if returnCells:
+            results['I'] = I_cells
+        self.runTime = wall_time() - t0
+        if verbose > 0:
+            print("Simulated {} cells ({} samples) in {:.3g}s".format(nCells, nSamples, self.runTime))
+        return results
 
+    def runSweep(self, lams=None, Ts=None, V=-70, run=0, phiInd=0,
+                 verbose=config.verbose):
+        """
+        Simulate the protocol over a grid of wavelengths and temperatures.
+
+        Wavelength only rescales the flux (through the model's action
+        spectrum) and temperature only rescales the transition rates (through
+        their Q10), so every combination is simulated together as one
+        population (see :meth:`runPopulation`) rather than running the
+        protocol once per combination.
+
+        Parameters
+        ----------
+        lams : array-like, optional
+            Wavelengths [nm] (defaults to the protocol's ``lams``).
+        Ts : array-like, optional
+            Temperatures [degC] (defaults to the protocol's ``Ts``).
+        V : float
+            Clamp voltage [mV].
+        run : int
+            Index of the protocol run to simulate.
+        phiInd : int
+            Index of the protocol flux to simulate.
 
+        Returns
+        -------
+        dict
+            ``t``: Times [ms].
+            ``I``, ``I_peak``, ``I_ss``: Currents [nA] with a leading axis for
+            each swept variable (wavelength then temperature).
+            ``lams``, ``Ts``: The swept values (or ``None``).
+        """
+        Prot = self.Prot
+        if lams is None:
+            lams = Prot.lams
+        if Ts is None:
+            Ts = Prot.Ts
+        if lams is None and Ts is None:
+            raise ValueError("No wavelengths or temperatures specified!")
+        shape = []
+        if lams is not None:
+            lams = np.atleast_1d(np.asarray(lams, dtype=float))
+            shape.append(len(lams))
+        if Ts is not None:
+            Ts = np.atleast_1d(np.asarray(Ts, dtype=float))
+            shape.append(len(Ts))
+        grid = np.meshgrid(lams if lams is not None else [np.nan],
+                           Ts if Ts is not None else [np.nan], indexing='ij')
+        pop = self.runPopulation(V=V, run=run, phiInd=phiInd, returnCells=True,
+                                 Ts=grid[1].ravel() if Ts is not None else None,
+                                 lams=grid[0].ravel() if lams is not None else None,
+                                 verbose=verbose)
+        return {'t': pop['t'], 'lams': lams, 'Ts': Ts,
+                'I': pop['I'].reshape(shape + [-1]),
+                'I_peak': pop['I_peak'].reshape(shape),
+                'I_ss': pop['I_ss'].reshape(shape)}
+
+    def runSpectrum(self, lams=None, V=-70, run=0, phiInd=0,
+                    verbose=config.verbose):
+        """
+        Simulate the response of the opsin across a range of wavelengths.
 
+        This is a wavelength sweep with :meth:`runSweep` (also over the
+        protocol's ``Ts`` if set) which also returns the ``sensitivity``: the
+        peak current relative to its maximum across wavelengths.
+        """
+        if lams is None:
+            lams = self.Prot.lams
+        if lams is None:
+            raise ValueError("No wavelengths specified!")
+        results = self.runSweep(lams=lams, V=V, run=run, phiInd=phiInd,
+                                verbose=verbose)
+        peak = np.abs(results['I_peak'])
+        maxima = peak.max(axis=0)
+        results['sensitivity'] = peak / np.where(maxima > 0, maxima, 1)
+        return results
+
+
+class NEURONsession(object):
+    """
+    Long-lived NEURON model shared by successive ``simNEURON`` objects.
+
+    The cell, rhodopsins, recording vectors and voltage clamp built by the
+    first simulator are kept and reused by later simulators with the same
+    mechanism and cell, so only the opsin parameters and stimuli change
+    between protocols e.g.::
+
+        session = NEURONsession()
+        for protocol in ['step', 'rectifier', 'recovery']:
+            sim = simulators['NEURON'](protocols[protocol](), RhO, session=session)
+            sim.run()
+    """
+    objects = ('cell', 'nSecs', 'compList', 'rhoList', 'rhoRec', 'stateRecs')
+    records = ('tvec', 'Iphi', 'Vm')
+
+    def __init__(self):
+        self.key = None  # Mechanism, cell, expression probability, Vcomp and recInd
+        self.state = {}
+        self.Vcl = None
+
+    def store(self, sim, key):
+        """Keep the NEURON objects built by a simulator."""
+        self.key = key
+        self.state = {name: getattr(sim, name) for name in self.objects}
+        self.state.update({name: getattr(sim.h, name) for name in self.records})
+        self.Vcl = None
+
+    def restore(self, sim):
+        """Give a simulator the stored NEURON objects and reset their state."""
+        for name in self.objects:
+            setattr(sim, name, self.state[name])
+        for name in self.records:  # Point the hoc references back at this session's vectors
+            setattr(sim.h, name, self.state[name])
+        for vec in [self.state[name] for name in self.records] + self.state['stateRecs']:
+            vec.resize(0)
+        for rho in self.state['rhoList']:
+            rho.phi = 0
+        if self.Vcl is not None:
+            self.Vcl.rs = 1e9  # Disabled until a protocol adds the clamp
 
 
 class simNEURON(Simulator):
     """Class for cellular level simulations with NEURON."""
 
     simulator = 'NEURON'
+    capabilities = frozenset(['batch', 'adaptive', 'membrane', 'parallel'])
     mechanisms = {3: 'RhO3c', 4: 'RhO4c', 6: 'RhO6c'}
 
-    def __init__(self, Prot, RhO, params=simParams['NEURON'], recInd=0):  #v_init=-70, integrator='fixed'):
+    def __init__(self, Prot, RhO, params=simParams['NEURON'], recInd=0, session=None):  #v_init=-70, integrator='fixed'):
 
         ### Model Specification
         # Topology
@@ -439,21 +889,28 @@ class simNEURON(Simulator):
         #for states, mod in self.mechanisms.items():
         #    self.mechanisms[states] += 'c'
         self.mod = self.mechanisms[self.RhO.nStates]  # Use this to select the appropriate mod file for insertion
+        if not hasattr(self.h, self.mod):  # Not compiled in the working directory
+            config.loadMechanisms()  # Compiled once per mod file and NEURON version
         #if not Prot.squarePulse:
         #self.mod += 'c'
 
-        # self.buildCell(params['cell'].value)
-        self.build_cell()
-        if config.verbose > 0:
-            self.h.topology()  # Print topology
-        self.transduce(self.RhO, expProb=params['expProb'].value)
+        self.session = NEURONsession() if session is None else session
+        key = (self.mod, tuple(params['cell'].value), params['expProb'].value,
+               params['Vcomp'].value, recInd)
+        if self.session.key == key:  # Reuse the cell, opsins and recorders
+            self.session.restore(self)
+        else:
+            # self.buildCell(params['cell'].value)
+            self.build_cell()
+            if config.verbose > 0:
+                self.h.topology()  # Print topology
+            self.transduce(self.RhO, expProb=params['expProb'].value)
+            self.rhoRec = self.rhoList[recInd]  # Choose a rhodopsin to record
+            self.setRecords(self.rhoRec, params['Vcomp'].value, self.RhO)
+            self.session.store(self, key)
         self.rhoParams = copy.deepcopy(modelParams[str(self.RhO.nStates)])
         self.RhO.exportParams(self.rhoParams)
         self.setOpsinParams(self.rhoList, self.rhoParams)  # self.RhO, modelParams[str(self.RhO.nStates)])
-        print(recInd)
-        print(self.rhoList)
-        self.rhoRec = self.rhoList[recInd]  # Choose a rhodopsin to record
-        self.setRecords(self.rhoRec, params['Vcomp'].value, self.RhO)
         self.Vclamp = params['Vclamp'].value
 
     def reset(self):
@@ -465,6 +922,7 @@ class simNEURON(Simulator):
 
         pc = self.h.ParallelContext()
         pc.gid_clear()
+        self.session.key = None  # The session's objects will be deleted
 
         # unref all the cell objects
         self.h("forall delete_section()")
@@ -501,6 +959,13 @@ class simNEURON(Simulator):
         self.Vms = Prot.genContainer()
         return  # self.h.dt
 
+    def finish(self):
+        """Reset the time step and voltage clamp if overridden by the protocol."""
+        super(simNEURON, self).finish()
+        if hasattr(self, 'Vclamp_prev') and self.Vclamp_prev is not None:
+            self.Vclamp, self.Vclamp_prev = self.Vclamp_prev, None
+            self.h.Vcl.rs = 1e9  # TODO; Find a way to fully remove SEClamp
+
     def build_cell(self):
         self.cell = [self.h.Section(name='soma')]
         self.nSecs = len(self.cell)
@@ -592,15 +1057,40 @@ class simNEURON(Simulator):
         # h.setpointer(_ref_t, 'bar', sec(x).foo)
 
         # Save state variables according to RhO model
-        for s in RhO.stateVars:
-            self.h('objref {}Vec'.format(s))
-            self.h.rho = rhoRec                             # TODO: Check this works with multiple sections/rhodopsins
-            self.h('{}Vec = new Vector()'.format(s))
-            self.h('{}Vec.record(&rho.{})'.format(s, s))
+        self.stateRecs = []
+        for s in RhO.stateVars:  # TODO: Check this works with multiple sections/rhodopsins
+            vec = self.h.Vector()
+            vec.record(getattr(rhoRec, '_ref_{}'.format(s)))
+            self.stateRecs.append(vec)
+
+    def reserveRecords(self, Dt_total):
+        """Preallocate the recording vectors for a trial of length Dt_total [ms]."""
+        if self.CVode:  # The number of samples is not known in advance
+            return
+        nSamples = int(round(Dt_total / self.h.dt)) + 2
+        for vec in [self.h.tvec, self.h.Iphi, self.h.Vm] + self.stateRecs:
+            vec.buffer_size(nSamples)
+
+    def collectRecords(self):
+        """
+        Copy the recordings of a trial into NumPy arrays and reset the vectors.
+
+        Each vector is read through a NumPy view of its buffer so that the
+        data are copied only once (rather than through Python lists).
+        """
+        I_RhO = self.h.Iphi.as_numpy().copy()
+        t = self.h.tvec.as_numpy().copy()
+        self.Vm = self.h.Vm.as_numpy().copy()
+        soln = np.column_stack([vec.as_numpy() for vec in self.stateRecs])
+        for vec in [self.h.tvec, self.h.Iphi, self.h.Vm] + self.stateRecs:
+            vec.resize(0)  # Keeps the allocated buffer for the next trial
+        return I_RhO, t, soln
 
     def addVclamp(self):
-        self.h('objref Vcl')
-        self.h.Vcl = self.h.SEClamp(0.5)
+        if self.session.Vcl is None:
+            self.h('objref Vcl')
+            self.session.Vcl = self.h.SEClamp(0.5)
+        self.h.Vcl = self.session.Vcl
         self.h.Vcl.rs = 1  # Set to default in case it has been increased to disable it
 
     def setVclamp(self, Vhold=-70):
@@ -635,6 +1125,7 @@ class simNEURON(Simulator):
 
         # Set simulation run time
         self.h.tstop = Dt_total
+        self.reserveRecords(Dt_total)
 
         if self.Vclamp is True:
             self.setVclamp(V)
@@ -713,32 +1204,10 @@ class simNEURON(Simulator):
                     self.h.continuerun(progress)
                 p += 1
 
-        I_RhO = np.array(self.h.Iphi.to_python(), copy=True)
-        t = np.array(self.h.tvec.to_python(), copy=True)
-        self.Vm = np.array(self.h.Vm.to_python(), copy=True)
+        I_RhO, t, soln = self.collectRecords()
         self.t = t
 
-        for p in range(nPulses):
-            pInds = np.searchsorted(t, times[p, :], side="left")
-            RhO.pulseInd = np.vstack((RhO.pulseInd, pInds))
-            RhO.ssInf.append(RhO.calcSteadyState(phiOn))
-
-        # Get solution variables
-        soln = np.zeros((len(t), RhO.nStates))
-        for sInd, s in enumerate(RhO.stateVars):
-            self.h('objref tmpVec')
-            self.h('tmpVec = {}Vec'.format(s))
-            soln[:, sInd] = np.array(self.h.tmpVec.to_python(), copy=True)
-            self.h('{}Vec.clear()'.format(s))
-            self.h('{}Vec.resize(0)'.format(s))
-
-        # Reset vectors
-        self.h.tvec.clear()  # Necessary?
-        self.h.tvec.resize(0)
-        self.h.Iphi.clear()
-        self.h.Iphi.resize(0)
-        self.h.Vm.clear()
-        self.h.Vm.resize(0)
+        self.storePulses(RhO, t, times, phiOn)
 
         # NEURON changes the timestep! Set the actual timestep for plotting stimuli
         self.dt = self.h.dt
@@ -804,15 +1273,7 @@ class simNEURON(Simulator):
         times, Dt_total = cycles2times(cycles, Dt_delay)
 
         if verbose > 1:
-            if V is not None:
-                Vstr = 'V = {:+}mV, '.format(V)
-            else:
-                Vstr = ''
-            info = "Simulating experiment {}pulse cycles: [Dt_delay={:.4g}ms".format(Vstr, Dt_delay)
-            for p in range(nPulses):
-                info += "; [Dt_on={:.4g}ms; Dt_off={:.4g}ms]".format(cycles[p, 0], cycles[p, 1])
-            info += "]"
-            print(info)
+            print(self.trialInfo(V, Dt_delay, cycles))
 
         # Set simulation run time
         self.h.tstop = Dt_total  # Dt_delay + np.sum(cycles) #nPulses*(Dt_on+Dt_off) + padD
@@ -841,15 +1302,9 @@ class simNEURON(Simulator):
             phiPulse = phi_t(tPulse) # -tPulse[0] # Align time vector to 0 for phi_t to work properly
             discontinuities = np.r_[discontinuities, len(tPulse) - 1]
 
-            onInd = len(t) - 1  # Start of on-phase
-            offInd = onInd + int(round(Dt_on/dt))
-            RhO.pulseInd = np.vstack((RhO.pulseInd, [onInd, offInd]))
-
             t = np.r_[t, tPulse[1:]]
             phi_tV = np.r_[phi_tV, phiPulse[1:]]
 
-            RhO.ssInf.append(RhO.calcSteadyState(phi_t(end-Dt_off)))
-
         tvec = self.h.Vector(t)
         tvec.label('Time [ms]')
         phi_tV[np.ma.where(phi_tV < 0)] = 0  # Safeguard for negative phi values # Necessary? Handled in mods
@@ -859,31 +1314,14 @@ class simNEURON(Simulator):
         phiVec.play(self.rhoRec._ref_phi, tvec, 1, discontinuities)
         #phiVec.play_remove()
 
+        self.reserveRecords(Dt_total)
         self.h.init()
         self.h.run()
 
-        # Collect data
-        I_RhO = np.array(self.h.Iphi.to_python(), copy=True)
-        t = np.array(self.h.tvec.to_python(), copy=True)
-        self.Vm = np.array(self.h.Vm.to_python(), copy=True)
+        # Collect data N.B. NEURON changes the sampling rate
+        I_RhO, t, soln = self.collectRecords()
         self.t = t
-
-        # Get solution variables N.B. NEURON changes the sampling rate
-        soln = np.zeros((len(t), RhO.nStates))
-        for sInd, s in enumerate(RhO.stateVars):
-            self.h('objref tmpVec')
-            self.h('tmpVec = {}Vec'.format(s))
-            soln[:, sInd] = np.array(self.h.tmpVec.to_python(), copy=True)
-            self.h('{}Vec.clear()'.format(s))
-            self.h('{}Vec.resize(0)'.format(s))
-
-        # Reset vectors
-        self.h.tvec.clear()  # Necessary?
-        self.h.tvec.resize(0)
-        self.h.Iphi.clear()
-        self.h.Iphi.resize(0)
-        self.h.Vm.clear()
-        self.h.Vm.resize(0)
+        self.storePulses(RhO, t, times, phi_ts=phi_ts)
         # phiVec ?
 
         RhO.storeStates(soln[1:], t[1:])
@@ -898,6 +1336,110 @@ class simNEURON(Simulator):
 
         return I_RhO, t, soln
 
+    def getStimVectors(self, run, phiInd):
+        """
+        Times [ms], fluxes and discontinuities to play into a rhodopsin's phi.
+
+        Square pulses are described exactly by their edges (with repeated
+        times at each discontinuity) while other stimuli are sampled at dt.
+        """
+        Prot = self.Prot
+        cycles, Dt_delay = Prot.getRunCycles(run)
+        times, Dt_total = cycles2times(cycles, Dt_delay)
+        if Prot.squarePulse:
+            phiOn = Prot.phis[phiInd]
+            nPulses = cycles.shape[0]
+            tStim = np.r_[0, np.repeat(times.ravel(), 2), Dt_total]
+            phiStim = np.r_[0, np.tile([0, phiOn, phiOn, 0], nPulses), 0]
+            breaks = np.arange(1, 4*nPulses, 2)  # Index of the first of each repeated time
+        else:
+            phiStim = np.maximum(Prot.getStimArray(run, phiInd, self.dt), 0)
+            tStim = np.linspace(0, Dt_total, len(phiStim))
+            breaks = np.array([], dtype=int)
+        return tStim, phiStim, breaks
+
+    def runBatch(self, verbose=config.verbose, nthread=None):
+        """
+        Simulate every flux and voltage of the protocol in one NEURON run.
+
+        For each protocol run, an independent single compartment cell is
+        built for every (phi, V) condition with its own rhodopsin, light
+        stimulus (played into ``phi``) and voltage clamp. The cells are then
+        integrated together with ``ParallelContext.nthread`` threads rather
+        than calling ``h.run()`` once per trial. Cells loaded from hoc files
+        are not replicated.
+
+        Parameters
+        ----------
+        nthread : int, optional
+            Number of threads (defaults to the number of CPUs).
+
+        Returns
+        -------
+        ProtocolData
+            The protocol's data (also stored as ``Prot.PD``) without state
+            variables.
+        """
+        t0 = wall_time()
+        Prot, RhO, h = self.Prot, self.RhO, self.h
+        self.prepare(Prot)
+        if verbose > 0:
+            print("Running '{}' protocol as a batch of {} cells with NEURON..."
+                  .format(Prot, Prot.nPhis * Prot.nVs))
+
+        self.initData(Prot)
+
+        pc = h.ParallelContext()
+        nthread_prev = int(pc.nthread())
+        pc.nthread(nthread or os.cpu_count() or 1)
+        try:
+            for run in range(Prot.nRuns):
+                cycles, Dt_delay = Prot.getRunCycles(run)
+                pulses, Dt_total = cycles2times(cycles, Dt_delay)
+                h.tstop = Dt_total
+                cells = []
+                for phiInd in range(Prot.nPhis):
+                    tStim, phiStim, breaks = self.getStimVectors(run, phiInd)
+                    for vInd, V in enumerate(Prot.Vs):
+                        sec = h.Section(name='cell_{}_{}_{}'.format(run, phiInd, vInd))
+                        rho = getattr(h, self.mod)(sec(0.5))
+                        self.setOpsinParams([rho], self.rhoParams)
+                        tvec, phiVec = h.Vector(tStim), h.Vector(phiStim)
+                        phiVec.play(rho._ref_phi, tvec, 1, h.Vector(breaks))
+                        clamp = None
+                        if V is not None:
+                            clamp = h.SEClamp(sec(0.5))
+                            clamp.dur1, clamp.amp1, clamp.rs = Dt_total, V, 1
+                        Irec, Vrec = h.Vector(), h.Vector()
+                        Irec.record(rho._ref_i)
+                        Vrec.record(sec(0.5)._ref_v)
+                        # Keep references to every object for the duration of the run
+                        cells.append((phiInd, vInd, sec, rho, tvec, phiVec, clamp, Irec, Vrec))
+                tRec = h.Vector()
+                tRec.record(h._ref_t)
+                h.init()
+                h.run()
+
+                t = tRec.as_numpy().copy()
+                for phiInd, vInd, sec, rho, tvec, phiVec, clamp, Irec, Vrec in cells:
+                    stim = Prot.getStimArray(run, phiInd, self.dt)
+                    if len(stim) != len(t):  # NEURON may change the sampling
+                        stim = Prot.getStimArray(run, phiInd, self.dt, t=t)
+                    PC = PhotoCurrent(Irec.as_numpy().copy(), t, pulses, Prot.phis[phiInd],
+                                      Prot.Vs[vInd], stimuli=stim, label=Prot.protocol)
+                    self.storeTrial(run, phiInd, vInd, PC)
+                    self.Vms[run][phiInd][vInd] = Vrec.as_numpy().copy()
+                del cells  # Delete the cells before building the next run
+        finally:
+            pc.nthread(nthread_prev)
+
+        Prot.finish(PC, RhO)
+        self.finish()
+        self.runTime = wall_time() - t0
+        if verbose > 0:
+            print("Finished batch simulation in {:.3g}s".format(self.runTime))
+        return Prot.PD
+
     def saveExtras(self, run, phiInd, vInd):
         # TODO: Clean this up
         self.Vms[run][phiInd][vInd] = copy.copy(self.Vm)
@@ -985,10 +1527,13 @@ class simBrian(Simulator):
     """Class for network level simulations with Brian."""
 
     simulator = 'Brian'
+    capabilities = frozenset(['batch', 'squarePulse', 'membrane', 'spectral'])
+    # Geometric means over the protocols of each kind (six-state model)
+    costs = {'squarePulse': 16., 'waveform': 0.7}
 
     def __init__(self, Prot, RhO, params=simParams['Brian'],
                  network=None, netParams=None, monitors=None,
-                 G_RhO='Inputs', varIrho='I', varV='v'):
+                 G_RhO='Inputs', varIrho='I', varV='v', recordPath=None):
 
         #from brian2 import *
         # from brian2.only import * # Do not import pylab etc
@@ -1018,7 +1563,8 @@ class simBrian(Simulator):
         self.stateVars = RhO.brianStateVars  # ['S_'+s for s in RhO.stateVars]
 
         self.namespace = self.setParams(RhO)
-        self.namespace.update(netParams)
+        if netParams is not None:
+            self.namespace.update(netParams)
         self.netParams = netParams
 
         #if network is None:
@@ -1032,8 +1578,18 @@ class simBrian(Simulator):
         self.G_RhO = G_RhO      # 'Inputs' ### Change to match RhO type?
         self.varIrho = varIrho  # 'I'
         self.varV = varV        # 'v'
-        self.net[self.G_RhO].__dict__[self.stateVars[0]] = 1.  # Set rhodopsins to dark-adapted state
-
+        self.recordPath = recordPath  # Directory to flush recordings to after each trial
+        self._phiUpdater = None
+        if self.net is not None:  # Batches (runBatch) build their own network
+            G = self.net[self.G_RhO]
+            G.__dict__[self.stateVars[0]] = 1.  # Set rhodopsins to dark-adapted state
+            if 'phi' in G.variables:  # Equations with a (shared) phi variable (RhO.brian)
+                # Set phi from a TimedArray at the start of each step so that a
+                # whole trial takes a single run
+                self._phiUpdater = G.run_regularly('phi = phi_stim(t)', when='before_groups',
+                                                   name=G.name+'_phi_stim')
+                self.net.add(self._phiUpdater)
+                self.setStimulus(np.zeros(1), self.dt)
 
     def setParams(self, RhO):
         params = {}  # dict(RhO.paramsList)
@@ -1041,6 +1597,49 @@ class simBrian(Simulator):
             params[p] = RhO.__dict__[p] * modelUnits[p]
         return params
 
+    @staticmethod
+    def createMonitors(RhO, G_RhO, layers=(), record=0, record_dt=None,
+                       spikes=True, rates=True, varIrho='I', varV='v'):
+        """
+        Create the monitors for a network with configurable recording to
+        limit their memory in large networks.
+
+        Parameters
+        ----------
+        RhO : RhodopsinModel
+            The rhodopsin model of the network.
+        G_RhO : NeuronGroup
+            The group expressing the rhodopsins.
+        layers : list of NeuronGroup, optional
+            Spiking groups to monitor (in order e.g. [G_RhO, G1, G2]).
+        record : int, list or bool
+            Indices of the neurons in ``G_RhO`` to record states, current and
+            voltage from. The first is used for the photocurrent.
+        record_dt : float, optional
+            Recording interval [ms] (defaults to every time step).
+        spikes : bool
+            Record the time and index of each spike. Otherwise only the
+            spike counts of each neuron are kept.
+        rates : bool
+            Record the population rate of each layer (one value per time
+            step regardless of the number of neurons).
+
+        Returns
+        -------
+        dict
+            Monitors to add to the network and pass to the simulator.
+        """
+        import brian2.only as br
+        kwargs = {'record': record}
+        if record_dt is not None:
+            kwargs['dt'] = record_dt * ms
+        return {'states': br.StateMonitor(G_RhO, RhO.brianStateVars, **kwargs),
+                'I': br.StateMonitor(G_RhO, varIrho, **kwargs),
+                'V': br.StateMonitor(G_RhO, varV, **kwargs),
+                'spikes': [br.SpikeMonitor(G, record=spikes, name=G.name+'Spikes')
+                           for G in layers],
+                'rates': [br.PopulationRateMonitor(G, name=G.name+'Rate')
+                          for G in layers] if rates else []}
 
     def prepare(self, Prot):
         """Function to prepare everything for a simulation accounting for
@@ -1052,6 +1651,10 @@ class simBrian(Simulator):
         self.br.defaultclock.dt = self.dt * ms
         self.rasters = Prot.genContainer()
         self.Vms = Prot.genContainer()
+        if self.recordPath is not None:
+            os.makedirs(self.recordPath, exist_ok=True)
+        if self.net is None:
+            return
         # Skip last state value since this is defined as 1 - sum(states) not as an ODE
         self.net[self.G_RhO].set_states({s: o for s, o in zip(self.stateVars[:-1], self.RhO.s_0[:-1])})  # Necessary?
         self.net.store()  # http://brian2.readthedocs.org/en/latest/user/running.html
@@ -1060,22 +1663,106 @@ class simBrian(Simulator):
     def initialise(self):
         self.net.restore()
 
+    def setStimulus(self, phi_tV, dt):
+        """
+        Drive the rhodopsins with the flux ``phi_tV`` [ph./mm^2/s] of each
+        time step of ``dt`` [ms] through a ``TimedArray``, scaled by the
+        model's spectral gain.
+        """
+        name = 'phi' if self._phiUpdater is None else 'phi_stim'
+        phi_tV = phi_tV * self.RhO.spectralGain
+        self.namespace[name] = self.br.TimedArray(phi_tV * modelUnits['phi_m'],
+                                                  dt=dt*ms, name=name)
+        if self._phiUpdater is not None:
+            self._phiUpdater.active = True
+
+    def getPulseArray(self, phiOn, Dt_delay, cycles, dt):
+        """
+        Flux during each time step of a square pulse train, evaluated at the
+        middle of the step so that the edges on the time grid are exact.
+        """
+        pulses, Dt_total = cycles2times(cycles, Dt_delay)
+        t = (np.arange(int(round(Dt_total/dt))) + 0.5) * dt
+        phi_tV = np.zeros_like(t)
+        for on, off in pulses:
+            phi_tV[(t > on) & (t < off)] = max(phiOn, 0)
+        return phi_tV
+
     def runTrial(self, RhO, phiOn, V, Dt_delay, cycles, dt, verbose=config.verbose):
-        """Main routine for simulating a square pulse train."""
+        """
+        Main routine for simulating a square pulse train.
+
+        The pulse train is compiled into a single ``TimedArray`` so that the
+        whole trial takes one ``Network.run`` (see :meth:`runTrialPhases` for
+        the previous run per phase).
+        """
 
         nPulses = cycles.shape[0]
+        pulses, Dt_total = cycles2times(cycles, Dt_delay)
 
         if verbose > 1:
-            if V is not None:
-                Vstr = 'V = {:+}mV, '.format(V)
-            else:
-                Vstr = ''
-            info = ("Simulating experiment at phi = {:.3g}photons/mm^2/s, "
-                   "{}pulse cycles: [Dt_delay={:.4g}ms".format(phiOn, Vstr, Dt_delay))
-            for p in range(nPulses):
-                info += "; [Dt_on={:.4g}ms; Dt_off={:.4g}ms]".format(cycles[p, 0], cycles[p, 1])
-            info += "]"
-            print(info)
+            print(self.trialInfo(V, Dt_delay, cycles, phiOn))
+
+            report = 'text'  # 'stdout', 'stderr', function
+        else:
+            report = None
+
+        RhO.initStates(0)  # Reset state and time arrays from previous runs
+        RhO.s0 = RhO.states[-1, :]   # Store initial state used
+        if verbose > 1:
+            print("Trial initial conditions:{}".format(RhO.s0))
+
+        self.setStimulus(self.getPulseArray(phiOn, Dt_delay, cycles, dt), dt)
+        self.net.run(duration=Dt_total*ms, namespace=self.namespace, report=report)
+
+        I_RhO, t, states = self.collectRecords(RhO, V)
+        self.storePulses(RhO, t, pulses, phiOn)
+        return I_RhO, t, states
+
+    def collectRecords(self, RhO, V):
+        """Store the recorded states in ``RhO`` and return the photocurrent."""
+        '''
+        There are two subtly different ways to get the values for specific neurons:
+        you can either index the 2D array stored in the attribute with the variable name (as in the example above)
+        or you can index the monitor itself. The former will use an index relative to the recorded neurons
+        (e.g. M.v[1] will return the values for the second recorded neuron which is the neuron with the index 10
+        whereas M.v[10] would raise an error because only three neurons have been recorded),
+        whereas the latter will use an absolute index corresponding to the recorded group
+        (e.g. M[1].v will raise an error because the neuron with the index 1 has not been recorded
+        and M[10].v will return the values for the neuron with the index 10).
+        If all neurons have been recorded (e.g. with record=True) then both forms give the same result.
+        '''
+        # Last value is not automatically recorded!
+        # https://github.com/brian-team/brian2/issues/452
+        self.monitors['states'].record_single_timestep()
+        # Only the first recorded neuron is used for the photocurrent
+        soln = np.hstack([self.monitors['states'].variables[s].get_value()[:, :1]
+                          for s in self.stateVars])
+        t = self.monitors['states'].t/ms
+        RhO.storeStates(soln[1:], t[1:])
+        states, t = RhO.getStates()
+
+        if V is not None:  # and 'I' in self.monitors:
+            I_RhO = RhO.calcI(V, RhO.states)
+        else:
+            self.monitors['I'].record_single_timestep()
+            I_RhO = self.monitors['I'].variables[self.varIrho].get_value()[:, 0] * 1e9  # / nA
+        self.monitors['V'].record_single_timestep()
+        return I_RhO, t, states
+
+    def runTrialPhases(self, RhO, phiOn, V, Dt_delay, cycles, dt, verbose=config.verbose):
+        """
+        Simulate a square pulse train with a run per phase, setting the
+        group's (shared) ``phi`` in between. This requires the ``RhO.brian``
+        equations.
+        """
+        if self._phiUpdater is not None:
+            self._phiUpdater.active = False
+
+        nPulses = cycles.shape[0]
+
+        if verbose > 1:
+            print(self.trialInfo(V, Dt_delay, cycles, phiOn))
 
             report = 'text'  # 'stdout', 'stderr', function
         else:
@@ -1104,20 +1791,15 @@ class simBrian(Simulator):
         self.net.run(duration=Dt_delay*ms, namespace=self.namespace, report=report) #brianNamespace
         #self.br.run(duration=Dt_delay*ms, report=report)
 
-        elapsed = Dt_delay
-
         for p in range(nPulses):
 
             ### Light on phase
-            elapsed += cycles[p, 0]
-            onInd = int(round(elapsed/dt))
             # Turn on light and set transition rates
             phi = phiOn if (phiOn > 0) else 0  # Light flux
             #self.namespace.update({'phi':phi*modelUnits['phi_m'], 'stimulus':bool(phi>0)})
-            self.net[self.G_RhO].phi = phi * modelUnits['phi_m']
+            self.net[self.G_RhO].phi = phi * RhO.spectralGain * modelUnits['phi_m']
             #self.net[self.G_RhO].stimulus = True if (phiOn>0) else False #True
             self.net.run(duration=cycles[p, 0]*ms, namespace=self.namespace, report=report)
-            RhO.ssInf.append(RhO.calcSteadyState(phi))
 
             ### Light off phase
             # Turn off light and set transition rates
@@ -1126,41 +1808,9 @@ class simBrian(Simulator):
             #self.net[self.G_RhO].stimulus = False
             #self.namespace.update({'phi':phi*modelUnits['phi_m'], 'stimulus':bool(phi>0)})
             self.net.run(duration=cycles[p, 1]*ms, namespace=self.namespace, report=report)
-            elapsed += cycles[p, 1]
-            offInd = int(round(elapsed/dt))
-
-            RhO.pulseInd = np.vstack((RhO.pulseInd, [onInd, offInd]))
 
-        # Calculate photocurrent
-        '''
-        There are two subtly different ways to get the values for specific neurons:
-        you can either index the 2D array stored in the attribute with the variable name (as in the example above)
-        or you can index the monitor itself. The former will use an index relative to the recorded neurons
-        (e.g. M.v[1] will return the values for the second recorded neuron which is the neuron with the index 10
-        whereas M.v[10] would raise an error because only three neurons have been recorded),
-        whereas the latter will use an absolute index corresponding to the recorded group
-        (e.g. M[1].v will raise an error because the neuron with the index 1 has not been recorded
-        and M[10].v will return the values for the neuron with the index 10).
-        If all neurons have been recorded (e.g. with record=True) then both forms give the same result.
-        '''
-
-        assert(self.monitors['states'].n_indices == 1)  # Assumes that only one neuron is recorded from...
-        # Last value is not automatically recorded!
-        # https://github.com/brian-team/brian2/issues/452
-        self.monitors['states'].record_single_timestep()
-        soln = np.hstack([self.monitors['states'].variables[s].get_value()
-                          for s in self.stateVars])
-        t = self.monitors['states'].t/ms
-        RhO.storeStates(soln[1:], t[1:])
-        states, t = RhO.getStates()
-
-        if V is not None:  # and 'I' in self.monitors:
-            I_RhO = RhO.calcI(V, RhO.states)
-        else:
-            self.monitors['I'].record_single_timestep()
-            I_RhO = self.monitors['I'].variables[self.varIrho].get_value() * 1e9  # / nA
-            I_RhO = np.squeeze(I_RhO)  # Replace with record indexing?
-        self.monitors['V'].record_single_timestep()
+        I_RhO, t, states = self.collectRecords(RhO, V)
+        self.storePulses(RhO, t, cycles2times(cycles, Dt_delay)[0], phiOn)
         return I_RhO, t, states
 
     def runTrialPhi_t(self, RhO, phi_ts, V, Dt_delay, cycles, dt, verbose=config.verbose):
@@ -1173,15 +1823,7 @@ class simBrian(Simulator):
         times, Dt_total = cycles2times(cycles, Dt_delay)
 
         if verbose > 1:
-            if V is not None:
-                Vstr = 'V = {:+}mV, '.format(V)
-            else:
-                Vstr = ''
-            info = "Simulating experiment {}pulse cycles: [Dt_delay={:.4g}ms".format(Vstr, Dt_delay)
-            for p in range(nPulses):
-                info += "; [Dt_on={:.4g}ms; Dt_off={:.4g}ms]".format(cycles[p, 0], cycles[p, 1])
-            info += "]"
-            print(info)
+            print(self.trialInfo(V, Dt_delay, cycles))
 
             report = 'text'  # 'stdout', 'stderr', function
         else:
@@ -1214,51 +1856,241 @@ class simBrian(Simulator):
             phi_t = phi_ts[p]
             phiPulse = phi_t(tPulse)  # -tPulse[0] # Align time vector to 0 for phi_t to work properly
 
-            onInd = len(t) - 1  # Start of on-phase
-            offInd = onInd + int(round(Dt_on/dt))
-            RhO.pulseInd = np.vstack((RhO.pulseInd, [onInd, offInd]))
-
             t = np.r_[t, tPulse[1:]]
             phi_tV = np.r_[phi_tV, phiPulse[1:]]
 
-            RhO.ssInf.append(RhO.calcSteadyState(phi_t(end-Dt_off)))
-
         phi_tV[np.ma.where(phi_tV < 0)] = 0  # Safeguard for negative phi values # np.clip(phi_tV, 0, phiMax)?
-        phi = self.br.TimedArray(phi_tV * modelUnits['phi_m'], dt=dt*ms, name='phi')  # 'phi_t'
-        self.namespace.update({'phi': phi})
+        self.setStimulus(phi_tV, dt)
         self.net.run(duration=duration*ms, namespace=self.namespace, report=report)
 
-        # Calculate photocurrent
-        assert(self.monitors['states'].n_indices == 1)  # Assumes that only one neuron is recorded
-        # Last value is not automatically recorded!
-        # https://github.com/brian-team/brian2/issues/452
-        self.monitors['states'].record_single_timestep()
-        soln = np.hstack([self.monitors['states'].variables[s].get_value()
-                          for s in self.stateVars])
-        t = self.monitors['states'].t/ms
-        RhO.storeStates(soln[1:], t[1:])
-        states, t = RhO.getStates()
+        I_RhO, t, states = self.collectRecords(RhO, V)
+        self.storePulses(RhO, t, times, phi_ts=phi_ts)
+        return I_RhO, t, states
 
-        if V is not None:  # and 'I' in self.monitors:
-            I_RhO = RhO.calcI(V, RhO.states)
-        else:
-            self.monitors['I'].record_single_timestep()
-            I_RhO = self.monitors['I'].variables[self.varIrho].get_value() * 1e9  # / nA
-            I_RhO = np.squeeze(I_RhO)  # Replace with record indexing?
-        self.monitors['V'].record_single_timestep()
+    def batchEquations(self, RhO, standalone=False):
+        """
+        Rhodopsin equations for a group with one neuron per condition.
 
-        #for mon in self.monitors:
-        #    mon.record_single_timestep()
-        return I_RhO, t, states
+        The flux is read from a 2D ``TimedArray`` (``phi(t, i)``) and each
+        neuron is clamped at its own (constant) voltage ``v``. For standalone
+        builds the model parameters are declared as shared constants so that
+        they may be set at run time rather than compiled into the code. Only
+        exponents (which Brian needs to check the units) remain constants.
+        """
+        eqs = RhO.brian_phi_t.replace('phi(t)', 'phi(t, i)').replace('(shared)', '')
+        eqs += """            v : volt (constant)
+            """
+        if standalone:
+            for p in RhO.paramsList:
+                if (re.search(r'\b{}\b'.format(p), eqs)
+                        and not re.search(r'\*\*\s*{}\b'.format(p), eqs)):
+                    dim = self.br.get_dimensions(modelUnits[p])
+                    unit = '1' if dim.is_dimensionless else repr(self.br.get_unit(dim))
+                    eqs += "            {} : {} (shared, constant)\n".format(p, unit)
+        return eqs
+
+    def standaloneDir(self, eqs, N, method, constants):
+        """Cache directory of the C++ project for a batch group."""
+        import brian2
+        key = hashlib.sha256(repr((brian2.__version__, eqs, N, method,
+                                   sorted(constants.items()))).encode())
+        return os.path.join(os.path.expanduser(config.cacheDir), 'brian',
+                            key.hexdigest()[:16])
+
+    def getStimArrays(self, Dt_total, dt):
+        """
+        Flux for every (run, phi) condition sampled at ``dt`` over ``Dt_total``.
+
+        Row ``k`` holds the flux during the step [k*dt, (k+1)*dt) as read by
+        a ``TimedArray``, evaluated at the middle of the step so that pulse
+        edges on the time grid are exact. Runs shorter than ``Dt_total`` are
+        padded with darkness.
+        """
+        Prot = self.Prot
+        t = (np.arange(int(round(Dt_total/dt))) + 0.5) * dt
+        phis = np.zeros((len(t), Prot.nRuns, Prot.nPhis))
+        for run in range(Prot.nRuns):
+            for phiInd in range(Prot.nPhis):
+                phis[:, run, phiInd] = Prot.getStimArray(run, phiInd, dt, t=t)
+        return phis
+
+    def integrateBatch(self, phis, Vs, Dt_total, dt, method, standalone=False,
+                       verbose=config.verbose):
+        """
+        Integrate a group of rhodopsins, one per column of ``phis`` [ph./mm^2/s]
+        and clamp voltage in ``Vs`` [mV], returning the time [ms] and states
+        (time x neuron x state).
+
+        In standalone mode the group is built with Brian's ``cpp_standalone``
+        device in a project directory cached per equations, group size and
+        method. The model parameters, voltages, initial states and stimulus
+        are passed as run-time arguments so later protocols (of the same
+        duration) reuse the compiled binary.
+        """
+        br, RhO = self.br, self.RhO
+        eqs = self.batchEquations(RhO, standalone)
+        N = len(Vs)
+        namespace = self.setParams(RhO)
+        if standalone:
+            declared = re.findall(r'^\s*(\w+)\s*:.*\(shared, constant\)', eqs, re.M)
+            namespace = {p: v for p, v in namespace.items() if p not in declared}
+            directory = self.standaloneDir(eqs, N, method, namespace)
+            if verbose > 0:
+                print("Building C++ standalone project in '{}'".format(directory))
+            br.set_device('cpp_standalone', directory=directory, build_on_run=False)
+        try:
+            phi = br.TimedArray(phis * modelUnits['phi_m'], dt=dt*ms, name='phi')
+            namespace['phi'] = phi
+            G = br.NeuronGroup(N, eqs, namespace=namespace, method=method,
+                               name='RhO_batch')
+            initial = {s: o for s, o in zip(self.stateVars[:-1], RhO.s_0[:-1])}
+            G.set_states(initial)
+            G.v = Vs * modelUnits['v']
+            monitor = br.StateMonitor(G, self.stateVars, record=True,
+                                      name='RhO_batch_states')
+            net = br.Network(G, monitor, name='RhO_batch_network')
+            net.run(Dt_total*ms, report='text' if verbose > 1 else None)
+            monitor.record_single_timestep()  # The last value is not recorded
+            if standalone:
+                run_args = {getattr(G, p): getattr(RhO, p) * modelUnits[p]
+                            for p in RhO.paramsList if p in G.variables}
+                run_args.update({getattr(G, s): np.full(N, o) for s, o in initial.items()})
+                run_args[G.v] = Vs * modelUnits['v']
+                run_args[phi] = phis * modelUnits['phi_m']
+                br.device.build(directory=directory, run=False, with_output=verbose > 1)
+                br.device.run(directory, with_output=verbose > 1, run_args=run_args)
+            t = monitor.t/ms
+            soln = np.stack([monitor.variables[s].get_value() for s in self.stateVars], axis=-1)
+        finally:
+            if standalone:
+                from brian2.devices.device import reset_device
+                br.device.reinit()
+                reset_device()
+        return t, soln
+
+    def runBatch(self, verbose=config.verbose, method='rk2', standalone=False):
+        """
+        Simulate every (run, phi, V) condition of the protocol in one Brian run.
+
+        A rhodopsin ``NeuronGroup`` is built with one neuron per condition.
+        Each neuron reads its own light stimulus from a 2D ``TimedArray`` and
+        has its own clamp voltage, so the whole protocol is integrated with a
+        single ``Network.run`` (of the longest run) rather than several runs
+        per trial. The simulator's own network is not used.
+
+        Parameters
+        ----------
+        method : str, optional
+            Brian integration method or None to let Brian choose. The default
+            midpoint method only reads the flux of the current step whereas
+            e.g. 'rk4' also reads the next step, blurring the pulse edges.
+        standalone : bool, optional
+            Run the group as a compiled C++ standalone project which is cached
+            (see ``config.cacheDir``) and reused across protocols.
+
+        Returns
+        -------
+        ProtocolData
+            The protocol's data (also stored as ``Prot.PD``).
+        """
+        t0 = wall_time()
+        Prot, RhO = self.Prot, self.RhO
+        self.prepare(Prot)
+        RhO.setWavelength(Prot.lam)
+        if Prot.T is not None:
+            RhO.setTemperature(Prot.T)
+        self.checkModel(RhO)
+        Vs = [RhO.V if V is None else V for V in Prot.Vs]  # No membrane to integrate
+        nConds = Prot.nRuns * Prot.nPhis * Prot.nVs
+        if verbose > 0:
+            print("Running '{}' protocol as a group of {} neurons with Brian..."
+                  .format(Prot, nConds))
+
+        dt = self.dt
+        Dt_totals = [cycles2times(*Prot.getRunCycles(run))[1] for run in range(Prot.nRuns)]
+        Dt_max = max(Dt_totals)
+        # Neuron index i = ((run * nPhis) + phiInd) * nVs + vInd
+        phis = self.getStimArrays(Dt_max, dt) * RhO.spectralGain
+        phis = np.repeat(phis.reshape(len(phis), -1), Prot.nVs, axis=1)
+        t, soln = self.integrateBatch(phis, np.tile(Vs, Prot.nRuns * Prot.nPhis),
+                                      Dt_max, dt, method, standalone, verbose)
+
+        self.initData(Prot)
+
+        i = 0
+        for run in range(Prot.nRuns):
+            cycles, Dt_delay = Prot.getRunCycles(run)
+            pulses, Dt_total = cycles2times(cycles, Dt_delay)
+            nSamples = int(round(Dt_total/dt)) + 1
+            for phiInd, phiOn in enumerate(Prot.phis):
+                phi_ts = Prot.phi_ts[run][phiInd]
+                ssInf = np.array(self.getSteadyStates(RhO, pulses, phi_ts=phi_ts))
+                stim = Prot.getStimArray(run, phiInd, dt)
+                for vInd, V in enumerate(Prot.Vs):
+                    states = soln[:nSamples, i, :]
+                    PC = PhotoCurrent(RhO.calcI(Vs[vInd], states), t[:nSamples],
+                                      pulses, phiOn, V, stimuli=stim, states=states,
+                                      stateLabels=RhO.stateLabels, label=Prot.protocol)
+                    PC.ssInf = ssInf
+                    self.storeTrial(run, phiInd, vInd, PC)
+                    i += 1
+
+        Prot.finish(PC, RhO)
+        self.finish()
+        self.runTime = wall_time() - t0
+        if verbose > 0:
+            print("Finished batch simulation in {:.3g}s".format(self.runTime))
+        return Prot.PD
 
     def saveExtras(self, run, phiInd, vInd):
-        # TODO: Rethink this HACK!!!
-        #self.rasters[run][phiInd][vInd] = copy.copy(self.monitors['spikes'])
-        self.rasters[run][phiInd][vInd] = [{'name': self.monitors['spikes'][lay].name,
-                                            't': self.monitors['spikes'][lay].t/ms,
-                                            'i': self.monitors['spikes'][lay].i,
-                                            'n': len(self.monitors['spikes'][lay].spike_trains())} for lay in range(len(self.monitors['spikes']))]
-        self.Vms[run][phiInd][vInd] = copy.copy(self.monitors['V'])
+        """
+        Store the membrane potential and spikes of a trial with the spike
+        count and mean (and population) rate of each layer. If ``recordPath``
+        is set, the traces and spikes are written to a file there instead
+        of being kept in memory.
+        """
+        Vmon = self.monitors['V']
+        arrays = {'t': Vmon.t/ms, 'v': Vmon.variables[self.varV].get_value() * 1000}  # mV
+        duration = self.net.t/ms
+        layers = []
+        for spikeMon in self.monitors['spikes']:
+            n = len(spikeMon.source)
+            count = np.array(spikeMon.count)
+            layer = {'name': spikeMon.name, 'n': n, 'count': count,
+                     'rate': 1000 * count.sum() / (n * duration)}  # Mean rate [Hz]
+            for rateMon in self.monitors.get('rates', []):
+                if rateMon.source is spikeMon.source:
+                    layer['tRate'], layer['popRate'] = rateMon.t/ms, np.array(rateMon.rate_)
+            if spikeMon.record:
+                arrays[spikeMon.name+'.t'] = spikeMon.t/ms
+                arrays[spikeMon.name+'.i'] = np.array(spikeMon.i)
+            layers.append(layer)
+
+        if self.recordPath is None:
+            self.Vms[run][phiInd][vInd] = {'t': arrays['t'], 'v': arrays['v']}
+            self.rasters[run][phiInd][vInd] = [self._addSpikes(layer, arrays) for layer in layers]
+        else:
+            fileName = os.path.join(self.recordPath, '{}{}s-{}-{}-{}.npz'.format(
+                                    self.Prot.protocol, self.RhO.nStates, run, phiInd, vInd))
+            np.savez(fileName, **arrays)
+            self.Vms[run][phiInd][vInd] = fileName
+            self.rasters[run][phiInd][vInd] = layers
+
+    @staticmethod
+    def _addSpikes(layer, arrays):
+        if layer['name']+'.t' in arrays:
+            layer = dict(layer, t=arrays[layer['name']+'.t'], i=arrays[layer['name']+'.i'])
+        return layer
+
+    def getExtras(self, run, phiInd, vInd):
+        """Return the membrane potential and layers (with any spikes) of a trial,
+        loading them from ``recordPath`` if they were flushed to disk."""
+        Vm, layers = self.Vms[run][phiInd][vInd], self.rasters[run][phiInd][vInd]
+        if isinstance(Vm, str):
+            with np.load(Vm) as arrays:
+                layers = [self._addSpikes(layer, arrays) for layer in layers]
+                Vm = {'t': arrays['t'], 'v': arrays['v']}
+        return Vm, layers
 
     def plotExtras(self):
         Prot = self.Prot
@@ -1269,31 +2101,27 @@ class simBrian(Simulator):
             for phiInd, phiOn in enumerate(Prot.phis):
                 for vInd, V in enumerate(Prot.Vs):
                     col, style = Prot.getLineProps(run, vInd, phiInd)
-                    Vm = self.Vms[run][phiInd][vInd]
-                    spikes = self.rasters[run][phiInd][vInd]  # TODO: Change name
+                    Vm, spikes = self.getExtras(run, phiInd, vInd)
 
                     figName = '{}Vm{}s-{}-{}-{}'.format(Prot.protocol, RhO.nStates, run, phiInd, vInd)
-                    Vmonitor = self.Vms[run][phiInd][vInd]
-                    self.plotVm(Vmonitor=Vmonitor, times=pulses,
+                    self.plotVm(Vm=Vm, times=pulses,
                                 Dt_total=Dt_total, offset=Dt_delay,
                                 figName=figName)
 
                     figName = '{}Spikes{}s-{}-{}-{}'.format(Prot.protocol, RhO.nStates, run, phiInd, vInd)
-                    spikeMonitors = self.rasters[run][phiInd][vInd]
-                    self.plotRasters(spikeSets=spikeMonitors, times=pulses,
+                    self.plotRasters(spikeSets=spikes, times=pulses,
                                      Dt_total=Dt_total, offset=Dt_delay,
                                      figName=figName)
         return
 
-    def plotVm(self, Vmonitor, times=None, Dt_total=None, offset=0, figName=None):  # TODO: REVISE (esp. offset)!!!
+    def plotVm(self, Vm, times=None, Dt_total=None, offset=0, figName=None):  # TODO: REVISE (esp. offset)!!!
         Prot = self.Prot
         RhO = self.RhO
         Vfig = plt.figure()
         axV = Vfig.add_subplot(111)
-        Vm = Vmonitor.variables[self.varV].get_value() * 1000  # Convert to mV # HACK #self.monitors['V']
-        t = Vmonitor.t/ms - offset
+        t = Vm['t'] - offset
         # times -= offset # Do not edit in place or it causes errors in subsequent functions!
-        plt.plot(t, Vm, 'g')
+        plt.plot(t, Vm['v'], 'g')  # [mV]
         plotLight(times - offset, axV)
         axV.set_xlim((-offset, Dt_total - offset))
 
@@ -1342,7 +2170,11 @@ class simBrian(Simulator):
 
             axes[lay] = Rfig.add_subplot(gs[lay])
             gInd = nLayers-lay-1
-            plt.plot(spikeSets[gInd]['t'] - offset, spikeSets[gInd]['i'], '.')
+            if 't' in spikeSets[gInd]:
+                plt.plot(spikeSets[gInd]['t'] - offset, spikeSets[gInd]['i'], '.')
+                axes[lay].set_ylim((0, spikeSets[gInd]['n']))
+            elif 'popRate' in spikeSets[gInd]:  # Spikes were not recorded
+                plt.plot(spikeSets[gInd]['tRate'] - offset, spikeSets[gInd]['popRate'])
             plt.ylabel(r'$\mathrm{' + spikeSets[gInd]['name'] + '}$')
             if gInd > 0:
                 plt.setp(axes[lay].get_xticklabels(), visible=False)
@@ -1352,7 +2184,6 @@ class simBrian(Simulator):
             if times is not None:
                 plotLight(times - offset, axes[lay])
 
-            axes[lay].set_ylim((0, spikeSets[gInd]['n']))
             axes[lay].set_xlim((-offset, Dt_total - offset))
 
         plt.tight_layout()
@@ -1372,3 +2203,37 @@ simulators = OrderedDict([('Python', simPython),
 # TODO: Use this for loading components of the GUI
 # TODO: Check on initialising sim objects and raise an error if unavailable
 simAvailable = OrderedDict([(sim, simAvailable(sim)) for sim in simulators])
+
+
+def selectSimulator(Prot, RhO=None, requires=()):
+    """
+    Select the cheapest available simulator for a protocol.
+
+    Parameters
+    ----------
+    Prot : Protocol
+        Protocol to be simulated (see :meth:`Protocol.getRequirements`).
+    RhO : RhodopsinModel, optional
+        Model to be simulated. An action spectrum requires the ``spectral``
+        capability if the protocol sets a wavelength.
+    requires : iterable, optional
+        Any additional capabilities required e.g. ``['batch']``.
+
+    Returns
+    -------
+    str
+        Name of the installed simulator with every required capability and
+        the lowest cost for the protocol's stimulus (see
+        :meth:`Simulator.getCost`). Simulators of unknown cost come last and
+        ties are broken by the order of ``simulators``.
+    """
+    requires = set(requires) | Prot.getRequirements()
+    if RhO is not None and RhO.actionSpectrum is not None and Prot.lam is not None:
+        requires.add('spectral')
+    capable = [sim for sim, simClass in simulators.items()
+               if simAvailable[sim] and simClass.supports(*requires)]
+    if not capable:
+        raise ValueError("No available simulator supports: {}"
+                         .format(', '.join(sorted(requires))))
+    costs = {sim: simulators[sim].getCost(Prot) for sim in capable}
+    return min(capable, key=lambda sim: (costs[sim] is None, costs[sim] or 0))
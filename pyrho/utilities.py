@@ -1,10 +1,12 @@
 """General utility functions used throughout PyRhO."""
 
 import os
+import sys
 import copy
 import warnings
 import logging
 import pickle
+import tracemalloc
 from string import Template
 
 import numpy as np
@@ -13,7 +15,7 @@ import matplotlib.pyplot as plt
 
 from pyrho import config
 
-__all__ = ['Timer', 'saveData', 'loadData', 'getExt', 'getIndex', 'calcV1',
+__all__ = ['Timer', 'RecordSink', 'logSink', 'memoryPeak', 'saveData', 'loadData', 'getExt', 'getIndex', 'calcV1',
            'lam2rgb', 'irrad2flux', 'flux2irrad', 'times2cycles', 'cycles2times',
            'plotLight', 'plot_light_bar', 'setCrossAxes', 'round_sig']
 
@@ -56,6 +58,98 @@ class Timer:
         self.interval = 0
 
 
+class RecordSink:
+    """
+    Collect the instrumentation records emitted by a simulator.
+
+    Any callable accepting a ``dict`` may be used as a sink. Records have an
+    ``event`` key ('trial' or 'protocol') along with the protocol conditions
+    and timings [s].
+
+    Examples
+    --------
+    >>> sim.sink = RecordSink()
+    >>> sim.run()
+    >>> sim.sink.summary()
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def clear(self):
+        """Discard all records."""
+        self.records = []
+
+    def summary(self, event='trial'):
+        """
+        Total all numerical fields over the records of an event type.
+
+        Returns
+        -------
+        dict
+            Totals for each timing, counter and memory field (memory fields
+            are maxima).
+        """
+        totals = {}
+        for record in self.records:
+            if record.get('event') != event:
+                continue
+            for key, value in record.items():
+                if key in ('event', 'run', 'phiInd', 'vInd', 'phi', 'V') \
+                        or not isinstance(value, (int, float)):
+                    continue
+                if key.startswith('mem'):
+                    totals[key] = max(totals.get(key, value), value)
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def toDF(self):
+        """Export the records to a pandas DataFrame."""
+        if not config.check_package('pandas'):
+            warnings.warn('Pandas not found!')
+            return
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+
+def logSink(record):
+    """Instrumentation sink which writes each record to the log."""
+    logger.info(' '.join(f'{k}={v}' for k, v in record.items()))
+
+
+def memoryPeak(reset=False):
+    """
+    Return the memory high-water mark [bytes].
+
+    If ``tracemalloc`` is tracing, its peak is returned, otherwise the maximum
+    resident set size of the process is used. Returns ``None`` if neither is
+    available.
+
+    Parameters
+    ----------
+    reset : bool
+        Reset the ``tracemalloc`` peak so that the next call measures the
+        peak since this one (the resident set size cannot be reset).
+    """
+    if tracemalloc.is_tracing():
+        _, peak = tracemalloc.get_traced_memory()
+        if reset and hasattr(tracemalloc, 'reset_peak'):  # Python >= 3.9
+            tracemalloc.reset_peak()
+        return peak
+    try:
+        import resource
+    except ImportError:  # e.g. Windows
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
 # The following two functions are only used in fitModel
 def printParams(params):
     """
@@ -0,0 +1,145 @@
+"""
+Light waveforms phi(t) for individual stimulation pulses
+    * ``Step`` for square pulses
+    * ``Ramp`` for linearly changing flux
+    * ``Cosine`` for sinusoidal modulation
+    * ``Chirp`` for linear and exponential frequency sweeps
+
+Waveforms are evaluated exactly (rather than interpolated) and are zero
+outside of the pulse, so they may be used wherever an interpolating spline
+``phi_t(t)`` was previously expected.
+"""
+
+import numpy as np
+
+__all__ = ['Waveform', 'Step', 'Ramp', 'Cosine', 'Chirp']
+
+
+class Waveform(object):
+    """
+    Common base class for all light waveforms.
+
+    Parameters
+    ----------
+    t_on : float
+        Time [ms] at which the pulse starts.
+    t_off : float
+        Time [ms] at which the pulse ends.
+    phi : float
+        Flux amplitude [ph./mm^2/s].
+    phi0 : float, optional
+        Background flux offset [ph./mm^2/s] during the pulse (default=0).
+    """
+
+    def __init__(self, t_on, t_off, phi, phi0=0):
+        assert t_off >= t_on
+        self.t_on = t_on
+        self.t_off = t_off
+        self.phi = phi
+        self.phi0 = phi0
+
+    def __repr__(self):
+        return "<PyRhO {} Waveform [{}, {}]ms>".format(type(self).__name__,
+                                                      self.t_on, self.t_off)
+
+    def __call__(self, t):
+        """Evaluate the flux at time(s) ``t`` [ms] (zero outside the pulse)."""
+        if np.isscalar(t):
+            if self.t_on <= t <= self.t_off:
+                return self._eval(t - self.t_on)
+            return 0.
+        t = np.asarray(t, dtype=float)
+        on = (t >= self.t_on) & (t <= self.t_off)
+        phi_t = np.zeros_like(t)
+        phi_t[on] = self._eval(t[on] - self.t_on)
+        return phi_t
+
+    @property
+    def Dt_on(self):
+        """Duration of the pulse [ms]."""
+        return self.t_off - self.t_on
+
+    @property
+    def breakpoints(self):
+        """Times [ms] at which the waveform (or its derivative) is
+        discontinuous, for integrators to step to exactly."""
+        return np.array([self.t_on, self.t_off])
+
+    def _eval(self, t):
+        """Evaluate the waveform at times ``t`` relative to ``t_on``."""
+        raise NotImplementedError
+
+
+class Step(Waveform):
+    """Square pulse of constant flux ``phi0 + phi``."""
+
+    def _eval(self, t):
+        return self.phi0 + self.phi + 0. * t
+
+
+class Ramp(Waveform):
+    """Flux changing linearly from ``phi0`` to ``phi0 + phi``."""
+
+    def _eval(self, t):
+        if self.Dt_on == 0:
+            return self.phi0 + self.phi + 0. * t
+        return self.phi0 + self.phi * t / self.Dt_on
+
+
+class Cosine(Waveform):
+    """
+    Raised cosine modulation between ``phi0`` and ``phi0 + phi``.
+
+    Parameters
+    ----------
+    w : float
+        Angular frequency [rads/ms].
+    startOn : bool, optional
+        Start at the maximum (``True``) or minimum (default) of the cycle.
+    """
+
+    def __init__(self, t_on, t_off, phi, phi0=0, w=0, startOn=False):
+        super().__init__(t_on, t_off, phi, phi0)
+        self.w = w
+        self.sign = 1 if startOn else -1
+
+    def _phase(self, t):
+        return self.w * t
+
+    def _eval(self, t):
+        return self.phi0 + 0.5 * self.phi * (1 + self.sign * np.cos(self._phase(t)))
+
+
+class Chirp(Cosine):
+    """
+    Raised cosine with a frequency sweeping from ``f0`` to ``fT`` [Hz] over
+    the pulse.
+
+    Parameters
+    ----------
+    f0 : float
+        Initial frequency [Hz].
+    fT : float
+        Final frequency [Hz].
+    linear : bool, optional
+        Sweep the frequency linearly (default) or exponentially.
+    startOn : bool, optional
+        Start at the maximum (``True``) or minimum (default) of the cycle.
+    """
+
+    def __init__(self, t_on, t_off, phi, phi0=0, f0=0, fT=0, linear=True,
+                 startOn=False):
+        super().__init__(t_on, t_off, phi, phi0, startOn=startOn)
+        self.f0 = f0
+        self.fT = fT
+        self.linear = linear
+
+    def _phase(self, t):
+        """Integral of the instantaneous angular frequency from t_on to t."""
+        T = self.Dt_on
+        f0, fT = self.f0 / 1000, self.fT / 1000  # [cycles/ms]
+        if self.linear or f0 == fT:
+            return 2 * np.pi * (f0 * t + 0.5 * (fT - f0) * t**2 / T)
+        else:  # Exponential sweep: f(t) = f0 * (fT/f0)**(t/T)
+            k = np.log(fT / f0)
+            return 2 * np.pi * f0 * T * np.expm1(k * t / T) / k
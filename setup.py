@@ -127,7 +127,7 @@ setup(
     # ipython is used for latex repr - remove from requirements and have a fallback repr?
     install_requires=[
         'numpy>=1.8',
-        'scipy>=0.15',
+        'scipy>=1.6',
         'matplotlib>=1.3',
         # 'lmfit>=0.9.3,<1.0.3',
         'lmfit>=1.0.3',
@@ -0,0 +1,20 @@
+import os
+
+from pyrho import config
+
+
+def test_mechanism_cache(tmp_path):
+    mod = tmp_path / 'RhO.mod'
+    mod.write_text('NEURON { POINT_PROCESS RhO }')
+    key = config.mechanismHash([str(mod)])
+    assert config.mechanismHash([str(mod)]) == key
+    assert config.mechanismHash() != key
+
+    # A completed build is reused without recompiling
+    target = tmp_path / 'cache' / 'nrnmech' / key[:16]
+    target.mkdir(parents=True)
+    (target / 'complete').touch()
+    assert config.compileMechanisms([str(mod)], path=str(tmp_path / 'cache')) == str(target)
+
+    mod.write_text('NEURON { POINT_PROCESS RhO2 }')
+    assert config.mechanismHash([str(mod)]) != key
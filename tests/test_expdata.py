@@ -0,0 +1,30 @@
+import numpy as np
+
+from pyrho.expdata import PhotoCurrent, _runningMean
+
+
+def _make_pc(dt=0.01):
+    t = np.arange(0, 200+dt, dt)
+    I = np.where((t >= 50) & (t < 150), -1 + 0.5*np.exp(-(t-50)/10), 0.)
+    I += 0.05 * np.random.RandomState(42).randn(len(t))
+    return PhotoCurrent(I, t, [[50, 150]], 1e17, -70)
+
+
+def test_running_mean_matches_convolve():
+    x = np.random.RandomState(0).randn(1001)
+    for nPoints in (1, 4, 25):
+        expected = np.convolve(x, np.ones(nPoints)/nPoints, mode='same')
+        assert np.allclose(_runningMean(x, nPoints), expected)
+
+
+def test_filter_and_decimate():
+    pc = _make_pc()
+    I_span = pc.I_span_
+    pc.filterData(method='sos', f_cutoff=500)
+    assert pc.isFiltered and pc._I_orig is not None
+    assert pc.I_span_ < I_span
+    assert np.isclose(pc.I_ss_, -1, atol=0.05)
+    pcd = pc.decimate(10)
+    assert pcd.nSamples == int(np.ceil(pc.nSamples/10))
+    assert np.isclose(pcd.dt, 10*pc.dt)
+    assert np.isclose(pcd.I_ss_, pc.I_ss_, atol=0.01)
@@ -4,7 +4,7 @@ from pyrho import Parameters, fitModels
 from pyrho.datasets import loadChR2
 
 
-def test_fit_3_state_model():
+def _initParams():
     init_params = Parameters()
     init_params.add_many(
         # Name   Value   Vary    Min     Max     Expr
@@ -19,8 +19,12 @@ def test_fit_3_state_model():
         ('E',    0,      True,   -1000,  1000,   None),
         ('v0',   43,     True,   -1e15,  1e15,   None),
         ('v1',   17.1,   True,   -1e15,  1e15,   None))
+    return init_params
+
+
+def test_fit_3_state_model():
     data = loadChR2()
-    fit_params, mini_objs = fitModels(data, nStates='3', params=init_params, postFitOpt=True, relaxFact=2, plot=False)
+    fit_params, mini_objs = fitModels(data, nStates='3', params=_initParams(), postFitOpt=True, relaxFact=2, plot=False)
     values = fit_params[0].valuesdict()
     # print(values, flush=True)
     # OrderedDict([('g0', 28551.460430437444), ('phi_m', 7.45862659417406e+17), ('k_a', 6.622531560387775), ('k_r', 0.08504416795822778),
@@ -36,3 +40,33 @@ def test_fit_3_state_model():
     assert np.isclose(values["E"], 0)
     assert np.isclose(values["v0"], 43)
     assert np.isclose(values["v1"], 17.1)
+
+
+def test_fit_callback():
+    import pytest
+    from matplotlib import pyplot as plt
+    from pyrho.fitting import plotFits
+    data = loadChR2()
+    evaluations = []
+
+    def count(params, iteration, resid, *args, **kws):
+        evaluations.append(iteration)
+
+    fit_params, mini_objs = fitModels(data, nStates='3', params=_initParams(), plot=False,
+                                      iterCallback=count)
+    assert len(evaluations) >= mini_objs[0].nfev
+
+    # The fits can be plotted afterwards (e.g. on another thread)
+    nFigs = len(plt.get_fignums())
+    plotFits(data, 3, fit_params[0])
+    assert len(plt.get_fignums()) == nFigs + data['step'].nPhis + 1
+    plt.close('all')
+
+    class Stop(Exception):
+        pass
+
+    def stop(params, iteration, resid, *args, **kws):
+        if iteration > 2:
+            raise Stop
+    with pytest.raises(Stop):
+        fitModels(data, nStates='3', params=_initParams(), plot=False, iterCallback=stop)
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+
+def test_task_runner():
+    import pytest
+    pytest.importorskip('ipywidgets')
+    from matplotlib import pyplot as plt
+    from pyrho.jupytergui import TaskRunner, Cancelled
+
+    runner = TaskRunner()
+    userFig = plt.figure()
+    results, threads = [], []
+
+    def task(nTrials):
+        for trial in range(nTrials):
+            runner.sink({'event': 'trial'})
+        return nTrials
+
+    def onResult(result):
+        results.append(result)
+        threads.append(threading.current_thread())
+        plt.figure()
+
+    async def main():
+        runner.submit('task', task, (3,), total=3, onResult=onResult)
+        assert runner.submit('task', task, (3,)) is None  # Busy
+        while runner.busy():
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert results == [3] and threads == [threading.main_thread()]
+    assert runner.progress.value == 3 and runner.status.value == 'Finished: task'
+    assert len(runner.output.outputs) == 1  # The task's figure only
+    assert plt.get_fignums() == [userFig.number]
+
+    # A fit's evaluations cycle the progress bar
+    def fit(nEvaluations):
+        for iteration in range(nEvaluations):
+            runner.iterCallback(None, iteration, None)
+        return nEvaluations
+
+    async def main():
+        runner.submit('fit', fit, (12,), total=10, onResult=onResult)
+        while runner.busy():
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert results == [3, 12] and runner.status.value == 'Finished: fit'
+
+    # Cancelling stops a simulation at its next sink call and a fit at its next evaluation
+    for callback in [lambda: runner.sink({'event': 'trial'}),
+                     lambda: runner.iterCallback(None, 0, None)]:
+        started = threading.Event()
+
+        def endless():
+            started.set()
+            while True:
+                callback()
+
+        future = runner.submit('endless', endless, total=10, onResult=onResult)
+        started.wait(5)
+        runner.cancel()
+        with pytest.raises(Cancelled):
+            future.result(timeout=5)
+        while runner.busy():
+            threading.Event().wait(0.01)
+        assert runner.status.value == 'Cancelled: endless' and results == [3, 12]
+    assert plt.get_fignums() == [userFig.number]
+    plt.close(userFig)
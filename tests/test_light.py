@@ -0,0 +1,27 @@
+import numpy as np
+
+import pyrho as pyr
+from pyrho.light import fiberTransmission, fiberFlux
+
+
+def test_fiber_transmission():
+    z = np.linspace(0, 2, 201)
+    T = fiberTransmission(z)
+    assert np.isclose(T[0], 1) and np.all(np.diff(T) < 0)
+    assert np.allclose(fiberTransmission(z, mu=0.5), T * (11.2*z + 1) * np.exp(-0.5*z))
+    assert np.allclose(fiberFlux(10, z), pyr.irrad2flux(10*T))
+
+
+def test_depth_profile():
+    depths = np.array([0.1, 0.5, 1.0])
+    rho = pyr.models['4']()
+    prot = pyr.protocols['step'](saveData=False)
+    prot.phis, prot.Vs = [pyr.irrad2flux(10)], [-70]
+    sim = pyr.simulators['Python'](prot, rho)
+    res = sim.runPopulation(irradiance=fiberTransmission(depths), V=-70, verbose=0)
+    prot.phis = list(fiberFlux(10, depths))
+    prot.prepare()
+    sim.run(verbose=0)
+    for cell in range(len(depths)):
+        pc = prot.PD.trials[0][cell][0]
+        assert np.isclose(res['I_peak'][cell], pc.I_peak_)
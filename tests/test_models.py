@@ -0,0 +1,92 @@
+import numpy as np
+from scipy.integrate import odeint
+
+from pyrho import models
+
+
+def test_frequency_response_matches_simulation():
+    rho = models['6']()
+    phi0, dphi, f = 1e17, 1e15, 10
+    H, gain, phase = rho.calcFrequencyResponse([f], phi0)
+    assert np.isclose(gain[0], abs(H[0])) and np.isclose(phase[0], np.angle(H[0]))
+
+    # Simulate a small sinusoidal perturbation about the steady-state
+    w = 2 * np.pi * f / 1000
+    t = np.linspace(0, 2000, 40001)
+    soln = odeint(rho.solveStates, rho.calcSteadyState(phi0), t,
+                  args=(lambda t: phi0 + dphi*np.cos(w*t),), Dfun=rho.jacobian,
+                  rtol=1e-10, atol=1e-12)
+    late = t >= 1500
+    fphi = rho.calcfphi(soln[late])
+    H_sim = 2 * np.mean((fphi - fphi.mean()) * np.exp(-1j*w*t[late])) / dphi
+    assert np.isclose(abs(H_sim), gain[0], rtol=1e-3)
+    assert np.isclose(np.angle(H_sim), phase[0], atol=1e-3)
+
+
+def test_analytic_solution_matches_odeint():
+    for nStates in ['4', '6']:
+        rho = models[nStates]()
+        assert rho.useAnalyticSoln
+        t = np.linspace(100, 600, 5001)
+        for phi, s0 in [(1e17, rho.s_0), (0, rho.calcSteadyState(1e17))]:
+            rho.setLight(phi)
+            expected = odeint(rho.solveStates, s0, t - t[0], args=(None,),
+                              Dfun=rho.jacobian, rtol=1e-11, atol=1e-13)
+            assert np.allclose(rho.calcSoln(t, s0), expected, atol=1e-9)
+
+
+def test_eigen_cache_invalidation():
+    from pyrho.parameters import modelParams
+    rho = models['4']()
+    t = np.linspace(0, 100, 101)
+    rho.setLight(1e17)
+    s1 = rho.calcSoln(t, rho.s_0)
+    eig = rho.calcEigenSystem()
+    assert rho.calcEigenSystem() is eig
+    params = modelParams['4'].copy()
+    params['Gd1'].value *= 2
+    rho.updateParams(params)
+    rho.setLight(1e17)
+    assert rho.calcEigenSystem() is not eig
+    assert not np.allclose(rho.calcSoln(t, rho.s_0), s1)
+    for phi in np.logspace(10, 20, 2 * rho.eigenCacheSize):
+        rho.setLight(phi)
+        rho.calcEigenSystem()
+    assert len(rho._eigenCache) == rho.eigenCacheSize
+
+
+def test_temperature_scaling():
+    from pyrho.parameters import modelParams
+    for nStates in ['3', '4', '6']:
+        rho = models[nStates]()
+        rho.Q10 = 3.
+        rho.setLight(1e17)
+        A_ref = rho.jacobian(None, 0)
+        eig = rho.calcEigenSystem()
+        rho.setTemperature(rho.T_ref + 10)
+        assert np.allclose(rho.jacobian(None, 0), 3 * A_ref)
+        params = modelParams[nStates].copy()
+        rho.exportParams(params)
+        assert all(params[r].value == modelParams[nStates][r].value
+                   for r in rho.constRates)
+        rho.setTemperature(None)
+        assert rho.calcEigenSystem() is eig  # Cached per temperature
+        rho.setTemperature(rho.T_ref + 10)
+        eig = rho.calcEigenSystem()
+        rho.Q10 = 2.  # Changed directly then applied at the same temperature
+        rho.setTemperature(rho.T_ref + 10)
+        assert rho.calcEigenSystem() is not eig
+        assert np.allclose(rho.jacobian(None, 0), 2 * A_ref)
+
+
+def test_waveform_breakpoints():
+    from pyrho.models import simulateTrial
+    from pyrho.waveforms import Step
+    frozen = models['3']().freeze()
+    # A short pulse between coarse output samples must not be stepped over
+    expected = simulateTrial(frozen, [(50, 0), (0.5, 1e17), (49.5, 0)], -70, 0.5)
+    for method in ['odeint', 'LSODA']:
+        result = simulateTrial(frozen, [(100, Step(50, 50.5, 1e17))], -70, 100,
+                               method=method, rtol=1e-8, atol=1e-10)
+        assert np.allclose(result.t, [0, 100])
+        assert np.allclose(result.states[-1], expected.states[-1], atol=1e-6)
@@ -14,3 +14,50 @@ def test_recovery():
     sim.run()
     assert np.isclose(prot.PD.params[0][0]['Gr0'].value, 0.00033)
     #Sim.plot()
+
+
+def test_stimuli_shared_across_Vs():
+    rho = models['3']()
+    prot = protocols['step'](saveData=False)
+    sim = simulators['Python'](prot, rho)
+    sim.run(verbose=0)
+    for phiInd in range(prot.nPhis):
+        pcs = [prot.PD.trials[0][phiInd][vInd] for vInd in range(prot.nVs)]
+        assert all(pc.stimuli is pcs[0].stimuli for pc in pcs)
+        assert len(pcs[0].stimuli) == pcs[0].nSamples
+        assert not pcs[0].stimuli.flags.writeable
+
+
+def test_waveforms():
+    from pyrho.waveforms import Step, Cosine, Chirp
+    t = np.linspace(0, 200, 2001)
+    assert np.array_equal(Step(50, 150, 2.)(t), np.where((t >= 50) & (t <= 150), 2., 0.))
+    w = 2 * np.pi * 10 / 1000
+    on = (t >= 50) & (t <= 150)
+    expected = np.where(on, 1 + 0.5 * 4 * (1 - np.cos(w * (t - 50))), 0)
+    assert np.allclose(Cosine(50, 150, 4., 1, w=w)(t), expected)
+    # A chirp with equal start and end frequencies is a cosine
+    assert np.allclose(Chirp(50, 150, 4., 1, f0=10, fT=10, linear=False)(t), expected)
+    assert Chirp(50, 150, 4., f0=1, fT=100).breakpoints.tolist() == [50, 150]
+
+
+def test_phase_sampling():
+    from pyrho.protocols import PhaseSampling
+    rho = models['6']()
+    prot = protocols['recovery'](saveData=False)
+    prot.Vs, prot.phis = [-70], [1e17]
+    sim = simulators['Python'](prot, rho)
+    sim.run(verbose=0)
+    uniform = [prot.PD.trials[run][0][0] for run in range(prot.nRuns)]
+    prot.sampling = PhaseSampling(Dt_fine=20, dt_max=10)
+    sim.run(verbose=0)
+    sampled = [prot.PD.trials[run][0][0] for run in range(prot.nRuns)]
+    assert sum(pc.nSamples for pc in sampled) < 0.2 * sum(pc.nSamples for pc in uniform)
+    for pcu, pcs in zip(uniform, sampled):
+        assert not pcs.uniform
+        assert np.allclose(pcs.I_peaks_, pcu.I_peaks_, rtol=1e-3)
+        assert np.isclose(pcs.I_ss_, pcu.I_ss_, rtol=1e-3)
+    assert np.isclose(prot.PD.params[0][0]['Gr0'].value, 0.00033)
+    pc = sampled[0].resample(0.1)
+    assert pc.uniform and pc.nSamples == uniform[0].nSamples
+    assert np.allclose(pc.I, uniform[0].I, atol=1e-3 * abs(uniform[0].I_peak_))
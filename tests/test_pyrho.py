@@ -1,6 +1,7 @@
 import numpy as np
 
 import pyrho as pyr
+from pyrho.parameters import PyRhOparameters
 
 
 def test_run():
@@ -46,3 +47,321 @@ def test_run():
 #         for volt in range(6):
 #             pc = results['Python']['step']['6'].trials[run][phi][volt]
 #             print(pc.Dt_total, pc.t_peak_, pc.I_peak_, pc.I_ss_)
+
+
+def test_instrumentation_sink():
+    sink = pyr.RecordSink()
+    sim = pyr.simulators['Python'](pyr.protocols['custom'](saveData=False), pyr.models['4']())
+    sim.sink = sink
+    sim.run(verbose=0)
+    trials = [r for r in sink.records if r['event'] == 'trial']
+    assert len(trials) == sim.Prot.nRuns * sim.Prot.nPhis * sim.Prot.nVs
+    assert sink.records[-1]['event'] == 'protocol'
+    totals = sink.summary()
+    assert totals['nRHS'] > 0 and totals['integration'] > 0
+    # The stages partition each trial's time
+    stages = ['initialise', 'integration', 'stimulus', 'photocurrent', 'extras']
+    assert np.isclose(sum(totals[stage] for stage in stages), totals['total'])
+
+
+def test_memory_peak():
+    import tracemalloc
+    sink = pyr.RecordSink()
+    sim = pyr.simulators['Python'](pyr.protocols['step'](saveData=False), pyr.models['6']())
+    sim.sink = sink
+    tracemalloc.start()
+    try:
+        sim.run(verbose=0)
+        assert pyr.memoryPeak() == pyr.memoryPeak()  # Not reset by default
+    finally:
+        tracemalloc.stop()
+    peaks = [r['memPeak'] for r in sink.records if r['event'] == 'trial']
+    assert sink.records[-1]['memPeak'] >= max(peaks)
+
+
+def test_legacy_sim_params():
+    params = PyRhOparameters()
+    params.add('dt', 0.1)  # Only the time step (no integrator settings)
+    sim = pyr.simulators['Python'](pyr.protocols['step'](saveData=False), pyr.models['3'](), params)
+    assert sim.integrator == 'odeint' and sim.dense
+    sim.run(verbose=0)
+
+
+def test_adaptive_integration():
+    params = PyRhOparameters()
+    params.add_many(('dt', 0.1, 0, None), ('integrator', 'LSODA', None, None),
+                    ('rtol', 1e-6, 0, None), ('atol', 1e-9, 0, None),
+                    ('dense', True, False, True))
+    currents = {}
+    for integrator in ['odeint', 'LSODA']:
+        params['integrator'].value = integrator
+        sim = pyr.simulators['Python'](pyr.protocols['step'](saveData=False),
+                                       pyr.models['6'](), params)
+        sim.run(verbose=0)
+        currents[integrator] = sim.Prot.PD.trials[0][0][0]
+    assert np.allclose(currents['LSODA'].t, currents['odeint'].t)
+    assert np.allclose(currents['LSODA'].I, currents['odeint'].I, atol=1e-5)
+
+    params['dense'].value = False
+    sim = pyr.simulators['Python'](pyr.protocols['step'](saveData=False),
+                                   pyr.models['6'](), params)
+    sim.run(verbose=0)
+    pc = sim.Prot.PD.trials[0][0][0]
+    assert pc.nSamples < currents['odeint'].nSamples
+    assert np.isclose(pc.I_ss_, currents['odeint'].I_ss_, rtol=1e-3)
+
+
+def test_population():
+    rho = pyr.models['6']()
+    prot = pyr.protocols['step'](saveData=False)
+    prot.Vs = [-70]
+    sim = pyr.simulators['Python'](prot, rho)
+    sim.run(verbose=0)
+    pcs = [prot.PD.trials[0][phiInd][0] for phiInd in range(prot.nPhis)]
+    # Two cells with the protocol's fluxes and double the conductance
+    ratio = prot.phis[1] / prot.phis[0]
+    res = sim.runPopulation({'g0': [2*rho.g0, 2*rho.g0]}, [1, ratio], V=-70,
+                            returnCells=True, verbose=0)
+    assert np.allclose(res['t'], pcs[0].t - pcs[0].t[0])
+    for cell, pc in enumerate(pcs):
+        assert np.allclose(res['I'][cell], 2*pc.I, atol=1e-9)
+        assert np.isclose(res['I_peak'][cell], 2*pc.I_peak_)
+        assert np.isclose(res['I_ss'][cell], 2*pc.I_ss_)
+    assert np.allclose(res['I_mean'], res['I'].mean(axis=0))
+    assert np.allclose(res['I_std'], res['I'].std(axis=0))
+
+
+def test_population_gam():
+    rho = pyr.models['6']()
+    prot = pyr.protocols['step'](saveData=False)
+    prot.Vs, prot.phis = [-70], [1e17]
+    sim = pyr.simulators['Python'](prot, rho)
+    res = sim.runPopulation({'gam': [rho.gam, 0.5]}, V=-70, returnCells=True, verbose=0)
+    assert not np.isclose(res['I_peak'][0], res['I_peak'][1])
+    rho.gam = 0.5  # The second cell matches a model with its gam
+    sim.run(verbose=0)
+    assert np.allclose(res['I'][1], prot.PD.trials[0][0][0].I, atol=1e-9)
+
+
+def test_action_spectrum():
+    rho = pyr.models['6']()
+    rho.actionSpectrum = lambda lam: pyr.govardovskii(lam, 470)
+    prot = pyr.protocols['step'](saveData=False)
+    prot.Vs = [-70]
+    sim = pyr.simulators['Python'](prot, rho)
+    res = sim.runSpectrum([420, 470, 570], V=-70, verbose=0)
+    for lam, I in zip(res['lams'], res['I']):
+        prot.lam = lam
+        sim.run(verbose=0)
+        assert np.allclose(I, prot.PD.trials[0][0][0].I, atol=1e-9)
+    assert np.argmax(res['sensitivity']) == 1
+    assert rho.spectralGain == pyr.govardovskii(570, 470)
+
+
+def test_eigen_cache_reuse():
+    rho = pyr.models['6']()
+    prot = pyr.protocols['recovery'](saveData=False)
+    assert prot.nRuns > 1
+    pyr.simulators['Python'](prot, rho).run(verbose=0)
+    cache = rho._eigenCache
+    # One decomposition for the dark and each flux shared by every trial
+    assert cache.misses == 1 + prot.nPhis
+    assert cache.hits >= prot.nRuns * prot.nPhis * prot.nVs * 3
+    hits = cache.hits
+    rho.simulate([(100, 0), (100, prot.phis[0])], -70, 0.1)
+    assert cache.misses == 1 + prot.nPhis and cache.hits == hits + 2
+
+
+def test_stateless_trials():
+    from concurrent.futures import ThreadPoolExecutor
+    rho = pyr.models['6']()
+    prot = pyr.protocols['step'](saveData=False)
+    sim = pyr.simulators['Python'](prot, rho)
+    sim.run(verbose=0)
+    frozen = rho.freeze()
+    with ThreadPoolExecutor(4) as executor:
+        results = sim.runStateless(executor, verbose=0)
+    for phiInd in range(prot.nPhis):
+        for vInd in range(prot.nVs):
+            pc = prot.PD.trials[0][phiInd][vInd]
+            trial = results[0][phiInd][vInd]
+            assert np.allclose(trial.t, pc.t - pc.t[0])
+            assert np.allclose(trial.I, pc.I, atol=1e-9)
+    rho.g0 *= 2  # Snapshots are independent of the model
+    assert frozen.g0 == rho.g0 / 2
+
+
+def test_select_simulator():
+    import pytest
+    from pyrho.simulators import simAvailable
+    rho = pyr.models['6']()
+    assert pyr.selectSimulator(pyr.protocols['step'](saveData=False), rho) == 'Python'
+    prot = pyr.protocols['step'](saveData=False)
+    prot.Vs = [None]  # Requires a membrane
+    if simAvailable['NEURON'] or simAvailable['Brian']:
+        assert pyr.simulators[pyr.selectSimulator(prot, rho)].supports('membrane')
+    prot.T = 30
+    with pytest.raises(ValueError):
+        pyr.selectSimulator(prot, rho)
+
+
+def test_simulator_costs(monkeypatch):
+    from pyrho.simulators import simAvailable
+    rho = pyr.models['6']()
+    step = pyr.protocols['step'](saveData=False)
+    ramp = pyr.protocols['ramp'](saveData=False)
+    # Python is cheapest for square pulses and Brian for other waveforms
+    assert pyr.selectSimulator(step, rho) == 'Python'
+    assert pyr.selectSimulator(ramp, rho) == ('Brian' if simAvailable['Brian'] else 'Python')
+    # The ranking follows the declared costs and unknown costs come last
+    monkeypatch.setitem(simAvailable, 'Brian', True)
+    monkeypatch.setitem(simAvailable, 'NEURON', True)
+    monkeypatch.setattr(pyr.simulators['Brian'], 'costs', {'squarePulse': 0.5})
+    assert pyr.selectSimulator(step, rho) == 'Brian'
+    assert pyr.selectSimulator(ramp, rho) == 'Python'
+    monkeypatch.setattr(pyr.simulators['Python'], 'costs', {})
+    assert pyr.selectSimulator(step, rho) == 'Brian'
+    assert pyr.selectSimulator(ramp, rho) == 'Python'  # Ties go to the earlier entry
+
+
+def test_backend_agreement():
+    from pyrho.simulators import simAvailable
+    rho = pyr.models['6']()
+    for protocol in pyr.protocols:
+        prot = pyr.protocols[protocol](saveData=False)
+        pyr.simulators['Python'](prot, rho).run(verbose=0)
+        for simulator, simClass in pyr.simulators.items():
+            if not (simAvailable[simulator] and simClass.supports('batch')):
+                continue
+            prot_batch = pyr.protocols[protocol](saveData=False)
+            kwargs = {'netParams': None} if simulator == 'Brian' else {}
+            simClass(prot_batch, rho, **kwargs).runBatch(verbose=0)
+            for run in range(prot.nRuns):
+                for phiInd in range(prot.nPhis):
+                    for vInd in range(prot.nVs):
+                        pc = prot.PD.trials[run][phiInd][vInd]
+                        pc_batch = prot_batch.PD.trials[run][phiInd][vInd]
+                        assert np.allclose(pc_batch.t, pc.t), (protocol, simulator)
+                        assert np.allclose(pc_batch.I, pc.I, atol=0.02*np.abs(pc.I).max()), \
+                            (protocol, simulator)
+
+
+def test_neuron_session():
+    import pytest
+    pytest.importorskip('neuron')
+    rho = pyr.models['6']()
+    session = pyr.NEURONsession()
+    for protocol in ['step', 'rectifier', 'step']:
+        prot = pyr.protocols[protocol](saveData=False)
+        pyr.simulators['NEURON'](prot, rho, session=session).run(verbose=0)
+    prot_fresh = pyr.protocols['step'](saveData=False)
+    pyr.simulators['NEURON'](prot_fresh, rho).run(verbose=0)
+    pc, pc_fresh = prot.PD.trials[0][0][0], prot_fresh.PD.trials[0][0][0]
+    assert np.allclose(pc.I, pc_fresh.I)
+
+
+def test_neuron_batch():
+    import pytest
+    pytest.importorskip('neuron')
+    rho = pyr.models['6']()
+    prot = pyr.protocols['rectifier'](saveData=False)
+    pyr.simulators['NEURON'](prot, rho).run(verbose=0)
+    prot_batch = pyr.protocols['rectifier'](saveData=False)
+    sim = pyr.simulators['NEURON'](prot_batch, rho)
+    # Square pulses are played as exact edges with a discontinuity at each
+    tStim, phiStim, breaks = sim.getStimVectors(0, 0)
+    pulses, Dt_total = pyr.cycles2times(*prot_batch.getRunCycles(0))
+    assert tStim[0] == 0 and tStim[-1] == Dt_total
+    assert np.allclose(tStim[breaks], pulses.ravel())
+    assert np.array_equal(tStim[breaks], tStim[breaks + 1])
+    assert np.all(phiStim[breaks] != phiStim[breaks + 1])
+    sim.runBatch(nthread=2, verbose=0)
+    for vInd in range(prot.nVs):
+        pc, pc_batch = prot.PD.trials[0][0][vInd], prot_batch.PD.trials[0][0][vInd]
+        I_batch = np.interp(pc.t, pc_batch.t, pc_batch.I)
+        assert np.allclose(I_batch, pc.I, atol=0.02*np.abs(pc.I).max())
+
+
+def test_brian_batch():
+    import pytest
+    pytest.importorskip('brian2')
+    rho = pyr.models['4']()
+    prot = pyr.protocols['rectifier'](saveData=False)
+    pyr.simulators['Python'](prot, rho).run(verbose=0)
+    prot_batch = pyr.protocols['rectifier'](saveData=False)
+    pyr.simulators['Brian'](prot_batch, rho, netParams=None).runBatch(verbose=0)
+    for vInd in range(prot.nVs):
+        pc, pc_batch = prot.PD.trials[0][0][vInd], prot_batch.PD.trials[0][0][vInd]
+        assert np.allclose(pc_batch.t, pc.t)
+        assert np.allclose(pc_batch.I, pc.I, atol=0.01*np.abs(pc.I).max())
+
+
+def test_brian_standalone(tmp_path, monkeypatch):
+    import pytest
+    pytest.importorskip('brian2')
+    monkeypatch.setattr(pyr.config, 'cacheDir', str(tmp_path))
+    rho, rho_fast = pyr.models['3'](), pyr.models['3']()
+    rho_fast.Gd *= 2
+    PDs = []
+    for model, standalone in [(rho, False), (rho, True), (rho_fast, True)]:
+        prot = pyr.protocols['step'](saveData=False)
+        sim = pyr.simulators['Brian'](prot, model, netParams=None)
+        PDs.append(sim.runBatch(standalone=standalone, verbose=0))
+    I, I_standalone, I_fast = [PD.trials[0][0][0].I for PD in PDs]
+    assert np.allclose(I_standalone, I)
+    assert not np.allclose(I_fast, I)  # Parameters are passed at run time
+    assert len(list((tmp_path / 'brian').iterdir())) == 1
+
+
+def test_brian_pulse_train():
+    import pytest
+    br = pytest.importorskip('brian2.only')
+    from pyrho.parameters import modelUnits
+    rho = pyr.models['6']()
+    rho.actionSpectrum = lambda lam: pyr.govardovskii(lam, 470)
+    prot = pyr.protocols['step'](saveData=False)
+    prot.lam = 520
+    pyr.simulators['Python'](prot, rho).run(verbose=0)
+    pulseInd, ssInf = rho.pulseInd, rho.ssInf
+    for eqs in [rho.brian, rho.brian_phi_t]:  # Shared phi or TimedArray
+        G = br.NeuronGroup(1, eqs + 'v : volt\n', method='rk2', name='Inputs')
+        G.v = -70 * modelUnits['v']
+        monitors = {'states': br.StateMonitor(G, rho.brianStateVars, record=[0]),
+                    'V': br.StateMonitor(G, 'v', record=[0])}
+        net = br.Network(G, *monitors.values())
+        monitors['spikes'] = []
+        prot_brian = pyr.protocols['step'](saveData=False)
+        prot_brian.lam = 520
+        pyr.simulators['Brian'](prot_brian, rho, network=net, netParams={},
+                                monitors=monitors).run(verbose=0)
+        assert np.array_equal(rho.pulseInd, pulseInd)
+        assert np.allclose(rho.ssInf, ssInf)
+        for vInd in range(prot.nVs):
+            pc, pc_brian = prot.PD.trials[0][0][vInd], prot_brian.PD.trials[0][0][vInd]
+            assert np.allclose(pc_brian.t, pc.t)
+            assert np.allclose(pc_brian.I, pc.I, atol=0.01*np.abs(pc.I).max())
+
+
+def test_brian_recording(tmp_path):
+    import pytest
+    br = pytest.importorskip('brian2.only')
+    from pyrho.parameters import mV
+    rho = pyr.models['6']()
+    eqs = 'dv/dt = (-I*70*Mohm - 70*mV - v)/(10*ms) : volt' + rho.brian_phi_t
+    G = br.NeuronGroup(20, eqs, threshold='v > -50*mV', reset='v = -70*mV',
+                       method='rk2', name='Inputs')
+    G.v = -70 * mV
+    monitors = pyr.simulators['Brian'].createMonitors(rho, G, [G], record=[0, 5],
+                                                      record_dt=1., spikes=False)
+    net = br.Network(G, monitors.values())
+    prot = pyr.protocols['step'](saveData=False)
+    prot.Vs = [None]
+    sim = pyr.simulators['Brian'](prot, rho, network=net, netParams={'Mohm': br.Mohm},
+                                  monitors=monitors, recordPath=str(tmp_path))
+    sim.run(verbose=0)
+    assert np.allclose(np.diff(prot.PD.trials[0][0][0].t), 1)
+    assert len(list(tmp_path.iterdir())) == prot.nPhis
+    Vm, (layer,) = sim.getExtras(0, 1, 0)
+    assert Vm['v'].shape == (len(prot.PD.trials[0][1][0].t), 2)
+    assert 't' not in layer and layer['count'].sum() > 0
+    assert np.isclose(layer['rate'], np.mean(layer['popRate']))